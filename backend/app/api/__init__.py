@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 
-from app.api.endpoints import skus, settings, upload, markets, auth
+from app.api.endpoints import skus, settings, upload, markets, auth, history, duplicates, config, recalc
 from app.api.dependencies.auth import get_current_user
 
 api_router = APIRouter()
@@ -12,4 +12,8 @@ api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 api_router.include_router(skus.router, prefix="/skus", tags=["SKUs"], dependencies=[Depends(get_current_user)])
 api_router.include_router(settings.router, prefix="/settings", tags=["Settings"], dependencies=[Depends(get_current_user)])
 api_router.include_router(markets.router, prefix="/markets", tags=["Markets"], dependencies=[Depends(get_current_user)])
+api_router.include_router(config.router, prefix="/config", tags=["Config"], dependencies=[Depends(get_current_user)])
 api_router.include_router(upload.router, prefix="/upload", tags=["Upload"], dependencies=[Depends(get_current_user)])
+api_router.include_router(history.router, prefix="/history", tags=["History"], dependencies=[Depends(get_current_user)])
+api_router.include_router(recalc.router, prefix="/recalc", tags=["Recalculation"], dependencies=[Depends(get_current_user)])
+api_router.include_router(duplicates.router, prefix="/duplicates", tags=["Duplicates"], dependencies=[Depends(get_current_user)])
@@ -1,17 +1,41 @@
+import os
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.core.security import SECRET_KEY, ALGORITHM
-from app.api.dependencies.database import get_db
+from app.core.database import AsyncSessionLocal
 from app.models.users import User
 from app.schemas.users import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+# Short-lived per-process cache of authenticated users, so protected routes skip the users SELECT.
+# Entries are never dropped early - expiry is the only invalidation - so a change to a user (e.g.
+# deactivating them in the database) reaches protected routes within USER_CACHE_TTL_SECONDS.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = 10000
+
+_user_cache = {}  # username -> (expires_at, User)
+
+def _get_cached_user(username: str):
+    entry = _user_cache.get(username)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at < time.monotonic():
+        del _user_cache[username]
+        return None
+    return user
+
+def _cache_user(user: User):
+    if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+        _user_cache.clear()
+    _user_cache[user.username] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -25,9 +49,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-        
-    result = await db.execute(select(User).filter(User.username == token_data.username))
-    user = result.scalars().first()
+
+    user = _get_cached_user(token_data.username)
+    if user is not None:
+        return user
+
+    # Own short session only on a cache miss; expire_on_commit=False keeps the detached User readable
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).filter(User.username == token_data.username))
+        user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    _cache_user(user)
     return user
@@ -1,5 +1,21 @@
-from app.core.database import AsyncSessionLocal
+from fastapi import Request
 
-async def get_db():
+from app.core.database import AsyncSessionLocal, ReadSessionLocal
+
+# Methods that never write; their sessions come from the read engine
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+async def get_db(request: Request):
+    """Session routed by intent: read-only requests use the read engine, everything else the primary."""
+    session_factory = ReadSessionLocal if request.method in READ_METHODS else AsyncSessionLocal
+    async with session_factory() as session:
+        yield session
+
+async def get_write_db():
+    """Always the primary, e.g. for a GET that must see its own just-committed writes."""
     async with AsyncSessionLocal() as session:
         yield session
+
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        yield session
@@ -7,7 +7,7 @@ from datetime import timedelta
 from app.api.dependencies.database import get_db
 from app.models.users import User
 from app.schemas.users import UserCreate, UserResponse, Token
-from app.core.security import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.core.security import get_password_hash_async, verify_password_async, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 
 router = APIRouter()
 
@@ -29,7 +29,7 @@ async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password)
+        hashed_password=await get_password_hash_async(user.password)
     )
     db.add(db_user)
     await db.commit()
@@ -40,7 +40,7 @@ async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).filter(User.username == form_data.username))
     user = result.scalars().first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
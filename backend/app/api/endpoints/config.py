@@ -0,0 +1,132 @@
+import math
+from collections import Counter
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+from app.api.dependencies.database import get_db
+from app.api.endpoints.markets import MarketConfigUpdate, MarketChannelConfigUpdate, MarketCategoryConfigCreateUpdate
+from app.models.settings import GlobalSetting
+from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig
+from app.services.config_changes import delete_config_rows, existing_keys, sku_scope, upsert_config_rows
+from app.services.config_changes import formula_errors, setting_errors, write_formulas, write_settings
+from app.services.recalculator import config_changed
+
+router = APIRouter()
+
+# --- Schemas ---
+class MarketChange(MarketConfigUpdate):
+    market_name: str
+    # Removes the market with its channel rows and overrides; no other fields may be set
+    delete: bool = False
+
+class MarketChannelChange(MarketChannelConfigUpdate):
+    market_name: str
+    channel: str
+
+class CategoryOverrideChange(MarketCategoryConfigCreateUpdate):
+    market_name: str
+    channel: str
+    category: str
+    delete: bool = False
+
+class ConfigChangeset(BaseModel):
+    settings: Dict[str, float] = {}
+    # As PUT /settings/formulas: an empty or null expression restores the built-in one
+    formulas: Dict[str, Optional[str]] = {}
+    markets: List[MarketChange] = []
+    channels: List[MarketChannelChange] = []
+    category_overrides: List[CategoryOverrideChange] = []
+
+def _values(change: BaseModel, *keys: str) -> dict:
+    return change.dict(exclude_unset=True, exclude={*keys, "delete"})
+
+@router.post("/changeset")
+async def apply_config_changeset(payload: ConfigChangeset, db: AsyncSession = Depends(get_db)):
+    """
+    Applies edits across settings, formulas, markets, market-channel rows and category overrides
+    in one transaction, then rescores once: the whole portfolio if settings or formulas changed,
+    else only the SKUs of the edited markets, channels and categories. Markets and rows that do
+    not exist yet are created. Nothing is written unless every edit is valid.
+    """
+    if not any((payload.settings, payload.formulas, payload.markets, payload.channels, payload.category_overrides)):
+        raise HTTPException(status_code=400, detail="Empty changeset")
+
+    errors = {}
+    for key, value in payload.settings.items():
+        if not math.isfinite(value):
+            errors[f"settings.{key}"] = "Value must be a finite number"
+    errors.update({f"settings.{k}": e for k, e in setting_errors(payload.settings).items()})
+
+    if payload.formulas:
+        result = await db.execute(select(GlobalSetting.setting_key))
+        setting_keys = set(result.scalars().all()) | set(payload.settings)
+        errors.update({f"formulas.{k}": e for k, e in formula_errors(payload.formulas, setting_keys).items()})
+
+    market_names = [m.market_name for m in payload.markets]
+    channel_keys = [(c.market_name, c.channel) for c in payload.channels]
+    override_keys = [(c.market_name, c.channel, c.category) for c in payload.category_overrides]
+    listed = Counter(market_names) + Counter(channel_keys) + Counter(override_keys)
+    current_markets = {k for k, in await existing_keys(db, MarketConfig, [(m,) for m in market_names])}
+    deleted_markets = set()
+    for i, change in enumerate(payload.markets):
+        if listed[change.market_name] > 1:
+            errors[f"markets[{i}]"] = "Market listed more than once"
+        elif change.delete:
+            if _values(change, "market_name"):
+                errors[f"markets[{i}]"] = "A deleted market cannot also be updated"
+            elif change.market_name not in current_markets:
+                errors[f"markets[{i}]"] = "Market not found"
+            deleted_markets.add(change.market_name)
+
+    # Channel rows and overrides need their market to exist once the changeset is applied
+    referenced = {c.market_name for c in payload.channels} | {c.market_name for c in payload.category_overrides}
+    markets_after = ({k for k, in await existing_keys(db, MarketConfig, [(m,) for m in referenced])}
+                     | set(market_names)) - deleted_markets
+
+    for i, change in enumerate(payload.channels):
+        if change.market_name not in markets_after:
+            errors[f"channels[{i}]"] = "Market not found"
+        elif listed[channel_keys[i]] > 1:
+            errors[f"channels[{i}]"] = "Channel listed more than once"
+
+    current_overrides = await existing_keys(
+        db, MarketCategoryConfig, [k for k, c in zip(override_keys, payload.category_overrides) if c.delete]
+    )
+    for i, change in enumerate(payload.category_overrides):
+        if change.market_name not in markets_after:
+            errors[f"category_overrides[{i}]"] = "Market not found"
+        elif listed[override_keys[i]] > 1:
+            errors[f"category_overrides[{i}]"] = "Override listed more than once"
+        elif change.delete and _values(change, "market_name", "channel", "category"):
+            errors[f"category_overrides[{i}]"] = "A deleted override cannot also be updated"
+        elif change.delete and override_keys[i] not in current_overrides:
+            errors[f"category_overrides[{i}]"] = "Override not found"
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    await write_settings(db, payload.settings)
+    if payload.formulas:
+        await write_formulas(db, payload.formulas)
+    await delete_config_rows(db, MarketConfig, [(m,) for m in deleted_markets])
+    await upsert_config_rows(db, MarketConfig, [
+        {"market_name": c.market_name, **_values(c, "market_name")} for c in payload.markets if not c.delete
+    ])
+    await upsert_config_rows(db, MarketChannelConfig, [
+        {"market_id": c.market_name, "channel": c.channel, **_values(c, "market_name", "channel")} for c in payload.channels
+    ])
+    await delete_config_rows(db, MarketCategoryConfig, [k for k, c in zip(override_keys, payload.category_overrides) if c.delete])
+    await upsert_config_rows(db, MarketCategoryConfig, [
+        {"market_id": c.market_name, "channel": c.channel, "category": c.category,
+         **_values(c, "market_name", "channel", "category")}
+        for c in payload.category_overrides if not c.delete
+    ])
+
+    if payload.settings or payload.formulas:
+        await config_changed(db)
+        return {"message": "Success", "affected_skus": "all"}
+    scope = sku_scope(market_names, channel_keys, override_keys)
+    return {"message": "Success", "affected_skus": await config_changed(db, scope)}
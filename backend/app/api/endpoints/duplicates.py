@@ -0,0 +1,34 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.dependencies.database import get_write_db
+from app.services.duplicates import find_duplicate_clusters, find_sku_duplicates, DEFAULT_THRESHOLD
+
+router = APIRouter()
+
+def _check_threshold(threshold: float):
+    if not 0.0 < threshold <= 1.0:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+
+# Both routes bring the duplicate index up to date first, so they use the primary
+
+@router.get("/clusters")
+async def read_duplicate_clusters(threshold: float = DEFAULT_THRESHOLD, market: Optional[str] = None,
+                                  category: Optional[str] = None, skip: int = 0, limit: int = 100,
+                                  db: AsyncSession = Depends(get_write_db)):
+    """Clusters of near-duplicate SKUs (name/brand/category similarity >= threshold), largest first."""
+    _check_threshold(threshold)
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    return await find_duplicate_clusters(db, threshold, market, category, skip, limit)
+
+@router.get("/skus/{sku_id}")
+async def read_sku_duplicates(sku_id: str, threshold: float = DEFAULT_THRESHOLD, db: AsyncSession = Depends(get_write_db)):
+    """Near-duplicates of one SKU, most similar first."""
+    _check_threshold(threshold)
+    duplicates = await find_sku_duplicates(db, sku_id, threshold)
+    if duplicates is None:
+        raise HTTPException(status_code=404, detail="SKU not found")
+    return {"sku_id": sku_id, "duplicates": duplicates}
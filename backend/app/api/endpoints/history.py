@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.dependencies.database import get_db
+from app.services.history import version_diff, sku_trajectory
+
+router = APIRouter()
+
+@router.get("/versions")
+async def read_config_versions(db: AsyncSession = Depends(get_db)):
+    """Config versions the portfolio has been scored under, newest first."""
+    result = await db.execute(text("SELECT version, fingerprint, created_at FROM config_versions ORDER BY version DESC"))
+    return [dict(r) for r in result.mappings().all()]
+
+@router.get("/diff")
+async def read_version_diff(from_version: int, to_version: int, recommendation_changed: bool = False,
+                            skip: int = 0, limit: int = 1000, db: AsyncSession = Depends(get_db)):
+    """SKUs whose recommendation/score/GM$ as of `from_version` differs from that as of `to_version`."""
+    if limit < 1 or limit > 10000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 10000")
+    return await version_diff(db, from_version, to_version, recommendation_changed, skip, limit)
+
+@router.get("/skus/{sku_id}")
+async def read_sku_history(sku_id: str, db: AsyncSession = Depends(get_db)):
+    """One SKU's recorded recommendation/score/GM$ trajectory, oldest first."""
+    return {"sku_id": sku_id, "history": await sku_trajectory(db, sku_id)}
@@ -5,8 +5,11 @@ from pydantic import BaseModel
 from typing import List, Optional
 
 from app.api.dependencies.database import get_db
-from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig
-from app.services.recalculator import recalculate_all_skus
+from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig, ChannelRampCurve
+from app.core.calculator import DEFAULT_RAMP_CURVE
+from app.services.recalculator import config_changed
+from app.services.config_changes import sku_scope
+from app.services.projections import rebuild_projections
 
 router = APIRouter()
 
@@ -39,6 +42,13 @@ class MarketCategoryConfigCreateUpdate(BaseModel):
     marketing_lift_override: Optional[float] = None
     competitor_idx_override: Optional[float] = None
 
+class RampCurveUpdate(BaseModel):
+    # Share of steady-state demand per ramp month, starting at launch; the last value holds
+    curve: List[float]
+
+class RampCurveResponse(RampCurveUpdate):
+    channel: str
+
 class MarketConfigResponse(MarketConfigUpdate):
     market_name: str
     class Config:
@@ -57,6 +67,37 @@ class MarketCategoryConfigResponse(MarketCategoryConfigCreateUpdate):
     class Config:
         from_attributes = True
 
+# --- Ramp Curve Endpoints ---
+# Ramp curves only shape the projections, so changing one rebuilds those without rescoring
+@router.get("/ramp-curves", response_model=List[RampCurveResponse])
+async def get_ramp_curves(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(ChannelRampCurve))
+    curves = [RampCurveResponse(channel=c.channel, curve=[float(v) for v in c.curve.split(",")]) for c in result.scalars().all()]
+    return [RampCurveResponse(channel="*", curve=DEFAULT_RAMP_CURVE)] + curves
+
+@router.put("/ramp-curves/{channel_name}")
+async def update_ramp_curve(channel_name: str, payload: RampCurveUpdate, db: AsyncSession = Depends(get_db)):
+    if not payload.curve or len(payload.curve) > 60 or any(v < 0 for v in payload.curve):
+        raise HTTPException(status_code=400, detail="Curve needs 1-60 non-negative values")
+    db_obj = await db.get(ChannelRampCurve, channel_name)
+    if not db_obj:
+        db_obj = ChannelRampCurve(channel=channel_name)
+        db.add(db_obj)
+    db_obj.curve = ",".join(repr(float(v)) for v in payload.curve)
+    await db.commit()
+    await rebuild_projections(db)
+    return {"message": "Success"}
+
+@router.delete("/ramp-curves/{channel_name}")
+async def delete_ramp_curve(channel_name: str, db: AsyncSession = Depends(get_db)):
+    db_obj = await db.get(ChannelRampCurve, channel_name)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Not found")
+    await db.delete(db_obj)
+    await db.commit()
+    await rebuild_projections(db)
+    return {"message": "Deleted successfully"}
+
 # --- Market Level Endpoints ---
 @router.get("/", response_model=List[MarketConfigResponse])
 async def get_markets(db: AsyncSession = Depends(get_db)):
@@ -86,8 +127,7 @@ async def update_market(market_name: str, payload: MarketConfigUpdate, db: Async
     for var, value in payload.dict(exclude_unset=True).items():
         setattr(db_obj, var, value)
             
-    await db.commit()
-    await recalculate_all_skus(db)
+    await config_changed(db, sku_scope(markets=[market_name]))
     return {"message": "Success"}
 
 @router.delete("/{market_name}")
@@ -98,8 +138,7 @@ async def delete_market(market_name: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Market not found")
     
     await db.delete(db_obj)
-    await db.commit()
-    await recalculate_all_skus(db)
+    await config_changed(db, sku_scope(markets=[market_name]))
     return {"message": "Deleted successfully"}
 
 # --- Market-Channel Level Endpoints ---
@@ -121,8 +160,7 @@ async def update_market_channel(market_name: str, channel_name: str, payload: Ma
     for var, value in payload.dict(exclude_unset=True).items():
         setattr(db_obj, var, value)
             
-    await db.commit()
-    await recalculate_all_skus(db)
+    await config_changed(db, sku_scope(channels=[(market_name, channel_name)]))
     return {"message": "Success"}
 
 # --- Market-Channel-Category Override Endpoints ---
@@ -143,8 +181,7 @@ async def upsert_market_category_override(market_name: str, channel_name: str, c
     for var, value in payload.dict(exclude_unset=True).items():
         setattr(db_obj, var, value)
             
-    await db.commit()
-    await recalculate_all_skus(db)
+    await config_changed(db, sku_scope(categories=[(market_name, channel_name, category_name)]))
     return {"message": "Success"}
 
 @router.delete("/{market_name}/channels/{channel_name}/categories/{category_name}")
@@ -155,6 +192,5 @@ async def delete_market_category_override(market_name: str, channel_name: str, c
         raise HTTPException(status_code=404, detail="Override not found")
         
     await db.delete(db_obj)
-    await db.commit()
-    await recalculate_all_skus(db)
+    await config_changed(db, sku_scope(categories=[(market_name, channel_name, category_name)]))
     return {"message": "Success"}
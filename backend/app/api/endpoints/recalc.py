@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.dependencies.database import get_db
+from app.services.recalc_queue import enqueue_job, job_progress, recent_jobs
+
+router = APIRouter()
+
+@router.get("/jobs")
+async def read_recalc_jobs(limit: int = 20, db: AsyncSession = Depends(get_db)):
+    """Progress of the latest queued recalculations, newest first."""
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    return await recent_jobs(db, limit)
+
+@router.get("/jobs/{job_id}")
+async def read_recalc_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Task counts by status, SKUs scored, active workers and throughput of one queued recalculation."""
+    progress = await job_progress(db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return progress
+
+@router.post("/jobs", status_code=202)
+async def create_recalc_job(db: AsyncSession = Depends(get_db)):
+    """Queues a recalculation of every SKU for the recalculation workers, without waiting for it."""
+    if db.bind.dialect.name != "postgresql":
+        raise HTTPException(status_code=400, detail="The recalculation queue needs Postgres")
+    return await job_progress(db, await enqueue_job(db))
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from app.api.dependencies.database import get_db
-from app.models.settings import GlobalSetting
-from app.services.recalculator import recalculate_all_skus
+from app.models.settings import GlobalSetting, ScoringFormula
+from app.schemas.settings import ScoringFormulaResponse
+from app.core.calculator import DEFAULT_FORMULAS, formula_inputs
+from app.services.config_changes import formula_errors, setting_errors, write_formulas, write_settings
+from app.services.recalculator import config_changed
 
 router = APIRouter()
 
@@ -17,17 +20,39 @@ async def get_settings(db: AsyncSession = Depends(get_db)):
 
 @router.put("/")
 async def update_settings(payload: Dict[str, float], db: AsyncSession = Depends(get_db)):
-    # Bulk update
-    for key, value in payload.items():
-        result = await db.execute(select(GlobalSetting).filter(GlobalSetting.setting_key == key))
-        db_setting = result.scalars().first()
-        
-        if not db_setting:
-            db_setting = GlobalSetting(setting_key=key, setting_value=value)
-            db.add(db_setting)
-        else:
-            db_setting.setting_value = value
-            
-    await db.commit()
-    await recalculate_all_skus(db)
+    errors = setting_errors(payload)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    await write_settings(db, payload)
+    await config_changed(db)
+    return {"message": "Success"}
+
+@router.get("/formulas", response_model=List[ScoringFormulaResponse])
+async def get_formulas(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(ScoringFormula))
+    custom = {f.formula_key: f.expression for f in result.scalars().all()}
+    return [
+        ScoringFormulaResponse(
+            formula_key=key,
+            expression=custom.get(key, default),
+            default_expression=default,
+            is_default=key not in custom,
+            variables=formula_inputs(key),
+        )
+        for key, default in DEFAULT_FORMULAS.items()
+    ]
+
+@router.put("/formulas")
+async def update_formulas(payload: Dict[str, Optional[str]], db: AsyncSession = Depends(get_db)):
+    """Sets formulas by key; an empty or null expression restores the built-in one. Any global setting can be referenced."""
+    result = await db.execute(select(GlobalSetting.setting_key))
+    setting_keys = set(result.scalars().all())
+
+    errors = formula_errors(payload, setting_keys)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    await write_formulas(db, payload)
+    await config_changed(db)
     return {"message": "Success"}
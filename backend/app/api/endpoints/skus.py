@@ -1,32 +1,211 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Body, Response
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, update, bindparam
 from sqlalchemy.future import select
-from typing import List
-import pandas as pd
+from typing import List, Optional
 import io
 
-from app.api.dependencies.database import get_db
+from app.api.dependencies.database import get_db, get_read_db, get_write_db
 from app.models.skus import SkuRecord, SkuCalculationCache
-from app.models.settings import GlobalSetting
-from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig
-from app.schemas.skus import SkuRecordResponse, SkuRecordCreate, SkuRecordUpdate
-from app.core.calculator import CalculationEngine
+from app.schemas.skus import SkuRecordResponse, SkuRecordCreate, SkuRecordUpdate, PlacementRequest, SkuBulkPatchRequest, GoalSeekRequest
+from app.services.recalculator import build_calc_engine, load_sku_rows, recalculate_skus, recalculate_stale
+from app.services.freshness import CONSISTENCY_MODE, SWEEP_BATCH_SIZE, freshness_headers, freshness_report, stale_sweeper
+from app.services.change_feed import change_feed
+from app.services.rollups import RollupDelta, ROLLUP_CACHE_FIELDS, KEY_FIELDS as ROLLUP_KEY_FIELDS, SUM_FIELDS as ROLLUP_SUM_FIELDS, COUNT_FIELDS as ROLLUP_COUNT_FIELDS
+from app.models.rollups import PortfolioRollup
+from app.models.projections import SkuProjection
+from app.models.duplicates import SkuMinhash
+from app.services.projections import portfolio_curves, GROUP_COLUMNS as PROJECTION_GROUPS
+from app.services.placements import evaluate_placements, PLACEMENT_FIELDS
+from app.services.synergy import refresh_synergy
+from app.services.explain import explain_record, explain_skus
+from app.services.goal_seek import goal_seek
+from app.services.thresholds import CustomLaunchFormula, threshold_index
+from app.services.portfolio_store import StoreUnavailable, portfolio_store
+from app.services.portfolio_store import GROUP_COLUMNS as STORE_GROUP_COLUMNS, SORT_COLUMNS as STORE_SORT_COLUMNS
+from app.core.calculator import GOAL_SEEK_GOALS, GOAL_SEEK_VARIABLES
 
 router = APIRouter()
 
+# Upper bound on SKUs touched by one PATCH /bulk (also keeps IN lists under driver parameter limits)
+MAX_BULK_PATCH_SKUS = 10000
+
 from sqlalchemy.orm import selectinload
 
 @router.get("/", response_model=List[SkuRecordResponse])
-async def read_skus(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+async def read_skus(response: Response, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_write_db)):
+    if CONSISTENCY_MODE == "lazy":
+        # Rescore the page's stale rows (or wait for whoever is rescoring them) before reading it
+        sku_ids = (await db.execute(select(SkuRecord.sku_id).offset(skip).limit(limit))).scalars().all()
+        await recalculate_stale(db, SkuRecord.sku_id.in_(sku_ids))
+        result = await db.execute(
+            select(SkuRecord).options(selectinload(SkuRecord.cache)).filter(SkuRecord.sku_id.in_(sku_ids))
+        )
+        by_id = {s.sku_id: s for s in result.scalars().all()}
+        skus = [by_id[sku_id] for sku_id in sku_ids if sku_id in by_id]
+    else:
+        result = await db.execute(
+            select(SkuRecord).options(selectinload(SkuRecord.cache)).offset(skip).limit(limit)
+        )
+        skus = result.scalars().all()
+    response.headers.update(freshness_headers(await freshness_report(db)))
+    return skus
+
+@router.get("/freshness")
+async def read_freshness(db: AsyncSession = Depends(get_db)):
+    """Consistency mode, current config generation and how many SKUs are still scored under an older one."""
+    return {**await freshness_report(db), "sweeper_running": stale_sweeper.running}
+
+@router.get("/summary")
+async def read_portfolio_summary(response: Response, group_by: str = "market,channel", db: AsyncSession = Depends(get_write_db)):
+    """
+    Portfolio aggregates from the rollup table, grouped by any of market, channel, category, recommendation.
+    In lazy mode SKUs still stale after one rescore batch are counted under their old scores (see X-Stale-Skus).
+    """
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    invalid = [d for d in dims if d not in ROLLUP_KEY_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {', '.join(invalid)}")
+    if CONSISTENCY_MODE == "lazy":
+        # Catch up one batch of stale rows; the sweeper takes the rest and X-Stale-Skus reports them
+        await recalculate_stale(db, max_batches=1, batch_size=SWEEP_BATCH_SIZE, skip_locked=True)
+    report = await freshness_report(db)
+    if report["stale_skus"]:
+        stale_sweeper.wake()
+    response.headers.update(freshness_headers(report))
+
+    group_cols = [getattr(PortfolioRollup, d) for d in dims]
     result = await db.execute(
-        select(SkuRecord).options(selectinload(SkuRecord.cache)).offset(skip).limit(limit)
+        select(
+            *group_cols,
+            func.sum(PortfolioRollup.sku_count).label("sku_count"),
+            *[func.sum(getattr(PortfolioRollup, f)).label(f) for f in list(ROLLUP_COUNT_FIELDS) + list(ROLLUP_SUM_FIELDS)],
+        ).group_by(*group_cols)
     )
-    skus = result.scalars().all()
-    return skus
+    groups = []
+    for row in result.mappings().all():
+        group = dict(row)
+        gm_pct_count = group.pop("gm_pct_count")
+        group["avg_gm_pct"] = group.pop("gm_pct_sum") / gm_pct_count if gm_pct_count else None
+        groups.append(group)
+    return groups
+
+async def _synced_store(db: AsyncSession):
+    try:
+        await portfolio_store.sync(db)
+    except StoreUnavailable:
+        raise HTTPException(status_code=503, detail="The portfolio store is not enabled on this worker")
+    return portfolio_store
+
+# The store's reads use the primary (get_write_db): SKUs it first sees in the change feed must be loadable at once
+
+@router.get("/table")
+async def read_sku_table(market: Optional[str] = None, channel: Optional[str] = None, category: Optional[str] = None,
+                         brand: Optional[str] = None, recommendation: Optional[str] = None,
+                         sort_by: str = "sku_id", descending: bool = False, skip: int = 0, limit: int = 100,
+                         db: AsyncSession = Depends(get_write_db)):
+    """
+    A page of SKUs with their key inputs and results, filtered and sorted in this worker's
+    in-memory portfolio store rather than in the database, with the total number of matches.
+    """
+    if sort_by not in STORE_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(STORE_SORT_COLUMNS)}")
+    if skip < 0 or limit < 1 or limit > 10000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 10000, skip at least 0")
+    store = await _synced_store(db)
+    filters = {"market": market, "channel": channel, "category": category, "brand": brand, "recommendation": recommendation}
+    return JSONResponse(store.query(filters, sort_by, descending, skip, limit))
+
+@router.get("/aggregate")
+async def read_sku_aggregates(group_by: str = "market,channel", market: Optional[str] = None, channel: Optional[str] = None,
+                              category: Optional[str] = None, brand: Optional[str] = None,
+                              recommendation: Optional[str] = None, db: AsyncSession = Depends(get_write_db)):
+    """
+    /summary's aggregates from the in-memory portfolio store, which can also group by brand
+    and filter before grouping. The sums are taken over the store's float32 values, so they
+    can differ slightly from /summary's.
+    """
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    invalid = [d for d in dims if d not in STORE_GROUP_COLUMNS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {', '.join(invalid)}")
+    store = await _synced_store(db)
+    filters = {"market": market, "channel": channel, "category": category, "brand": brand, "recommendation": recommendation}
+    return JSONResponse(store.aggregate(dims, filters))
+
+@router.get("/store")
+async def read_store_stats():
+    """Size and state of this worker's in-memory portfolio store."""
+    return portfolio_store.stats()
+
+@router.get("/launch-thresholds")
+async def read_launch_threshold_counts(launch_now_min_score: Optional[float] = None, launch_now_max_risk: Optional[float] = None,
+                                       gm_floor_pct: Optional[float] = None, db: AsyncSession = Depends(get_read_db)):
+    """
+    How many SKUs would be Launch Now at these thresholds (unset ones at their current settings),
+    overall and per market/channel, without rescoring. Cheap enough to call on every slider move.
+    """
+    thresholds = {"launch_now_min_score": launch_now_min_score, "launch_now_max_risk": launch_now_max_risk, "gm_floor_pct": gm_floor_pct}
+    try:
+        return await threshold_index.counts(db, thresholds)
+    except CustomLaunchFormula:
+        raise HTTPException(status_code=409, detail="Launch Now uses a custom formula; save and rescore to see its effect")
+
+@router.get("/projections")
+async def read_portfolio_projections(horizon: int = 12, group_by: str = "", market: Optional[str] = None,
+                                     channel: Optional[str] = None, category: Optional[str] = None,
+                                     db: AsyncSession = Depends(get_db)):
+    """Monthly units/revenue/GM$ curves per scenario for the next `horizon` months (up to 24), summed in the database."""
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    invalid = [d for d in dims if d not in PROJECTION_GROUPS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {', '.join(invalid)}")
+    return await portfolio_curves(db, horizon, dims, {"market": market, "channel": channel, "category": category})
+
+@router.get("/changes")
+async def stream_sku_changes():
+    """Server-Sent Events feed of cache deltas, so clients can patch rows instead of re-fetching the list."""
+    return StreamingResponse(
+        change_feed.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/placements")
+async def read_placement_matrix(request: PlacementRequest, db: AsyncSession = Depends(get_read_db)):
+    """
+    Scores the selected SKUs (all when sku_ids is empty) in every configured market/channel and
+    ranks the placements per SKU. Read-only, so it runs on the read engine despite being a POST.
+    """
+    if request.top_k is not None and request.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be at least 1")
+    invalid = [f for f in request.fields if f not in PLACEMENT_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(invalid)}")
+    result = await evaluate_placements(db, request.sku_ids, request.markets, request.channels, request.top_k, request.fields)
+    # Already plain lists of JSON types; skips the per-cell encoder pass over a potentially huge matrix
+    return JSONResponse(result)
+
+@router.post("/goal-seek")
+async def read_goal_seek(request: GoalSeekRequest, db: AsyncSession = Depends(get_read_db)):
+    """
+    For the selected SKUs (all when sku_ids is empty), the value of one input at which a goal
+    starts holding (direction "min") or stops holding ("max"), all else unchanged. Read-only.
+    """
+    if request.variable not in GOAL_SEEK_VARIABLES:
+        raise HTTPException(status_code=400, detail=f"variable must be one of: {', '.join(GOAL_SEEK_VARIABLES)}")
+    if request.goal not in GOAL_SEEK_GOALS:
+        raise HTTPException(status_code=400, detail=f"goal must be one of: {', '.join(GOAL_SEEK_GOALS)}")
+    return JSONResponse(await goal_seek(db, request.variable, request.goal, request.sku_ids))
 
 @router.post("/export")
 async def export_skus(sku_ids: List[str] = Body(...), db: AsyncSession = Depends(get_db)):
+    # Imported here so only workers that export pay for pandas/openpyxl
+    import pandas as pd
+
+    if CONSISTENCY_MODE == "lazy":
+        await recalculate_stale(db, SkuRecord.sku_id.in_(sku_ids))
     result = await db.execute(
         select(SkuRecord).options(selectinload(SkuRecord.cache)).filter(SkuRecord.sku_id.in_(sku_ids))
     )
@@ -54,6 +233,11 @@ async def export_skus(sku_ids: List[str] = Body(...), db: AsyncSession = Depends
             row["Monthly Revenue"] = sku.cache.monthly_revenue
             row["Gross Margin (%)"] = sku.cache.gm_pct
             row["Gross Margin ($)"] = sku.cache.monthly_gm_dollar
+            row["Initial Stock Investment"] = sku.cache.initial_stock_investment
+            row["MOQ Coverage (Worst, Months)"] = sku.cache.moq_coverage_worst
+            row["Expiry Risk (% Shelf Life)"] = sku.cache.expiry_risk
+            row["Pass MOQ Coverage"] = sku.cache.pass_moq_coverage
+            row["Pass Expiry"] = sku.cache.pass_expiry
         data.append(row)
         
     df = pd.DataFrame(data)
@@ -65,7 +249,8 @@ async def export_skus(sku_ids: List[str] = Body(...), db: AsyncSession = Depends
     output.seek(0)
     
     headers = {
-        'Content-Disposition': 'attachment; filename="sku_export.xlsx"'
+        'Content-Disposition': 'attachment; filename="sku_export.xlsx"',
+        **freshness_headers(await freshness_report(db)),
     }
     return StreamingResponse(
         output, 
@@ -73,71 +258,173 @@ async def export_skus(sku_ids: List[str] = Body(...), db: AsyncSession = Depends
         media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
 
+async def _read_sku(db: AsyncSession, sku_id: str) -> SkuRecord:
+    """The SKU with its cache as now stored, replacing any stale copy in the session."""
+    result = await db.execute(
+        select(SkuRecord).options(selectinload(SkuRecord.cache)).filter(SkuRecord.sku_id == sku_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 @router.post("/", response_model=SkuRecordResponse)
 async def create_sku(sku: SkuRecordCreate, db: AsyncSession = Depends(get_db)):
     db_sku = SkuRecord(**sku.dict())
     db.add(db_sku)
-    
-    # Needs to calculate immediately
-    engine = await _build_calc_engine(db)
-    cache = engine.calculate_sku(db_sku)
-    db.add(cache)
-    
-    await db.commit()
-    await db.refresh(db_sku)
-    return db_sku
+    await db.flush()
+
+    # Scored like any other edit, so with computed synergy on its group's neighbours are rescored too
+    await recalculate_skus(db, SkuRecord.sku_id == db_sku.sku_id, [])
+    return await _read_sku(db, db_sku.sku_id)
+
+@router.patch("/bulk")
+async def patch_skus(request: SkuBulkPatchRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Edits many SKUs in one transaction: per-SKU partial `updates`, or `assign` applied to every
+    SKU matching `filter`. Writes are set-based UPDATEs, the touched SKUs are rescored in one
+    batch, and everything commits once.
+    """
+    if bool(request.updates) == bool(request.filter):
+        raise HTTPException(status_code=400, detail="Send either updates, or filter with assign")
+    table = SkuRecord.__table__
+
+    if request.updates:
+        # Later entries for the same SKU win
+        patches = {}
+        for patch in request.updates:
+            patches.setdefault(patch.sku_id, {}).update(patch.dict(exclude_unset=True, exclude={"sku_id"}))
+        found = await db.execute(select(SkuRecord.sku_id).where(SkuRecord.sku_id.in_(list(patches))))
+        sku_ids = found.scalars().all()
+        known = set(sku_ids)
+        missing = [sku_id for sku_id in patches if sku_id not in known]
+    else:
+        assignment = request.assign.dict(exclude_unset=True) if request.assign else {}
+        if not assignment:
+            raise HTTPException(status_code=400, detail="assign must set at least one field")
+        criteria = request.filter.dict(exclude_none=True)
+        if not any(criteria.values()):
+            raise HTTPException(status_code=400, detail="filter must set at least one criterion")
+        query = select(SkuRecord.sku_id)
+        if request.filter.sku_ids:
+            query = query.where(SkuRecord.sku_id.in_(request.filter.sku_ids))
+        for key, column in (("market", SkuRecord.target_market), ("channel", SkuRecord.primary_channel),
+                            ("category", SkuRecord.category), ("brand", SkuRecord.brand)):
+            if criteria.get(key) is not None:
+                query = query.where(column == criteria[key])
+        if request.filter.recommendation is not None:
+            query = query.join(SkuCalculationCache, SkuCalculationCache.sku_id == SkuRecord.sku_id).where(
+                SkuCalculationCache.final_recommendation == request.filter.recommendation)
+        sku_ids = (await db.execute(query)).scalars().all()
+        missing = []
+
+    if len(sku_ids) > MAX_BULK_PATCH_SKUS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_PATCH_SKUS} SKUs can be patched at once")
+    where = SkuRecord.sku_id.in_(sku_ids)
+    before = await load_sku_rows(db, where, for_update=True)
+
+    if request.updates:
+        # One executemany UPDATE per distinct set of edited fields
+        by_fields = {}
+        for sku_id in sku_ids:
+            if patches[sku_id]:
+                by_fields.setdefault(tuple(sorted(patches[sku_id])), []).append(sku_id)
+        for fields, ids in by_fields.items():
+            stmt = update(table).where(table.c.sku_id == bindparam("b_sku_id")).values(
+                {f: bindparam(f"b_{f}") for f in fields})
+            await db.execute(stmt, [{"b_sku_id": i, **{f"b_{f}": patches[i][f] for f in fields}} for i in ids])
+        edited = {sku_id: sorted(patches[sku_id]) for sku_id in sku_ids}
+    else:
+        if sku_ids:
+            await db.execute(update(table).where(where).values(assignment))
+        edited = dict.fromkeys(sku_ids, sorted(assignment))
+
+    scored = await recalculate_skus(db, where, before)
+    results = [{
+        "sku_id": sku_id,
+        "status": "updated",
+        "fields": edited[sku_id],
+        "old_recommendation": old_cache["final_recommendation"] if old_cache else None,
+        "new_recommendation": new_values["final_recommendation"],
+    } for sku_id, old_cache, new_values in scored]
+    results += [{"sku_id": sku_id, "status": "not_found"} for sku_id in missing]
+    return {"updated_count": len(scored), "results": results}
 
 @router.put("/{sku_id}", response_model=SkuRecordResponse)
 async def update_sku(sku_id: str, sku_update: SkuRecordUpdate, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(SkuRecord).options(selectinload(SkuRecord.cache)).filter(SkuRecord.sku_id == sku_id))
-    db_sku = result.scalars().first()
-    
-    if not db_sku:
+    where = SkuRecord.sku_id == sku_id
+    # The SKU's current row and cache, locked and taken before its market/channel/category can change
+    before = await load_sku_rows(db, where, for_update=True)
+    if not before:
         raise HTTPException(status_code=404, detail="SKU not found")
-        
+
     update_data = sku_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_sku, key, value)
-        
-    # Re-calculate!
-    engine = await _build_calc_engine(db)
-    
-    # Calculate new cache values
-    new_cache = engine.calculate_sku(db_sku)
-    
-    # Safely update the existing cache object
-    if db_sku.cache:
-        for k, v in new_cache.__dict__.items():
-            if not k.startswith('_'):
-                setattr(db_sku.cache, k, v)
-    else:
-        db_sku.cache = new_cache
-    
-    await db.commit()
-    await db.refresh(db_sku)
-    return db_sku
+    if update_data:
+        await db.execute(update(SkuRecord.__table__).where(where).values(update_data))
+    await recalculate_skus(db, where, before)
+    return await _read_sku(db, sku_id)
 
 @router.post("/delete-bulk")
 async def delete_skus(sku_ids: List[str] = Body(...), db: AsyncSession = Depends(get_db)):
-    # First delete caches referring to these SKUs
+    # Subtract the deleted SKUs from the rollups before their cache rows go, reading the cache only
+    # once their rows are locked so a concurrent rescoring cannot change it in between
+    await db.execute(select(SkuRecord.sku_id).filter(SkuRecord.sku_id.in_(sku_ids))
+                     .order_by(SkuRecord.sku_id).with_for_update())
+    cached = await db.execute(
+        select(SkuRecord.target_market, SkuRecord.primary_channel, SkuRecord.category,
+               *[getattr(SkuCalculationCache, f) for f in ROLLUP_CACHE_FIELDS])
+        .join(SkuCalculationCache, SkuCalculationCache.sku_id == SkuRecord.sku_id)
+        .filter(SkuRecord.sku_id.in_(sku_ids))
+    )
+    rollup_delta = RollupDelta()
+    for row in cached.all():
+        rollup_delta.remove(row, row)
+    await rollup_delta.apply(db)
+    groups = (await db.execute(
+        select(SkuRecord.target_market, SkuRecord.category).filter(SkuRecord.sku_id.in_(sku_ids)).distinct()
+    )).all()
+
+    # First delete caches and projections referring to these SKUs
+    await db.execute(SkuProjection.__table__.delete().where(SkuProjection.sku_id.in_(sku_ids)))
+    await db.execute(SkuMinhash.__table__.delete().where(SkuMinhash.sku_id.in_(sku_ids)))
     await db.execute(SkuCalculationCache.__table__.delete().where(SkuCalculationCache.sku_id.in_(sku_ids)))
-    # Then delete the SKUs themselves
-    result = await db.execute(SkuRecord.__table__.delete().where(SkuRecord.sku_id.in_(sku_ids)))
+    # Then delete the SKUs themselves; only ids that existed reach the change feed
+    result = await db.execute(
+        SkuRecord.__table__.delete().where(SkuRecord.sku_id.in_(sku_ids)).returning(SkuRecord.sku_id)
+    )
+    deleted = result.scalars().all()
+    await change_feed.publish(db, [{"sku_id": sku_id, "deleted": True} for sku_id in deleted])
+
+    # The remaining SKUs of their groups may now fill a gap the deleted ones crowded
+    engine = await build_calc_engine(db)
+    moved = await refresh_synergy(db, engine, groups) if engine.computed_synergy else []
+    for start in range(0, len(moved), MAX_BULK_PATCH_SKUS):
+        where = SkuRecord.sku_id.in_(moved[start:start + MAX_BULK_PATCH_SKUS])
+        await recalculate_skus(db, where, await load_sku_rows(db, where, for_update=True))
     await db.commit()
-    return {"status": "success", "deleted_count": result.rowcount}
+    return {"status": "success", "deleted_count": len(deleted)}
 
-async def _build_calc_engine(db: AsyncSession) -> CalculationEngine:
-    # Fetch all configs
-    settings_res = await db.execute(select(GlobalSetting))
-    settings = {s.setting_key: s.setting_value for s in settings_res.scalars().all()}
-    
-    market_res = await db.execute(select(MarketConfig))
-    markets = {m.market_name: m for m in market_res.scalars().all()}
-    
-    channel_res = await db.execute(select(MarketChannelConfig))
-    market_channels = {f"{c.market_id}_{c.channel}": c for c in channel_res.scalars().all()}
-    
-    category_res = await db.execute(select(MarketCategoryConfig))
-    market_categories = {f"{c.market_id}_{c.channel}_{c.category}": c for c in category_res.scalars().all()}
-        
-    return CalculationEngine(settings, markets, market_channels, market_categories)
+@router.get("/{sku_id}/explain")
+async def explain_sku(sku_id: str, db: AsyncSession = Depends(get_read_db)):
+    """
+    Rescores one SKU under the current config and shows how: each config value with the cascade
+    tier or config row it came from, every intermediate in calculation order, and the result.
+    """
+    trace = await explain_skus(db, SkuRecord.sku_id == sku_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="SKU not found")
+    return explain_record(trace)
+
+@router.get("/{sku_id}/projection")
+async def read_sku_projection(sku_id: str, horizon: int = 24, db: AsyncSession = Depends(get_db)):
+    projection = await db.get(SkuProjection, sku_id)
+    if not projection:
+        raise HTTPException(status_code=404, detail="No projection for this SKU")
+    months = []
+    for m in range(min(max(horizon, 1), len(projection.units_base))):
+        month = {"month": m + 1}
+        for scenario in ("base", "best", "worst"):
+            units = getattr(projection, f"units_{scenario}")[m]
+            month[f"units_{scenario}"] = units
+            month[f"revenue_{scenario}"] = units * projection.unit_price
+            month[f"gm_{scenario}"] = units * projection.gm_per_unit
+        months.append(month)
+    return {"sku_id": sku_id, "months": months}
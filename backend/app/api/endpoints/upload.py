@@ -1,39 +1,81 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.dependencies.database import get_db
-from app.services.excel_parser import parse_and_seed_excel, extract_headers
+from app.services.progress import get_progress, watch_progress
+from app.services.upload_sessions import create_session, get_session
 import json
 
 router = APIRouter()
 
 @router.post("/headers")
 async def get_excel_headers(file: UploadFile = File(...)):
+    """
+    Stages the file as an upload session and returns its SKU sheet columns with the session id;
+    pass the id to POST /upload/ instead of sending the file again.
+    """
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported.")
-        
+
     try:
-        contents = await file.read()
-        headers = extract_headers(contents)
-        return {"headers": headers}
+        session = await create_session(file)
+        return session.to_dict()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.delete("/sessions/{session_id}")
+async def discard_upload_session(session_id: str):
+    session = get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired.")
+    session.close()
+    return {"message": "Discarded"}
+
 @router.post("/")
 async def upload_excel_file(
-    file: UploadFile = File(...), 
+    file: UploadFile = File(None),
+    session_id: str = Form(None),
     mapping: str = Form(None),
     default_market: str = Form(None),
+    job_id: str = Form(None),
     db: AsyncSession = Depends(get_db)
 ):
-    if not file.filename.endswith(('.xlsx', '.xls')):
+    """Imports an upload session's staged workbook (`session_id`) or a directly posted `file`."""
+    session = None
+    if session_id:
+        session = get_session(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload session not found or expired.")
+    elif file is None:
+        raise HTTPException(status_code=400, detail="Provide either a file or an upload session_id.")
+    elif not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported.")
-        
+
+    # Clients pass their own job_id so they can open the progress stream before posting
+    progress = get_progress(job_id) if job_id else None
+    # pandas/openpyxl load on the first upload rather than with every worker
+    from app.services.excel_parser import parse_and_seed_excel
     try:
         mapping_dict = json.loads(mapping) if mapping else {}
-        contents = await file.read()
-        
-        # Process the excel file in memory
-        stats = await parse_and_seed_excel(contents, db, mapping=mapping_dict, default_market=default_market)
+        source = session or await file.read()
+
+        stats = await parse_and_seed_excel(source, db, mapping=mapping_dict, default_market=default_market, progress=progress)
+        if session:
+            session.close()
+        if progress:
+            await progress.update(stage="done", done=True)
         return {"message": "Success", "stats": stats}
     except Exception as e:
+        if progress:
+            await progress.update(stage="failed", done=True, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/progress/{job_id}")
+async def stream_upload_progress(job_id: str):
+    """Server-Sent Events stream of rows parsed / upserted / scored for an upload job."""
+    progress = watch_progress(job_id)
+    return StreamingResponse(
+        progress.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,39 +1,256 @@
 from app.models.skus import SkuRecord, SkuCalculationCache
-from typing import Dict, Any
+from app.core.formulas import FormulaError, compile_formula, parse_formula
+from types import SimpleNamespace
+from typing import Dict, Any, List, Sequence
+import operator
+
+import numpy as np
+
+# Every global setting the engine reads, with the value used when it is not set
+SETTING_DEFAULTS = {
+    "consumer_trend_weight": 0.2, "point_of_diff_weight": 0.2, "channel_suitability_weight": 0.2,
+    "strategic_role_weight": 0.2, "marketing_leverage_weight": 0.2,
+    "price_ladder_weight": 0.2, "usage_occasion_weight": 0.2, "channel_diff_weight": 0.2,
+    "story_cohesion_weight": 0.2, "operational_synergy_weight": 0.2,
+    "regulatory_delay_weight": 0.2, "retail_listing_weight": 0.2, "competitive_weight": 0.2,
+    "supply_chain_weight": 0.2, "price_war_weight": 0.2,
+    "global_risk_floor": 0.6, "global_risk_slope": 0.25, "price_elasticity_abs": 1.5,
+    "risk_penalty_cap": 0.4, "global_price_adjustment_pct": 0.0,
+    # Tier-3 fallbacks of the override cascade
+    "marketing_lift": 1.0, "adoption_rate": 1.0, "competitor_idx": 1.0,
+    "scenario_base_price_delta": 0.0, "scenario_base_marketing_mult": 1.0,
+    "scenario_base_adoption_mult": 1.0, "scenario_base_competitor_mult": 1.0,
+    "scenario_best_price_delta": -0.05, "scenario_best_marketing_mult": 1.15,
+    "scenario_best_adoption_mult": 1.2, "scenario_best_competitor_mult": 0.9,
+    "scenario_worst_price_delta": 0.10, "scenario_worst_marketing_mult": 0.85,
+    "scenario_worst_adoption_mult": 0.8, "scenario_worst_competitor_mult": 1.2,
+    "launch_now_min_score": 4.0, "launch_now_max_risk": 2.5, "gm_floor_pct": 0.35,
+    # Working-capital gates: the MOQ must sell through within this many months of worst-case demand,
+    # and the first order must sell through before this share of shelf life is used up
+    "max_moq_coverage_months": 6.0, "max_shelf_life_consumed_pct": 0.75,
+    # Months between launch waves in the projections ("Wave 2" launches this many months after "Wave 1")
+    "launch_wave_spacing_months": 3.0,
+    # Computed synergy (services/synergy.py): 1 = Layer C reads price-ladder and channel-diff scores derived
+    # from the portfolio instead of the hand-entered ones; prices within this share of each other crowd each other
+    "computed_synergy": 0.0, "synergy_price_band_pct": 0.10,
+}
+
+SCENARIOS = ["base", "best", "worst"]
+PROJECTION_MONTHS = 24
+# Share of steady-state demand reached in ramp months 1, 2, 3, 4+ when a channel has no curve of its own
+DEFAULT_RAMP_CURVE = [0.25, 0.5, 0.75, 1.0]
+
+SCORE_FIELDS = [
+    "score_consumer_trend", "score_point_of_diff", "score_channel_suitability", "score_strategic_role", "score_marketing_leverage",
+    "score_price_ladder", "score_usage_occasion", "score_channel_diff", "score_story_cohesion", "score_operational_synergy",
+    "score_regulatory_delay", "score_retail_listing", "score_competitive", "score_supply_chain", "score_price_war",
+]
+
+# User-editable formulas, evaluated in this order. The defaults are the original methodology.
+DEFAULT_FORMULAS = {
+    "layer_b": "score_consumer_trend * consumer_trend_weight + score_point_of_diff * point_of_diff_weight"
+               " + score_channel_suitability * channel_suitability_weight + score_strategic_role * strategic_role_weight"
+               " + score_marketing_leverage * marketing_leverage_weight",
+    "layer_c": "score_price_ladder * price_ladder_weight + score_usage_occasion * usage_occasion_weight"
+               " + score_channel_diff * channel_diff_weight + score_story_cohesion * story_cohesion_weight"
+               " + score_operational_synergy * operational_synergy_weight",
+    "layer_d": "score_regulatory_delay * regulatory_delay_weight + score_retail_listing * retail_listing_weight"
+               " + score_competitive * competitive_weight + score_supply_chain * supply_chain_weight"
+               " + score_price_war * price_war_weight",
+    "risk_factor": "max(global_risk_floor, 1 - global_risk_slope * (layer_d - 1))",
+    "demand_units": "base_units * max(0.6, channel_weighted_score / 5) * risk_factor"
+                    " * marketing_factor * adoption_factor * competitor_factor * ramp_factor",
+    "do_not_launch": "ip_risk_high or regulatory_prohibition",
+    "launch_now": "pass_regulatory and pass_supply_ready and pass_gm_floor and pass_moq_coverage and pass_expiry"
+                  " and layer_b >= launch_now_min_score and layer_d <= launch_now_max_risk",
+}
+BOOLEAN_FORMULAS = {"do_not_launch", "launch_now"}
+# final_recommendation by code: 0 = neither flag, 1 = launch_now, 2 = do_not_launch
+_RECOMMENDATIONS = np.array(["Phase Later", "Launch Now", "Do Not Launch"], dtype=object)
+
+# Variables that become available to formulas before each target (settings are available everywhere)
+_STAGE_VARIABLES = {
+    "layer_b": SCORE_FIELDS + [
+        "local_list_price", "landed_cost", "regulatory_eligible", "regulatory_prohibition", "ip_risk_high", "supply_ready",
+        "adj_list_price", "imported_cogs", "cts_pct", "gm_dollar_per_unit", "gm_pct",
+        "channel_weight", "base_units", "marketing_lift", "adoption_rate", "competitor_idx",
+    ],
+    "layer_c": ["layer_b", "channel_weighted_score"],
+    "layer_d": ["layer_c"],
+    "risk_factor": ["layer_d"],
+    "demand_units": ["risk_factor", "marketing_factor", "adoption_factor", "competitor_factor", "ramp_factor"],
+    "do_not_launch": ["demand_units", "adj_units_base", "adj_units_best", "adj_units_worst",
+                      "initial_stock_investment", "moq_coverage_base", "moq_coverage_best", "moq_coverage_worst",
+                      "days_of_cover", "expiry_risk", "pass_regulatory", "pass_supply_ready", "pass_gm_floor",
+                      "pass_moq_coverage", "pass_expiry"],
+    "launch_now": [],
+}
+
+CACHE_OUTPUT_FIELDS = [
+    "gm_dollar_per_unit", "gm_pct", "monthly_revenue", "monthly_gm_dollar",
+    "weighted_score_layer_b", "synergy_score_layer_c", "risk_score_layer_d", "risk_factor",
+    "channel_weighted_score", "pass_regulatory", "pass_supply_ready", "pass_gm_floor",
+    "final_recommendation", "select_for_wave_1",
+    "adj_units_base", "adj_units_best", "adj_units_worst",
+    "monthly_gm_base", "monthly_gm_best", "monthly_gm_worst",
+    "initial_stock_investment", "moq_coverage_base", "moq_coverage_best", "moq_coverage_worst",
+    "days_of_cover", "expiry_risk", "pass_moq_coverage", "pass_expiry",
+]
+
+# Columns of a _config_row(), in order
+CONFIG_ROW_FIELDS = [
+    "price_multiplier", "import_freight_pct", "duties_taxes_pct", "doc_days",
+    "cts_pct", "channel_weight", "base_units", "marketing_lift", "adoption_rate", "competitor_idx",
+]
+# Where explain() reports a config value came from: the cascade tier for the multipliers,
+# the market / market-channel row for the constants, "default" when nothing was configured
+CONFIG_SOURCES = ["category_override", "market_channel", "market", "global_setting", "default"]
+
+# Intermediates and outputs explain() reports per SKU, in calculation order
+EXPLAIN_FIELDS = [
+    "adj_list_price", "imported_cogs", "gm_dollar_per_unit", "gm_pct",
+    "layer_b", "channel_weighted_score", "layer_c", "layer_d",
+    "risk_factor", "marketing_factor", "adoption_factor", "competitor_factor", "ramp_factor", "demand_units",
+    "adj_units_base", "adj_units_best", "adj_units_worst", "monthly_revenue",
+    "monthly_gm_base", "monthly_gm_best", "monthly_gm_worst",
+    "initial_stock_investment", "moq_coverage_worst", "days_of_cover", "expiry_risk",
+    "pass_regulatory", "pass_supply_ready", "pass_gm_floor", "pass_moq_coverage", "pass_expiry",
+    "do_not_launch", "launch_now", "final_recommendation",
+]
+
+# goal_seek(): what must hold, and the SKU inputs it can solve for
+GOAL_SEEK_GOALS = ["gm_floor", "launch_now"]
+GOAL_SEEK_VARIABLES = ["local_list_price", "landed_cost"] + SCORE_FIELDS
+# Bisection: halvings per solve, and the range searched (prices/costs: up to this multiple of the current value)
+GOAL_SEEK_ITERATIONS = 50
+GOAL_SEEK_PRICE_RANGE = 100.0
+GOAL_SEEK_SCORE_RANGE = (1.0, 5.0)
+
+def formula_inputs(target: str) -> List[str]:
+    """Names (besides global settings) a formula for `target` may read."""
+    names = []
+    for stage, variables in _STAGE_VARIABLES.items():
+        names += variables
+        if stage == target:
+            return names
+    raise FormulaError(f"Unknown formula: {target}")
+
+def validate_formula(target: str, expression: str, setting_keys=()) -> None:
+    """Raises FormulaError unless `expression` is a valid formula for `target`."""
+    parse_formula(expression, set(formula_inputs(target)) | set(SETTING_DEFAULTS) | set(setting_keys))
+
+# Hand-entered score -> the sku_records column holding its computed counterpart
+SYNERGY_SCORE_FIELDS = {"score_price_ladder": "computed_price_ladder", "score_channel_diff": "computed_channel_diff"}
+
+SKU_INPUT_FIELDS = ["sku_id", "target_market", "primary_channel", "category", "local_list_price", "landed_cost",
+                    "regulatory_eligible", "supply_ready", "ip_risk_high", "regulatory_prohibition",
+                    "ramp_month", "suggested_launch_wave", "moq", "lead_time_days", "shelf_life_months"] + SCORE_FIELDS + list(SYNERGY_SCORE_FIELDS.values())
+
+# Names a global setting cannot take: settings share the formulas' scope with NumPy and the engine's
+# own variables (config row fields, e.g. marketing_lift, are settings by design: the cascade's global tier)
+RESERVED_SETTING_KEYS = frozenset(
+    ["np"] + list(DEFAULT_FORMULAS) + [v for variables in _STAGE_VARIABLES.values() for v in variables]
+    + SKU_INPUT_FIELDS + CACHE_OUTPUT_FIELDS
+) - set(SETTING_DEFAULTS) - set(CONFIG_ROW_FIELDS)
+
+def launch_wave_number(wave) -> int:
+    """'Wave 2' / '2' / 2 -> 2; blank or unparseable -> 1."""
+    digits = "".join(ch for ch in str(wave or "") if ch.isdigit())
+    return max(int(digits), 1) if digits else 1
+
+def _columns(skus: Sequence, fields: List[str]) -> Dict[str, tuple]:
+    """Transposes SKU rows (objects or dicts) into one tuple per field."""
+    getter = operator.itemgetter(*fields) if isinstance(skus[0], dict) else operator.attrgetter(*fields)
+    return dict(zip(fields, zip(*map(getter, skus))))
+
+def _numbers(values: list) -> np.ndarray:
+    return np.array([0.0 if v is None else v for v in values], dtype=float)
+
+def _output_values(values: np.ndarray) -> list:
+    # A custom formula can divide by zero or overflow; store those as missing rather than inf/nan
+    if values.dtype.kind == "f" and not np.isfinite(values).all():
+        out = values.astype(object)
+        out[~np.isfinite(values)] = None
+        return out.tolist()
+    return values.tolist()
+
+def _flags(values: list, default: bool) -> np.ndarray:
+    return np.array([default if v is None else bool(v) for v in values], dtype=bool)
 
 class CalculationEngine:
-    def __init__(self, global_settings: Dict[str, float], markets: Dict[str, Any], market_channels: Dict[str, Any], market_categories: Dict[str, Any]):
+    def __init__(self, global_settings: Dict[str, float], markets: Dict[str, Any], market_channels: Dict[str, Any], market_categories: Dict[str, Any],
+                 formulas: Dict[str, str] = None, ramp_curves: Dict[str, List[float]] = None):
         self.settings = global_settings
         self.markets = markets
         self.market_channels = market_channels
         self.market_categories = market_categories
-        
+        # target -> expression, only for targets that override DEFAULT_FORMULAS
+        self.formulas = formulas or {}
+        # channel -> share of steady-state demand per ramp month
+        self.ramp_curves = ramp_curves or {}
+
+    def snapshot(self) -> tuple:
+        """Plain-data copy of the config maps so the engine can be shipped to worker processes."""
+        def _row(obj):
+            return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+        return (
+            dict(self.settings),
+            {k: _row(v) for k, v in self.markets.items()},
+            {k: _row(v) for k, v in self.market_channels.items()},
+            {k: _row(v) for k, v in self.market_categories.items()},
+            dict(self.formulas),
+            dict(self.ramp_curves),
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: tuple) -> "CalculationEngine":
+        settings, markets, market_channels, market_categories, formulas, ramp_curves = snapshot
+        return cls(
+            settings,
+            {k: SimpleNamespace(**v) for k, v in markets.items()},
+            {k: SimpleNamespace(**v) for k, v in market_channels.items()},
+            {k: SimpleNamespace(**v) for k, v in market_categories.items()},
+            formulas,
+            ramp_curves,
+        )
+
     def _get_setting(self, key: str, default: float = 0.0) -> float:
         return self.settings.get(key, default)
 
+    @property
+    def computed_synergy(self) -> bool:
+        return self._get_setting("computed_synergy", SETTING_DEFAULTS["computed_synergy"]) >= 0.5
+
     def _get_override(self, market: str, channel: str, category: str, field_name: str, global_default: float = 1.0) -> float:
+        return self._resolve_override(market, channel, category, field_name, global_default)[0]
+
+    def _resolve_override(self, market: str, channel: str, category: str, field_name: str, global_default: float = 1.0) -> tuple:
         """
         3-Tier Resolution Cascade:
         1. MarketCategoryConfig
         2. MarketChannelConfig
         3. GlobalSettings (fallback)
+        Returns (value, CONFIG_SOURCES entry of the tier that supplied it).
         """
         # 1. Check Category Specific Overrides
         cat_key = f"{market}_{channel}_{category}"
         if cat_key in self.market_categories:
             override_val = getattr(self.market_categories[cat_key], f"{field_name}_override", None)
             if override_val is not None:
-                return override_val
+                return override_val, "category_override"
 
         # 2. Check Market Channel Defaults
         chan_key = f"{market}_{channel}"
         if chan_key in self.market_channels:
             val = getattr(self.market_channels[chan_key], getattr(self, '_map_field_name', lambda x: x)(field_name), None)
             if val is not None:
-                return val
-                
+                return val, "market_channel"
+
         # 3. Fallback
-        return self._get_setting(field_name, global_default)
+        if field_name in self.settings:
+            return self.settings[field_name], "global_setting"
+        return global_default, "default"
 
     def _map_field_name(self, field_name: str) -> str:
         # Maps the override name back to the base MarketChannelConfig name
@@ -44,215 +261,353 @@ class CalculationEngine:
         }
         return mapping.get(field_name, field_name)
 
-    def calculate_sku(self, sku: SkuRecord) -> SkuCalculationCache:
-        cache = SkuCalculationCache(sku_id=sku.sku_id)
-        
-        # We need both Market and Channel to proceed fully
-        if not sku.target_market or not sku.primary_channel:
-            return cache # Returns empty cache but prevents crashes
-            
-        market = sku.target_market
-        channel = sku.primary_channel
-        
-        # 1. Market Economics & Financial Constants
-        base_list_price = sku.local_list_price or 0.0
-        base_landed_cost = sku.landed_cost or 0.0
-        
+    def _config_row(self, market: str, channel: str, category: str) -> tuple:
+        """Market/channel constants and cascade-resolved multipliers for one (market, channel, category)."""
         market_data = self.markets.get(market)
         if market_data:
-            adj_list_price = base_list_price * market_data.price_multiplier
-            imported_cogs = base_landed_cost * (1.0 + market_data.import_freight_pct) * (1.0 + market_data.duties_taxes_pct)
+            market_vals = (market_data.price_multiplier, market_data.import_freight_pct, market_data.duties_taxes_pct,
+                           (market_data.doc_distributor or 0.0) + (market_data.doc_retail or 0.0))
         else:
-            adj_list_price = base_list_price
-            imported_cogs = base_landed_cost
-        
-        # 2. CTS Matrix Total
+            market_vals = (1.0, 0.0, 0.0, 0.0)
+
         chan_key = f"{market}_{channel}"
-        cts_pct = 0.0
+        cts_pct, ch_weight, base_units = 0.0, 1.0, 0.0
         if chan_key in self.market_channels:
             mc = self.market_channels[chan_key]
-            cts_pct = (mc.commission_pct + mc.fulfillment_pct + mc.cod_pct + 
-                       mc.returns_allowance_pct + mc.listing_fees_pct + 
+            cts_pct = (mc.commission_pct + mc.fulfillment_pct + mc.cod_pct +
+                       mc.returns_allowance_pct + mc.listing_fees_pct +
                        mc.trade_terms_pct + mc.rebates_pct + mc.promo_accrual_pct)
-            
-        # 3. Core Financials
-        cache.gm_dollar_per_unit = adj_list_price - (imported_cogs + (cts_pct * adj_list_price))
-        cache.gm_pct = (cache.gm_dollar_per_unit / adj_list_price) if adj_list_price > 0 else 0.0
-        
-        # 4. Layer B: Market & Channel Fit (Scores 1-5)
-        w1 = self._get_setting("consumer_trend_weight", 0.2)
-        w2 = self._get_setting("point_of_diff_weight", 0.2)
-        w3 = self._get_setting("channel_suitability_weight", 0.2)
-        w4 = self._get_setting("strategic_role_weight", 0.2)
-        w5 = self._get_setting("marketing_leverage_weight", 0.2)
-        
-        score_b = (
-            (sku.score_consumer_trend or 0) * w1 +
-            (sku.score_point_of_diff or 0) * w2 +
-            (sku.score_channel_suitability or 0) * w3 +
-            (sku.score_strategic_role or 0) * w4 +
-            (sku.score_marketing_leverage or 0) * w5
-        )
-        cache.weighted_score_layer_b = score_b
-        
-        # Channel-Weighted Score
-        ch_weight = 1.0 # default
-        if chan_key in self.market_channels:
-            ch_weight = self.market_channels[chan_key].channel_weight
-        cache.channel_weighted_score = score_b * ch_weight
-
-        # 5. Layer C: Strategic Synergy
-        s1 = self._get_setting("price_ladder_weight", 0.2)
-        s2 = self._get_setting("usage_occasion_weight", 0.2)
-        s3 = self._get_setting("channel_diff_weight", 0.2)
-        s4 = self._get_setting("story_cohesion_weight", 0.2)
-        s5 = self._get_setting("operational_synergy_weight", 0.2)
-        
-        score_c = (
-            (sku.score_price_ladder or 0) * s1 +
-            (sku.score_usage_occasion or 0) * s2 +
-            (sku.score_channel_diff or 0) * s3 +
-            (sku.score_story_cohesion or 0) * s4 +
-            (sku.score_operational_synergy or 0) * s5
+            ch_weight = mc.channel_weight
+            base_units = mc.base_units_month
+
+        return market_vals + (
+            cts_pct, ch_weight, base_units,
+            self._get_override(market, channel, category, "marketing_lift", 1.0),
+            self._get_override(market, channel, category, "adoption_rate", 1.0),
+            self._get_override(market, channel, category, "competitor_idx", 1.0),
         )
-        cache.synergy_score_layer_c = score_c
-
-        # 6. Layer D: Risk Heatmap
-        r1 = self._get_setting("regulatory_delay_weight", 0.2)
-        r2 = self._get_setting("retail_listing_weight", 0.2)
-        r3 = self._get_setting("competitive_weight", 0.2)
-        r4 = self._get_setting("supply_chain_weight", 0.2)
-        r5 = self._get_setting("price_war_weight", 0.2)
-        
-        score_d = (
-            (sku.score_regulatory_delay or 0) * r1 +
-            (sku.score_retail_listing or 0) * r2 +
-            (sku.score_competitive or 0) * r3 +
-            (sku.score_supply_chain or 0) * r4 +
-            (sku.score_price_war or 0) * r5
+
+    def _config_sources(self, market: str, channel: str, category: str) -> tuple:
+        """CONFIG_SOURCES entry per _config_row() column: which row or cascade tier supplied it."""
+        market_source = "market" if self.markets.get(market) else "default"
+        channel_source = "market_channel" if f"{market}_{channel}" in self.market_channels else "default"
+        return (market_source,) * 4 + (channel_source,) * 3 + tuple(
+            self._resolve_override(market, channel, category, field, 1.0)[1]
+            for field in ("marketing_lift", "adoption_rate", "competitor_idx")
         )
-        cache.risk_score_layer_d = score_d
-        
+
+    def _evaluate(self, target: str, env: dict, n: int) -> np.ndarray:
+        kernel = compile_formula(self.formulas.get(target) or DEFAULT_FORMULAS[target])
+        try:
+            value = kernel(env)
+        except NameError as e:
+            raise FormulaError(f"Formula '{target}': {e}")
+        dtype = bool if target in BOOLEAN_FORMULAS else float
+        return np.broadcast_to(np.asarray(value, dtype=dtype), (n,))
+
+    def _base_env(self) -> dict:
+        env = {k: self._get_setting(k, v) for k, v in SETTING_DEFAULTS.items()}
+        env.update(self.settings)
+        return env
+
+    def _sku_inputs(self, cols: Dict[str, tuple]) -> Dict[str, np.ndarray]:
+        """Per-SKU input arrays that do not depend on where the SKU is placed."""
+        inputs = {field: _numbers(cols[field]) for field in SCORE_FIELDS + ["local_list_price", "landed_cost"]}
+        if self.computed_synergy:
+            # Portfolio-derived scores where computed, the hand-entered ones otherwise
+            for field, computed in SYNERGY_SCORE_FIELDS.items():
+                inputs[field] = _numbers([t if c is None else c for c, t in zip(cols[computed], cols[field])])
+        # If the user left it blank on upload (None), assume they passed. Only fail if explicitly False.
+        inputs["regulatory_eligible"] = _flags(cols["regulatory_eligible"], True)
+        inputs["supply_ready"] = _flags(cols["supply_ready"], True)
+        inputs["ip_risk_high"] = _flags(cols["ip_risk_high"], False)
+        inputs["regulatory_prohibition"] = _flags(cols["regulatory_prohibition"], False)
+        # Missing (nan) unless positive
+        inputs["moq"] = np.array([m if m and m > 0 else np.nan for m in cols["moq"]], dtype=float)
+        inputs["shelf_life_months"] = np.array([m if m and m > 0 else np.nan for m in cols["shelf_life_months"]], dtype=float)
+        inputs["lead_time_days"] = _numbers(cols["lead_time_days"])
+        return inputs
+
+    def _score(self, env: dict, config: np.ndarray, n: int):
+        """
+        Steps 3-9 for `n` rows: `env` holds the settings and per-row SKU inputs, `config` the
+        (n, 10) _config_row values of each row's placement. Adds every intermediate and output to env.
+        """
+        (price_multiplier, import_freight_pct, duties_taxes_pct, env["doc_days"], env["cts_pct"], env["channel_weight"], env["base_units"],
+         env["marketing_lift"], env["adoption_rate"], env["competitor_idx"]) = config.T
+
+        # 3. Core Financials
+        env["adj_list_price"] = env["local_list_price"] * price_multiplier
+        env["imported_cogs"] = env["landed_cost"] * (1.0 + import_freight_pct) * (1.0 + duties_taxes_pct)
+        env["gm_dollar_per_unit"] = env["adj_list_price"] - (env["imported_cogs"] + (env["cts_pct"] * env["adj_list_price"]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            env["gm_pct"] = np.where(env["adj_list_price"] > 0, env["gm_dollar_per_unit"] / env["adj_list_price"], 0.0)
+
+        # 4-6. Layers B (Market & Channel Fit), C (Strategic Synergy) and D (Risk Heatmap)
+        env["layer_b"] = self._evaluate("layer_b", env, n)
+        env["channel_weighted_score"] = env["layer_b"] * env["channel_weight"]
+        env["layer_c"] = self._evaluate("layer_c", env, n)
+        env["layer_d"] = self._evaluate("layer_d", env, n)
+
         # 8. Advanced Demand Logic (Price Elasticity & Scenarios)
-        base_units = 0.0
-        if chan_key in self.market_channels:
-            base_units = self.market_channels[chan_key].base_units_month
-            
-        # 8a. Global Setup Variables
-        global_risk_floor = self._get_setting("global_risk_floor", 0.6)
-        global_risk_slope = self._get_setting("global_risk_slope", 0.25)
-        price_elasticity = self._get_setting("price_elasticity_abs", 1.5)
-        
-        # Use 3-Tier Cascade for Multipliers
-        category = sku.category or "Unknown"
-        marketing_budget_multiplier = self._get_override(market, channel, category, "marketing_lift", 1.0)
-        retail_adoption_fraction = self._get_override(market, channel, category, "adoption_rate", 1.0)
-        target_comp_index = self._get_override(market, channel, category, "competitor_idx", 1.0)
-
-        # 8b. Core Factors
-        # Risk factor = MAX(Floor, 1 - Slope * (RiskScore - 1))
-        cache.risk_factor = max(global_risk_floor, 1.0 - global_risk_slope * (score_d - 1.0))
-        
-        # Base multiplier from channel weighted score: MAX(0.6, Channel_Weighted_Score / 5)
-        score_multiplier = max(0.6, cache.channel_weighted_score / 5.0)
-        
-        # Ramp Factor (Simplified: Could be dynamic array based on ramp_month)
-        ramp_factor = 1.0 
-        
-        # Marketing & Adoption 
+        env["risk_factor"] = self._evaluate("risk_factor", env, n)
         # Excel: CLAMP(Marketing Support Index * Channel Marketing Budget) -> Assume Index is 1.0 if not provided
-        marketing_factor = max(0.85, min(1.15, 1.0 * marketing_budget_multiplier))
-        adoption_factor = retail_adoption_fraction
-        
+        env["marketing_factor"] = np.maximum(0.85, np.minimum(1.15, 1.0 * env["marketing_lift"]))
+        env["adoption_factor"] = env["adoption_rate"]
         # Competitor Factor (Derived from Risk Penalty)
-        comp_weight = self._get_setting("competitive_weight", 0.2)
-        price_war_weight = self._get_setting("price_war_weight", 0.2)
-        lin_penalty = (comp_weight*target_comp_index + price_war_weight*target_comp_index) * (score_d/5.0)
-        competitor_factor = max(1.0 - min(self._get_setting("risk_penalty_cap", 0.4), lin_penalty), 0.6)
-        
-        # Price Effective Index = SKU Price Index (1.0 default) * (1 + Global Price Adj)
-        global_price_adj = self._get_setting("global_price_adjustment_pct", 0.0)
-        price_eff_index = 1.0 * (1.0 + global_price_adj)
-        
-        # Common pre-calculated multiplier
-        # Base Units * Score Multiplier * Global Risk Factor * Marketing * Adoption * Competitor * Ramp 
-        common_units_mult = (base_units * score_multiplier * cache.risk_factor * 
-                             marketing_factor * adoption_factor * competitor_factor * ramp_factor)
-
-        # 8c. Scenario Processing (Base, Best, Worst)
-        # Using typical multiplier offsets if they are not defined in the settings DB yet
-        scenarios = {
-            "base": {
-                "price_delta": self._get_setting("scenario_base_price_delta", 0.0),
-                "marketing_mult": self._get_setting("scenario_base_marketing_mult", 1.0),
-                "adoption_mult": self._get_setting("scenario_base_adoption_mult", 1.0),
-                "competitor_mult": self._get_setting("scenario_base_competitor_mult", 1.0),
-            },
-            "best": {
-                "price_delta": self._get_setting("scenario_best_price_delta", -0.05),
-                "marketing_mult": self._get_setting("scenario_best_marketing_mult", 1.15),
-                "adoption_mult": self._get_setting("scenario_best_adoption_mult", 1.2),
-                "competitor_mult": self._get_setting("scenario_best_competitor_mult", 0.9),
-            },
-            "worst": {
-                "price_delta": self._get_setting("scenario_worst_price_delta", 0.10),
-                "marketing_mult": self._get_setting("scenario_worst_marketing_mult", 0.85),
-                "adoption_mult": self._get_setting("scenario_worst_adoption_mult", 0.8),
-                "competitor_mult": self._get_setting("scenario_worst_competitor_mult", 1.2),
-            },
-        }
+        lin_penalty = (env["competitive_weight"] * env["competitor_idx"] + env["price_war_weight"] * env["competitor_idx"]) * (env["layer_d"] / 5.0)
+        env["competitor_factor"] = np.maximum(1.0 - np.minimum(env["risk_penalty_cap"], lin_penalty), 0.6)
+        # Ramp Factor: the cached monthly figures are the steady-state run rate; project() applies the ramp-up
+        env["ramp_factor"] = 1.0
+        env["demand_units"] = self._evaluate("demand_units", env, n)
 
-        # Calculate Demand for each scenario
-        # Formula: Common_Mult * ((1 / (Price_Eff_Index * (1 + Price_Delta))) ^ Price_Elasticity) * Scenario_Mults
-        
-        # Base
-        base_s = scenarios["base"]
-        base_price_effect = (1.0 / (price_eff_index * (1.0 + base_s["price_delta"]))) ** price_elasticity
-        cache.adj_units_base = common_units_mult * base_price_effect * base_s["marketing_mult"] * base_s["adoption_mult"] * base_s["competitor_mult"]
-        
-        # Best
-        best_s = scenarios["best"]
-        best_price_effect = (1.0 / (price_eff_index * (1.0 + best_s["price_delta"]))) ** price_elasticity
-        cache.adj_units_best = common_units_mult * best_price_effect * best_s["marketing_mult"] * best_s["adoption_mult"] * best_s["competitor_mult"]
-        
-        # Worst
-        worst_s = scenarios["worst"]
-        worst_price_effect = (1.0 / (price_eff_index * (1.0 + worst_s["price_delta"]))) ** price_elasticity
-        cache.adj_units_worst = common_units_mult * worst_price_effect * worst_s["marketing_mult"] * worst_s["adoption_mult"] * worst_s["competitor_mult"]
+        # Price Effective Index = SKU Price Index (1.0 default) * (1 + Global Price Adj)
+        price_eff_index = 1.0 * (1.0 + env["global_price_adjustment_pct"])
+        for scenario in ("base", "best", "worst"):
+            price_effect = (1.0 / (price_eff_index * (1.0 + env[f"scenario_{scenario}_price_delta"]))) ** env["price_elasticity_abs"]
+            env[f"adj_units_{scenario}"] = (env["demand_units"] * price_effect * env[f"scenario_{scenario}_marketing_mult"]
+                                            * env[f"scenario_{scenario}_adoption_mult"] * env[f"scenario_{scenario}_competitor_mult"])
+            env[f"monthly_gm_{scenario}"] = env[f"adj_units_{scenario}"] * env["gm_dollar_per_unit"]
 
         # 8d. Financial Rollups (Legacy compatibility + Base mappings)
-        cache.monthly_revenue = cache.adj_units_base * adj_list_price
-        cache.monthly_gm_dollar = cache.adj_units_base * cache.gm_dollar_per_unit
-        
-        # Save specific scenario GM$
-        cache.monthly_gm_base = cache.adj_units_base * cache.gm_dollar_per_unit
-        cache.monthly_gm_best = cache.adj_units_best * cache.gm_dollar_per_unit
-        cache.monthly_gm_worst = cache.adj_units_worst * cache.gm_dollar_per_unit
+        env["monthly_revenue"] = env["adj_units_base"] * env["adj_list_price"]
+        env["monthly_gm_dollar"] = env["adj_units_base"] * env["gm_dollar_per_unit"]
+
+        # 8e. Working Capital: first order = MOQ, or enough to fill lead time + distributor/retail days of cover
+        moq, shelf_life, lead_time = env["moq"], env["shelf_life_months"], env["lead_time_days"]
+        pipeline_units = env["adj_units_base"] / 30.0 * (lead_time + env["doc_days"])
+        initial_stock_units = np.maximum(np.nan_to_num(moq), pipeline_units)
+        env["initial_stock_investment"] = initial_stock_units * env["imported_cogs"]
+        worst_selling = env["adj_units_worst"] > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for scenario in SCENARIOS:
+                units = env[f"adj_units_{scenario}"]
+                # Months of demand one MOQ covers (missing without an MOQ or without demand)
+                env[f"moq_coverage_{scenario}"] = np.where(units > 0, moq / units, np.nan)
+            # Days the first order takes to sell through at worst-case demand, and the share of shelf life that uses
+            env["days_of_cover"] = np.where(worst_selling, initial_stock_units / (env["adj_units_worst"] / 30.0), np.nan)
+            env["expiry_risk"] = env["days_of_cover"] / (shelf_life * 30.0)
+        # Without an MOQ / shelf life, or without worst-case demand to measure against, a gate is not evaluable and passes
+        env["pass_moq_coverage"] = np.isnan(moq) | ~worst_selling | (env["moq_coverage_worst"] <= env["max_moq_coverage_months"])
+        env["pass_expiry"] = np.isnan(shelf_life) | ~worst_selling | (env["expiry_risk"] <= env["max_shelf_life_consumed_pct"])
 
         # 9. Final Recommendation Logic
-        min_launch_score = self._get_setting("launch_now_min_score", 4.0)
-        max_launch_risk = self._get_setting("launch_now_max_risk", 2.5)
-        
-        # If the user left it blank on upload (None), assume they passed. Only fail if explicitly False.
-        is_regulatory_passed = sku.regulatory_eligible if sku.regulatory_eligible is not None else True
-        is_supply_passed = sku.supply_ready if sku.supply_ready is not None else True
-        is_gm_passed = cache.gm_pct >= self._get_setting("gm_floor_pct", 0.35)
-        
-        # Store booleans in cache for the UI/API to read
-        cache.pass_regulatory = is_regulatory_passed
-        cache.pass_supply_ready = is_supply_passed
-        cache.pass_gm_floor = is_gm_passed
-        
-        if sku.ip_risk_high or sku.regulatory_prohibition:
-            cache.final_recommendation = "Do Not Launch"
-            cache.select_for_wave_1 = False
-        elif (cache.pass_regulatory and cache.pass_supply_ready and cache.pass_gm_floor and
-              cache.weighted_score_layer_b >= min_launch_score and 
-              cache.risk_score_layer_d <= max_launch_risk):
-            cache.final_recommendation = "Launch Now"
-            cache.select_for_wave_1 = True
+        env["pass_regulatory"] = env["regulatory_eligible"]
+        env["pass_supply_ready"] = env["supply_ready"]
+        env["pass_gm_floor"] = env["gm_pct"] >= env["gm_floor_pct"]
+        env["do_not_launch"] = self._evaluate("do_not_launch", env, n)
+        env["launch_now"] = self._evaluate("launch_now", env, n)
+        env["final_recommendation"] = _RECOMMENDATIONS[np.where(env["do_not_launch"], 2, env["launch_now"].astype(np.intp))]
+        env["select_for_wave_1"] = ~env["do_not_launch"] & env["launch_now"]
+
+        env["weighted_score_layer_b"] = env["layer_b"]
+        env["synergy_score_layer_c"] = env["layer_c"]
+        env["risk_score_layer_d"] = env["layer_d"]
+
+    def _batch_inputs(self, skus: Sequence) -> tuple:
+        """Steps 1-2 for a batch: (env with the settings and SKU inputs, (n, 10) config rows, SKU columns)."""
+        n = len(skus)
+        env = self._base_env()
+
+        cols = _columns(skus, SKU_INPUT_FIELDS)
+        env["sku_id"] = cols["sku_id"]
+        markets, channels = cols["target_market"], cols["primary_channel"]
+        categories = [c or "Unknown" for c in cols["category"]]
+        # We need both Market and Channel to proceed fully
+        env["scorable"] = np.array([bool(m) and bool(c) for m, c in zip(markets, channels)], dtype=bool)
+
+        # 1-2. Market economics, CTS matrix and cascade multipliers, resolved once per distinct key
+        memo, rows = {}, []
+        idx = np.empty(n, dtype=np.intp)
+        for i, key in enumerate(zip(markets, channels, categories)):
+            j = memo.get(key)
+            if j is None:
+                j = memo[key] = len(rows)
+                rows.append(self._config_row(*key))
+            idx[i] = j
+        env.update(self._sku_inputs(cols))
+        return env, np.array(rows, dtype=float).reshape(-1, 10)[idx], cols
+
+    def evaluate(self, skus: Sequence) -> dict:
+        """
+        Scores a batch of SKUs (ORM rows, namespaces or column dicts) column-wise.
+        Returns every input, intermediate and output as an array over the batch.
+        """
+        n = len(skus)
+        env, config, cols = self._batch_inputs(skus)
+        self._score(env, config, n)
+        channels = cols["primary_channel"]
+
+        # Projection inputs: when each SKU launches, where it starts on its channel's ramp curve
+        env["launch_offset"] = np.array([launch_wave_number(w) - 1 for w in cols["suggested_launch_wave"]], dtype=float) * env["launch_wave_spacing_months"]
+        env["ramp_start"] = np.array([max(r or 1, 1) for r in cols["ramp_month"]], dtype=np.intp)
+        curve_index = {}
+        env["ramp_curve_idx"] = np.array([curve_index.setdefault(c, len(curve_index)) for c in channels], dtype=np.intp)
+        curves = [self.ramp_curves.get(c) or DEFAULT_RAMP_CURVE for c in curve_index]
+        width = max((len(c) for c in curves), default=1)
+        # Pad every curve with its last value, so stages past the end stay at the plateau
+        env["ramp_curves"] = np.array([list(c) + [c[-1]] * (width - len(c)) for c in curves], dtype=float).reshape(-1, width)
+        return env
+
+    def explain(self, skus: Sequence) -> dict:
+        """
+        evaluate() plus where each SKU's config came from: every CONFIG_ROW_FIELDS value and,
+        as "<field>_source", its CONFIG_SOURCES entry. Columnar like evaluate(). The tiers are
+        resolved here, after scoring, so evaluate() itself never tracks them.
+        """
+        env = self.evaluate(skus)
+        cols = _columns(skus, ["target_market", "primary_channel", "category"])
+        keys = list(zip(cols["target_market"], cols["primary_channel"], [c or "Unknown" for c in cols["category"]]))
+        index = {}
+        idx = np.array([index.setdefault(key, len(index)) for key in keys], dtype=np.intp)
+        values = np.array([self._config_row(*key) for key in index], dtype=float).reshape(-1, len(CONFIG_ROW_FIELDS))[idx]
+        sources = np.array([self._config_sources(*key) for key in index], dtype=object).reshape(-1, len(CONFIG_ROW_FIELDS))[idx]
+        for j, field in enumerate(CONFIG_ROW_FIELDS):
+            env[field] = values[:, j]
+            env[f"{field}_source"] = sources[:, j]
+        # Some intermediates are constants (e.g. ramp_factor); every explained field is one value per SKU
+        for field in EXPLAIN_FIELDS:
+            env[field] = np.broadcast_to(np.asarray(env[field]), (len(keys),))
+        return env
+
+    @staticmethod
+    def _goal_met(env: dict, goal: str) -> np.ndarray:
+        if goal == "gm_floor":
+            return env["pass_gm_floor"]
+        return env["launch_now"] & ~env["do_not_launch"]
+
+    def goal_seek(self, skus: Sequence, variable: str, goal: str) -> dict:
+        """
+        Per SKU, the value of `variable` (GOAL_SEEK_VARIABLES) at which `goal` (GOAL_SEEK_GOALS)
+        starts or stops holding, everything else unchanged. Columnar:
+          - "required": the boundary value on the side where the goal holds (nan without one),
+          - "direction": "min" when the goal needs at least that value, "max" at most,
+          - "status": "solved", "always" / "never" (holds / fails across the whole range), or
+            "unscorable" (no market or channel),
+          - "met": whether the goal holds now, and "current", the value now.
+        Price and cost only reach the GM floor through gm_pct, which is linear in both, so that
+        boundary is solved in closed form; under the default formulas that is also the only way
+        they reach Launch Now. Everything else (scores, custom formulas) is found by bisection
+        over all SKUs at once, between the current value and an end of the range: the nearest
+        boundary when the goal flips once, the lower one when it holds only within a band.
+        """
+        n = len(skus)
+        inputs, config, _ = self._batch_inputs(skus)
+        current = inputs[variable]
+
+        def met(values: np.ndarray) -> tuple:
+            env = dict(inputs)
+            env[variable] = values
+            self._score(env, config, n)
+            return self._goal_met(env, goal), env
+
+        now, env = met(current)
+        required = np.full(n, np.nan)
+        if variable in ("local_list_price", "landed_cost") and (goal == "gm_floor" or not self.formulas):
+            method = "closed_form"
+            # gm_pct = 1 - cts_pct - imported_cogs / adj_list_price >= gm_floor_pct
+            headroom = 1.0 - env["cts_pct"] - env["gm_floor_pct"]
+            price_multiplier, duties = config[:, 0], (1.0 + config[:, 1]) * (1.0 + config[:, 2])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if variable == "local_list_price":
+                    direction = np.full(n, "min", dtype=object)
+                    boundary = np.where((headroom > 0) & (price_multiplier > 0),
+                                        env["imported_cogs"] / (headroom * price_multiplier), np.nan)
+                else:
+                    direction = np.full(n, "max", dtype=object)
+                    boundary = env["adj_list_price"] * headroom / duties
+                    boundary = np.where(boundary >= 0, boundary, np.nan)
+            # Just inside the passing side, where the other gates are checked too
+            step = np.where(direction == "min", 1.0, -1.0) * 1e-9 * np.maximum(np.abs(boundary), 1.0)
+            inside = np.where(np.isnan(boundary), current, np.maximum(boundary + step, 0.0))
+            reachable = ~np.isnan(boundary) & met(inside)[0]
+            required = np.where(reachable, inside, np.nan)
+            status = np.where(reachable, "solved", "never").astype(object)
         else:
-            cache.final_recommendation = "Phase Later"
-            cache.select_for_wave_1 = False
+            method = "bisection"
+            if variable in SCORE_FIELDS:
+                lo, hi = np.full(n, GOAL_SEEK_SCORE_RANGE[0]), np.full(n, GOAL_SEEK_SCORE_RANGE[1])
+            else:
+                lo, hi = np.zeros(n), GOAL_SEEK_PRICE_RANGE * np.maximum(np.abs(current), 1.0)
+            met_lo, met_hi = met(lo)[0], met(hi)[0]
+            # Bracket the boundary between the current value and an end of the range where the goal
+            # is the other way round, the lower end first
+            use_lo = met_lo != now
+            use_hi = ~use_lo & (met_hi != now)
+            solvable = use_lo | use_hi
+            end = np.where(use_lo, lo, hi)
+            passing, failing = np.where(now, current, end), np.where(now, end, current)
+            direction = np.where(passing > failing, "min", "max").astype(object)
+            for _ in range(GOAL_SEEK_ITERATIONS):
+                mid = (passing + failing) / 2.0
+                ok = met(mid)[0]
+                passing, failing = np.where(ok, mid, passing), np.where(ok, failing, mid)
+            required = np.where(solvable, passing, np.nan)
+            status = np.where(solvable, "solved", np.where(now, "always", "never")).astype(object)
 
-        return cache
+        status[~inputs["scorable"]] = "unscorable"
+        required[~inputs["scorable"]] = np.nan
+        return {
+            "sku_id": inputs["sku_id"], "method": method, "current": current, "required": required,
+            "direction": direction, "status": status, "met": now & inputs["scorable"],
+        }
+
+    def evaluate_placements(self, skus: Sequence, placements: Sequence[tuple]) -> dict:
+        """
+        Scores every SKU as if launched in each (market, channel) of `placements`, in one pass.
+        Arrays in the result have len(placements) * len(skus) rows, placement-major: row
+        p * len(skus) + i is SKU i placed in placements[p].
+        """
+        n, n_placements = len(skus), len(placements)
+        env = self._base_env()
+        cols = _columns(skus, SKU_INPUT_FIELDS)
+        env["sku_id"] = cols["sku_id"]
+
+        # Config rows for every placement x distinct category, then gathered per SKU
+        category_index = {}
+        category_codes = np.array([category_index.setdefault(c or "Unknown", len(category_index)) for c in cols["category"]], dtype=np.intp)
+        table = np.array([[self._config_row(market, channel, category) for category in category_index]
+                          for market, channel in placements], dtype=float).reshape(n_placements, -1, 10)
+        config = table[:, category_codes].reshape(-1, 10)
+
+        for field, values in self._sku_inputs(cols).items():
+            env[field] = np.tile(values, n_placements)
+        env["scorable"] = np.ones(n * n_placements, dtype=bool)
+        self._score(env, config, n * n_placements)
+        return env
+
+    def project(self, env: dict, rows: slice = slice(None), horizon: int = PROJECTION_MONTHS) -> np.ndarray:
+        """
+        Monthly units for scenario x SKU x month, shape (len(SCENARIOS), n, horizon), for the
+        SKUs in `rows` of an evaluate() result. Month 1 is the first month of the plan; a SKU
+        sells nothing before its launch wave, then follows its channel's ramp curve.
+        """
+        months = np.arange(1, horizon + 1)
+        # Months since launch (1 = launch month) and the matching ramp stage
+        since_launch = months[None, :] - env["launch_offset"][rows, None]
+        stage = env["ramp_start"][rows, None] - 1 + since_launch.astype(np.intp) - 1
+        curves = env["ramp_curves"]
+        ramp = curves[env["ramp_curve_idx"][rows, None], np.clip(stage, 0, curves.shape[1] - 1)]
+        ramp = np.where(since_launch >= 1, ramp, 0.0)
+        steady = np.stack([env[f"adj_units_{s}"][rows] for s in SCENARIOS])
+        return steady[:, :, None] * ramp[None, :, :]
+
+    def calculate_batch(self, skus: Sequence) -> List[dict]:
+        """Cache values for each SKU, in order, as dicts with sku_id and every engine output column."""
+        if not skus:
+            return []
+        return self.cache_rows(self.evaluate(skus))
+
+    def cache_rows(self, env: dict) -> List[dict]:
+        """Turns an evaluate() result into one cache dict per SKU (all None for unscorable SKUs)."""
+        columns = [_output_values(env[f]) for f in CACHE_OUTPUT_FIELDS]
+        empty = dict.fromkeys(CACHE_OUTPUT_FIELDS)
+        results = []
+        for sku_id, scorable, values in zip(env["sku_id"], env["scorable"].tolist(), zip(*columns)):
+            row = dict(zip(CACHE_OUTPUT_FIELDS, values)) if scorable else dict(empty)
+            row["sku_id"] = sku_id
+            results.append(row)
+        return results
+
+    def calculate_sku(self, sku: SkuRecord) -> SkuCalculationCache:
+        return SkuCalculationCache(**self.calculate_batch([sku])[0])
@@ -0,0 +1,158 @@
+"""
+A small, safe expression language for user-defined scoring formulas.
+
+Expressions use Python syntax restricted to numbers, variable names, arithmetic
+(+ - * / **), comparisons, and/or/not, `a if cond else b` and a few functions
+(min, max, abs, clamp, sqrt, exp, log). Each one is parsed and validated once, then
+rewritten into a NumPy expression and compiled, so a kernel scores a whole portfolio
+per call. Compiled kernels are cached by a hash of the expression text.
+"""
+import ast
+import hashlib
+from typing import Callable, Dict, Iterable
+
+import numpy as np
+
+MAX_EXPRESSION_LENGTH = 2000
+MAX_NODES = 500
+
+class FormulaError(ValueError):
+    pass
+
+_BIN_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)
+_UNARY_OPS = (ast.UAdd, ast.USub, ast.Not)
+_CMP_OPS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+# name -> (min args, max args)
+_FUNCTIONS = {
+    "min": (2, None), "max": (2, None), "abs": (1, 1), "clamp": (3, 3),
+    "sqrt": (1, 1), "exp": (1, 1), "log": (1, 1),
+}
+
+_kernels: Dict[str, Callable] = {}
+
+def formula_hash(expression: str) -> str:
+    return hashlib.sha256(expression.strip().encode("utf-8")).hexdigest()
+
+def parse_formula(expression: str, allowed_names: Iterable[str] = None) -> ast.Expression:
+    """Parses and validates an expression; raises FormulaError with a readable message."""
+    expression = (expression or "").strip()
+    if not expression:
+        raise FormulaError("Formula is empty")
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise FormulaError(f"Formula is longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise FormulaError(f"Syntax error at column {e.offset}: {e.msg}")
+
+    allowed = set(allowed_names) if allowed_names is not None else None
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_NODES:
+        raise FormulaError("Formula is too complex")
+    called = {id(n.func) for n in nodes if isinstance(n, ast.Call)}
+    for node in nodes:
+        if isinstance(node, (ast.Expression, ast.Load, ast.And, ast.Or) + _BIN_OPS + _UNARY_OPS + _CMP_OPS):
+            continue
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, (int, float, bool)):
+                continue
+            raise FormulaError(f"Unsupported constant: {node.value!r}")
+        if isinstance(node, ast.Name):
+            if id(node) in called:
+                continue
+            if node.id in _FUNCTIONS or node.id.startswith("_") or (allowed is not None and node.id not in allowed):
+                raise FormulaError(f"Unknown variable: {node.id}")
+            continue
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+                raise FormulaError("Only min, max, abs, clamp, sqrt, exp and log can be called")
+            lo, hi = _FUNCTIONS[node.func.id]
+            if len(node.args) < lo or (hi is not None and len(node.args) > hi):
+                raise FormulaError(f"Wrong number of arguments to {node.func.id}()")
+            continue
+        if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp)):
+            if isinstance(node, ast.BinOp) and not isinstance(node.op, _BIN_OPS):
+                raise FormulaError("Only + - * / ** are supported")
+            continue
+        raise FormulaError(f"Unsupported syntax: {type(node).__name__}")
+    return tree
+
+def _np(attr: str) -> ast.Attribute:
+    return ast.Attribute(value=ast.Name(id="np", ctx=ast.Load()), attr=attr, ctx=ast.Load())
+
+def _call(attr: str, *args) -> ast.Call:
+    return ast.Call(func=_np(attr), args=list(args), keywords=[])
+
+class _ToNumpy(ast.NodeTransformer):
+    """Rewrites scalar syntax into elementwise NumPy calls."""
+
+    def visit_Constant(self, node):
+        # NumPy floats overflow to inf instead of raising (or, for ints, computing 10**10**10 exactly)
+        if isinstance(node.value, bool):
+            return node
+        return _call("float64", ast.Constant(value=float(node.value)))
+
+    def visit_BoolOp(self, node):
+        values = [self.visit(v) for v in node.values]
+        fn = "logical_and" if isinstance(node.op, ast.And) else "logical_or"
+        result = values[0]
+        for v in values[1:]:
+            result = _call(fn, result, v)
+        return result
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return _call("logical_not", operand)
+        return ast.UnaryOp(op=node.op, operand=operand)
+
+    def visit_Compare(self, node):
+        operands = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        pairs = [ast.Compare(left=a, ops=[op], comparators=[b])
+                 for a, op, b in zip(operands, node.ops, operands[1:])]
+        result = pairs[0]
+        for p in pairs[1:]:
+            result = _call("logical_and", result, p)
+        return result
+
+    def visit_IfExp(self, node):
+        return _call("where", self.visit(node.test), self.visit(node.body), self.visit(node.orelse))
+
+    def visit_Call(self, node):
+        name = node.func.id
+        args = [self.visit(a) for a in node.args]
+        if name in ("min", "max"):
+            fn = "minimum" if name == "min" else "maximum"
+            result = args[0]
+            for a in args[1:]:
+                result = _call(fn, result, a)
+            return result
+        if name == "clamp":
+            return _call("minimum", _call("maximum", args[0], args[1]), args[2])
+        return _call(name, *args)
+
+def compile_formula(expression: str) -> Callable[[Dict[str, object]], np.ndarray]:
+    """
+    Returns a kernel taking a dict of NumPy arrays / scalars and returning the formula's
+    value for every row. Name checks belong to parse_formula; this only enforces the syntax.
+    """
+    key = formula_hash(expression)
+    kernel = _kernels.get(key)
+    if kernel is None:
+        tree = _ToNumpy().visit(parse_formula(expression))
+        code = compile(ast.fix_missing_locations(tree), "<formula>", "eval")
+
+        def kernel(variables, _code=code):
+            # One namespace, np written last: no variable (e.g. a setting named "np") can shadow NumPy
+            namespace = {**variables, "np": np, "__builtins__": {}}
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                return eval(_code, namespace)
+
+        _kernels[key] = kernel
+    return kernel
+
+def formula_variables(expression: str) -> set:
+    """Variable names an expression reads."""
+    tree = parse_formula(expression)
+    called = {id(n.func) for n in ast.walk(tree) if isinstance(n, ast.Call)}
+    return {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and id(n) not in called}
@@ -1,13 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.core.database import engine, Base, AsyncSessionLocal
+from app.core.database import engine, db_url, is_in_memory, Base, AsyncSessionLocal, pool_stats
 from app.api import api_router
+from app.api.dependencies.auth import get_current_user
 from app.models.markets import Market
+from app.services.recalculator import shutdown_recalc_pool
+from app.services.change_feed import change_feed
+from app.services.freshness import stale_sweeper
+from app.services.portfolio_store import portfolio_store
+from app.services.rollups import ensure_rollups
 
 load_dotenv()
 
@@ -23,6 +29,8 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cache freshness (services/freshness.py) reported on list/summary/export responses
+    expose_headers=["X-Config-Generation", "X-Stale-Skus"],
 )
 
 async def seed_markets():
@@ -35,15 +43,43 @@ async def seed_markets():
                 session.add(Market(market_name=m))
             await session.commit()
 
+def _creates_schema() -> bool:
+    """
+    The schema is normally owned by Alembic (`alembic upgrade head`, run once per deploy), so
+    workers start without DDL. SCHEMA_BOOTSTRAP=create_all restores the create-on-startup
+    behaviour for local development; an in-memory SQLite database always needs it, since no
+    other process can migrate it.
+    """
+    return is_in_memory(db_url) or os.getenv("SCHEMA_BOOTSTRAP", "migrations") == "create_all"
+
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        # Create all tables if they don't exist
-        await conn.run_sync(Base.metadata.create_all)
-    await seed_markets()
+    if _creates_schema():
+        async with engine.begin() as conn:
+            # Create all tables if they don't exist
+            await conn.run_sync(Base.metadata.create_all)
+        await seed_markets()
+    async with AsyncSessionLocal() as session:
+        await ensure_rollups(session)
+    await change_feed.start(engine)
+    async with AsyncSessionLocal() as session:
+        await portfolio_store.start(session)
+    stale_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await change_feed.stop()
+    await portfolio_store.stop()
+    await stale_sweeper.stop()
+    shutdown_recalc_pool()
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the SKU Selection Tool API"}
 
+@app.get("/health/pools", dependencies=[Depends(get_current_user)])
+def read_pool_stats():
+    """Connection-pool utilization of the write and (if configured) read engines."""
+    return pool_stats()
+
 app.include_router(api_router, prefix="/api")
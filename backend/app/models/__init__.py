@@ -1,7 +1,14 @@
-from app.models.settings import GlobalSetting
+from app.models.settings import GlobalSetting, ScoringFormula, ConfigGeneration
 from app.models.channels import ChannelConfig, MarketChannelCTS
 from app.models.skus import SkuRecord, SkuCalculationCache
 from app.models.markets import Market
+from app.models.users import User
+from app.models.rollups import PortfolioRollup
+from app.models.projections import SkuProjection
+from app.models.history import ConfigVersion, RecommendationHistory
+from app.models.duplicates import SkuMinhash
+from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig, ChannelRampCurve
+from app.models.recalc_queue import RecalcJob, RecalcTask
 from app.core.database import Base
 
 # This ensures all models are imported and registered for Alembic/SQLAlchemy
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, LargeBinary, BigInteger
+from app.core.database import Base
+
+class SkuMinhash(Base):
+    """
+    Near-duplicate index entry per SKU (see services/duplicates.py): the MinHash signature of
+    its name/brand/category shingles and one LSH bucket key per band. Rows whose `source` no
+    longer matches the SKU are recomputed by refresh_duplicate_index().
+    """
+    __tablename__ = "sku_minhash"
+
+    sku_id = Column(String, primary_key=True)
+    # sku_name|brand|category the signature was computed from
+    source = Column(String, nullable=False)
+    # NUM_PERM little-endian uint32 hash minimums
+    signature = Column(LargeBinary, nullable=False)
+
+    # One indexed bucket key per LSH band, so a SKU's candidates are index probes
+    band_0 = Column(BigInteger, nullable=False, index=True)
+    band_1 = Column(BigInteger, nullable=False, index=True)
+    band_2 = Column(BigInteger, nullable=False, index=True)
+    band_3 = Column(BigInteger, nullable=False, index=True)
+    band_4 = Column(BigInteger, nullable=False, index=True)
+    band_5 = Column(BigInteger, nullable=False, index=True)
+    band_6 = Column(BigInteger, nullable=False, index=True)
+    band_7 = Column(BigInteger, nullable=False, index=True)
+    band_8 = Column(BigInteger, nullable=False, index=True)
+    band_9 = Column(BigInteger, nullable=False, index=True)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, String, Integer, SmallInteger, REAL, DateTime, Index, func
+from app.core.database import Base
+
+class ConfigVersion(Base):
+    """One row per distinct scoring configuration the portfolio has been scored under (see services/history.py)."""
+    __tablename__ = "config_versions"
+
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    # sha256 of the CalculationEngine snapshot: settings, market/channel/category config, formulas, ramp curves
+    fingerprint = Column(String(64), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class RecommendationHistory(Base):
+    """
+    Append-only per-SKU snapshots, written only when a SKU's recommendation, score or GM$ changes.
+    Range-partitioned by month on recorded_at; partitions are created on demand.
+    """
+    __tablename__ = "recommendation_history"
+
+    # No FK: history outlives deleted SKUs
+    sku_id = Column(String, primary_key=True)
+    recorded_at = Column(DateTime(timezone=True), primary_key=True)
+    config_version = Column(Integer, nullable=False)
+    # services.history.RECOMMENDATION_CODES
+    recommendation = Column(SmallInteger)
+    score = Column(REAL)
+    gm_dollar = Column(REAL)
+
+    __table_args__ = (
+        # "What changed between versions": SKUs with rows in a version range...
+        Index("ix_recommendation_history_version_sku", "config_version", "sku_id"),
+        # ...and each SKU's state as of a version
+        Index("ix_recommendation_history_sku_version", "sku_id", "config_version", "recorded_at"),
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
+    )
@@ -57,3 +57,10 @@ class MarketCategoryConfig(Base):
 
     # Relationships
     market = relationship("MarketConfig", back_populates="category_overrides")
+
+class ChannelRampCurve(Base):
+    __tablename__ = "channel_ramp_curves"
+
+    channel = Column(String, primary_key=True)
+    # Comma-separated share of steady-state demand per ramp month, e.g. "0.25,0.5,0.75,1.0"; the last value holds
+    curve = Column(String, nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Float, ForeignKey, JSON
+from sqlalchemy.dialects.postgresql import ARRAY
+from app.core.database import Base
+
+class SkuProjection(Base):
+    """Monthly unit projections per scenario, one array element per month (see CalculationEngine.project)."""
+    __tablename__ = "sku_projections"
+
+    sku_id = Column(String, ForeignKey("sku_records.sku_id"), primary_key=True)
+
+    # Per-unit values turn units into revenue and GM$ when curves are aggregated
+    unit_price = Column(Float, nullable=False)
+    gm_per_unit = Column(Float, nullable=False)
+
+    # float[] on Postgres; a JSON list in the embedded SQLite mode
+    units_base = Column(ARRAY(Float).with_variant(JSON(), "sqlite"), nullable=False)
+    units_best = Column(ARRAY(Float).with_variant(JSON(), "sqlite"), nullable=False)
+    units_worst = Column(ARRAY(Float).with_variant(JSON(), "sqlite"), nullable=False)
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index, func
+from app.core.database import Base
+
+class RecalcJob(Base):
+    """One queued full recalculation, split into RecalcTask partitions (see services/recalc_queue.py)."""
+    __tablename__ = "recalc_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Config generation current when the job was queued
+    config_generation = Column(Integer, nullable=False, default=0)
+    sku_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class RecalcTask(Base):
+    """
+    One sku_id range of a job, claimed by a worker with FOR UPDATE SKIP LOCKED.
+    status: pending -> running -> done, or failed after RECALC_TASK_MAX_ATTEMPTS;
+    cancelled when a newer job supersedes it before it was claimed.
+    """
+    __tablename__ = "recalc_tasks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(Integer, ForeignKey("recalc_jobs.id", ondelete="CASCADE"), nullable=False)
+    # [lo_sku_id, hi_sku_id); a null bound is open
+    lo_sku_id = Column(String, nullable=True)
+    hi_sku_id = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # host:pid of the worker holding (or last holding) the task
+    worker = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    sku_count = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Claiming scans the open tasks in order; progress groups a job's tasks by status
+        Index("ix_recalc_tasks_status_id", "status", "id"),
+        Index("ix_recalc_tasks_job_status", "job_id", "status"),
+    )
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, Float
+from app.core.database import Base
+
+class PortfolioRollup(Base):
+    """Pre-aggregated cache metrics, maintained by delta on every cache write (see services/rollups.py)."""
+    __tablename__ = "portfolio_rollups"
+
+    # Empty string stands in for a missing market/channel/recommendation so the key stays non-null
+    market = Column(String, primary_key=True)
+    channel = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    recommendation = Column(String, primary_key=True)
+
+    sku_count = Column(Integer, nullable=False, default=0)
+    # SKUs with a GM% at all; avg_gm_pct divides gm_pct_sum by this rather than sku_count
+    gm_pct_count = Column(Integer, nullable=False, default=0)
+    revenue_sum = Column(Float, nullable=False, default=0.0)
+    gm_dollar_sum = Column(Float, nullable=False, default=0.0)
+    gm_base_sum = Column(Float, nullable=False, default=0.0)
+    gm_best_sum = Column(Float, nullable=False, default=0.0)
+    gm_worst_sum = Column(Float, nullable=False, default=0.0)
+    gm_pct_sum = Column(Float, nullable=False, default=0.0)
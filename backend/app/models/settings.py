@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float
+from sqlalchemy import Column, String, Float, Integer, Text
 from app.core.database import Base
 
 class GlobalSetting(Base):
@@ -6,3 +6,20 @@ class GlobalSetting(Base):
 
     setting_key = Column(String, primary_key=True, index=True)
     setting_value = Column(Float, nullable=False)
+
+class ScoringFormula(Base):
+    __tablename__ = "scoring_formulas"
+
+    # One of calculator.DEFAULT_FORMULAS; a missing row means the built-in formula is used
+    formula_key = Column(String, primary_key=True, index=True)
+    expression = Column(Text, nullable=False)
+
+class ConfigGeneration(Base):
+    """
+    A single row counting config writes that can change scores. Every cache row is stamped with
+    the generation it was scored under, so a write marks the whole portfolio stale in O(1).
+    """
+    __tablename__ = "config_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False)
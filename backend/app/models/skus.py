@@ -36,6 +36,10 @@ class SkuRecord(Base):
     score_channel_diff = Column(Integer, nullable=True)
     score_story_cohesion = Column(Integer, nullable=True)
     score_operational_synergy = Column(Integer, nullable=True)
+    # Derived from the SKU's (market, category) price ladder by services/synergy.py; used in
+    # place of score_price_ladder / score_channel_diff when the computed_synergy setting is on
+    computed_price_ladder = Column(Integer, nullable=True)
+    computed_channel_diff = Column(Integer, nullable=True)
     
     score_regulatory_delay = Column(Integer, nullable=True)
     score_retail_listing = Column(Integer, nullable=True)
@@ -79,7 +83,20 @@ class SkuCalculationCache(Base):
     monthly_gm_base = Column(Float, nullable=True)
     monthly_gm_best = Column(Float, nullable=True)
     monthly_gm_worst = Column(Float, nullable=True)
+
+    # Working capital & inventory feasibility
+    initial_stock_investment = Column(Float, nullable=True)
+    moq_coverage_base = Column(Float, nullable=True)
+    moq_coverage_best = Column(Float, nullable=True)
+    moq_coverage_worst = Column(Float, nullable=True)
+    days_of_cover = Column(Float, nullable=True)
+    expiry_risk = Column(Float, nullable=True)
+    pass_moq_coverage = Column(Boolean, nullable=True)
+    pass_expiry = Column(Boolean, nullable=True)
     
+    # config_generation.generation this row was scored under; older rows are stale (see services/freshness.py)
+    config_generation = Column(Integer, nullable=True, index=True)
+
     rank_base = Column(Integer, nullable=True)
     rank_best = Column(Integer, nullable=True)
     rank_worst = Column(Integer, nullable=True)
@@ -11,6 +11,13 @@ class GlobalSettingResponse(GlobalSettingCreate):
     class Config:
         from_attributes = True
 
+class ScoringFormulaResponse(BaseModel):
+    formula_key: str
+    expression: str
+    default_expression: str
+    is_default: bool
+    variables: List[str]
+
 class ChannelConfigBase(BaseModel):
     base_units_per_month: int
     channel_weight: float
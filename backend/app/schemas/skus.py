@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class SkuCalculationCacheResponse(BaseModel):
     gm_dollar_per_unit: Optional[float] = None
@@ -27,7 +27,18 @@ class SkuCalculationCacheResponse(BaseModel):
     monthly_gm_base: Optional[float] = None
     monthly_gm_best: Optional[float] = None
     monthly_gm_worst: Optional[float] = None
+
+    initial_stock_investment: Optional[float] = None
+    moq_coverage_base: Optional[float] = None
+    moq_coverage_best: Optional[float] = None
+    moq_coverage_worst: Optional[float] = None
+    days_of_cover: Optional[float] = None
+    expiry_risk: Optional[float] = None
+    pass_moq_coverage: Optional[bool] = None
+    pass_expiry: Optional[bool] = None
     
+    config_generation: Optional[int] = None
+
     rank_base: Optional[int] = None
     rank_best: Optional[int] = None
     rank_worst: Optional[int] = None
@@ -82,8 +93,43 @@ class SkuRecordUpdate(SkuRecordBase):
     brand: Optional[str] = None
     category: Optional[str] = None
 
+class SkuPatch(SkuRecordUpdate):
+    sku_id: str
+
+class SkuBulkFilter(BaseModel):
+    sku_ids: List[str] = []
+    market: Optional[str] = None
+    channel: Optional[str] = None
+    category: Optional[str] = None
+    brand: Optional[str] = None
+    recommendation: Optional[str] = None
+
+class SkuBulkPatchRequest(BaseModel):
+    # Either per-SKU partial updates...
+    updates: List[SkuPatch] = []
+    # ...or one assignment applied to every SKU matching the filter
+    filter: Optional[SkuBulkFilter] = None
+    assign: Optional[SkuRecordUpdate] = None
+
 class SkuRecordResponse(SkuRecordCreate):
+    computed_price_ladder: Optional[int] = None
+    computed_channel_diff: Optional[int] = None
     cache: Optional[SkuCalculationCacheResponse] = None
 
     class Config:
         from_attributes = True
+
+class GoalSeekRequest(BaseModel):
+    sku_ids: List[str] = []
+    # SKU input to solve for: local_list_price, landed_cost or a score_* field
+    variable: str = "local_list_price"
+    # "gm_floor" (gm_pct reaches gm_floor_pct) or "launch_now" (recommended Launch Now)
+    goal: str = "gm_floor"
+
+class PlacementRequest(BaseModel):
+    sku_ids: List[str] = []
+    markets: List[str] = []
+    channels: List[str] = []
+    top_k: Optional[int] = None
+    # Cell values to include in the ranked matrix (see app.services.placements.PLACEMENT_FIELDS)
+    fields: List[str] = ["final_recommendation", "monthly_gm_base"]
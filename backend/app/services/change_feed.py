@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Postgres LISTEN/NOTIFY channel that fans cache deltas out across API workers
+CHANNEL = "sku_cache_changes"
+# NOTIFY payloads are capped at 8000 bytes; stay comfortably under it
+MAX_NOTIFY_BYTES = 7000
+SUBSCRIBER_QUEUE_SIZE = 256
+# Backoff between attempts to re-LISTEN after the listener connection drops
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+# Session.info key of messages waiting for the session to commit (in-process delivery)
+PENDING_KEY = "change_feed_pending"
+
+def cache_delta(old: dict, new: dict) -> dict:
+    """Fields of `new` whose value differs from `old` (a missing cache row counts as all None)."""
+    old = old or {}
+    return {k: v for k, v in new.items() if k != "sku_id" and old.get(k) != v}
+
+class ChangeFeed:
+    """
+    Publishes SkuCalculationCache deltas ({"sku_id": ..., "fields": {...}}, or
+    {"sku_id": ..., "deleted": true}) to subscribers. An edit that changed the SKU record
+    itself also carries the new values as "record": {...}. {"resync": true} tells subscribers
+    to reload everything, e.g. after an upload replaced SKU records wholesale.
+
+    On Postgres, deltas go out with pg_notify inside the writer's transaction, so they are
+    only delivered once it commits, and every worker's listener fans them out locally.
+    If the listener connection drops it is re-established with backoff, and local
+    subscribers are told to resync, since whatever was notified meanwhile is lost.
+    On other dialects deltas are fanned out in-process, also once the writer's session commits.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._listen_conn = None
+        self._engine = None
+        self._reconnect_task = None
+
+    @property
+    def listening(self) -> bool:
+        return self._listen_conn is not None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _fan_out(self, message: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and tell it to refetch instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"resync": True})
+
+    def _deliver_pending(self, session):
+        for message in session.info.pop(PENDING_KEY, []):
+            self._fan_out(message)
+
+    def _discard_pending(self, session, previous_transaction=None):
+        session.info.pop(PENDING_KEY, None)
+
+    async def _send(self, db: AsyncSession, messages: list):
+        # Publish by dialect, not by whether this process listens, so other workers never miss a delta
+        if db.bind.dialect.name == "postgresql":
+            await db.execute(
+                text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+                {"channel": CHANNEL, "payloads": messages},
+            )
+            return
+        session = db.sync_session
+        if PENDING_KEY not in session.info:
+            if not event.contains(session, "after_commit", self._deliver_pending):
+                event.listen(session, "after_commit", self._deliver_pending)
+                event.listen(session, "after_soft_rollback", self._discard_pending)
+            session.info[PENDING_KEY] = []
+        session.info[PENDING_KEY] += [json.loads(message) for message in messages]
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._fan_out(json.loads(payload))
+
+    def _on_listener_closed(self, connection):
+        conn, self._listen_conn = self._listen_conn, None
+        if self._engine is not None and self._reconnect_task is None:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect(conn))
+
+    async def _listen(self):
+        conn = await self._engine.connect()
+        try:
+            raw = (await conn.get_raw_connection()).driver_connection
+            await raw.add_listener(CHANNEL, self._on_notify)
+            raw.add_termination_listener(self._on_listener_closed)
+        except BaseException:
+            await conn.close()
+            raise
+        self._listen_conn = conn
+
+    async def _reconnect(self, dead_conn):
+        try:
+            if dead_conn is not None:
+                try:
+                    await dead_conn.invalidate()
+                except Exception:
+                    pass
+            delay = RECONNECT_MIN_SECONDS
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception:
+                    logger.warning("Change feed listener reconnect failed; retrying in %.1fs", delay, exc_info=True)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            logger.info("Change feed listener reconnected")
+            self._fan_out({"resync": True})
+        finally:
+            self._reconnect_task = None
+
+    async def start(self, engine):
+        if engine.dialect.name != "postgresql":
+            return
+        self._engine = engine
+        await self._listen()
+
+    async def stop(self):
+        self._engine = None
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+        if self._listen_conn is not None:
+            conn, self._listen_conn = self._listen_conn, None
+            await conn.close()
+
+    async def publish(self, db: AsyncSession, deltas: list):
+        """Call before committing `db`; delivery happens when it commits."""
+        deltas = [d for d in deltas if d.get("fields") or d.get("record") or d.get("deleted")]
+        if not deltas:
+            return
+        await self._send(db, [json.dumps({"deltas": chunk}, default=str) for chunk in _chunk_deltas(deltas)])
+
+    async def publish_resync(self, db: AsyncSession):
+        """Tells subscribers to reload rather than patch; call before committing `db`, like publish()."""
+        await self._send(db, [json.dumps({"resync": True})])
+
+    async def events(self, keepalive_seconds: float = 15.0):
+        """Server-Sent Events frames for one subscriber, until the client disconnects."""
+        queue = self.subscribe()
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), keepalive_seconds)
+                    yield f"data: {json.dumps(message, default=str)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+def _chunk_deltas(deltas: list):
+    chunk, size = [], 0
+    for delta in deltas:
+        delta_size = len(json.dumps(delta, default=str)) + 1
+        if chunk and size + delta_size > MAX_NOTIFY_BYTES:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(delta)
+        size += delta_size
+    if chunk:
+        yield chunk
+
+change_feed = ChangeFeed()
@@ -0,0 +1,122 @@
+"""
+Set-based config writes, and which SKUs a config edit reaches.
+
+Settings and formulas feed every SKU's score. A market's config only reaches the SKUs
+targeting it, a market-channel row the SKUs of that market sold in that channel, and a
+category override those of its category too (the engine files SKUs without a category
+under "Unknown"). sku_scope() turns a set of edited rows into one WHERE clause over
+sku_records, for config_changed() to rescore just those SKUs.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, false, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import DEFAULT_FORMULAS, RESERVED_SETTING_KEYS, validate_formula
+from app.core.database import upsert
+from app.core.formulas import FormulaError
+from app.models.settings import GlobalSetting, ScoringFormula
+from app.models.skus import SkuRecord
+
+UNKNOWN_CATEGORY = "Unknown"
+
+def setting_errors(keys: Iterable[str]) -> Dict[str, str]:
+    """Validation errors by setting key, for keys that would shadow NumPy or an engine variable in formulas."""
+    return {key: "Reserved name: formulas use it for NumPy or an engine variable"
+            for key in keys if key in RESERVED_SETTING_KEYS}
+
+async def write_settings(db: AsyncSession, values: Dict[str, float]):
+    """Inserts or updates global settings in one statement. Does not commit. Raises ValueError for a reserved key."""
+    if not values:
+        return
+    errors = setting_errors(values)
+    if errors:
+        raise ValueError(f"Reserved setting keys: {', '.join(sorted(errors))}")
+    stmt = upsert(db, GlobalSetting.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=["setting_key"], set_={"setting_value": stmt.excluded.setting_value})
+    await db.execute(stmt, [{"setting_key": k, "setting_value": v} for k, v in values.items()])
+
+def formula_errors(expressions: Dict[str, Optional[str]], setting_keys: Iterable[str]) -> Dict[str, str]:
+    """Validation errors by formula key; an empty or null expression (restore the built-in one) is always valid."""
+    setting_keys = set(setting_keys)
+    errors = {}
+    for key, expression in expressions.items():
+        if key not in DEFAULT_FORMULAS:
+            errors[key] = "Unknown formula"
+        elif expression and expression.strip():
+            try:
+                validate_formula(key, expression, setting_keys)
+            except FormulaError as e:
+                errors[key] = str(e)
+    return errors
+
+async def write_formulas(db: AsyncSession, expressions: Dict[str, Optional[str]]):
+    """
+    Sets validated formulas by key: one upsert for the custom ones, one delete for those
+    restored to (or set to) the built-in expression. Does not commit.
+    """
+    custom = {k: e.strip() for k, e in expressions.items() if e and e.strip() and e.strip() != DEFAULT_FORMULAS[k]}
+    restored = [k for k in expressions if k not in custom]
+    if restored:
+        await db.execute(delete(ScoringFormula).where(ScoringFormula.formula_key.in_(restored)))
+    if custom:
+        stmt = upsert(db, ScoringFormula.__table__)
+        stmt = stmt.on_conflict_do_update(index_elements=["formula_key"], set_={"expression": stmt.excluded.expression})
+        await db.execute(stmt, [{"formula_key": k, "expression": e} for k, e in custom.items()])
+
+async def upsert_config_rows(db: AsyncSession, model, rows: List[dict]):
+    """
+    Inserts or updates rows of a config table keyed by its primary key. Each row sets only the
+    columns it holds (new rows take the column defaults for the rest); rows setting the same
+    columns share one statement. Does not commit.
+    """
+    table = model.__table__
+    keys = [c.name for c in table.primary_key.columns]
+    by_columns = {}
+    for row in rows:
+        by_columns.setdefault(tuple(sorted(row)), []).append(row)
+    for columns, group in by_columns.items():
+        stmt = upsert(db, table)
+        values = [c for c in columns if c not in keys]
+        if values:
+            stmt = stmt.on_conflict_do_update(index_elements=keys, set_={c: stmt.excluded[c] for c in values})
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+        await db.execute(stmt, group)
+
+async def delete_config_rows(db: AsyncSession, model, keys: List[tuple]):
+    """Deletes rows of a config table by primary key tuple, in one statement. Does not commit."""
+    if not keys:
+        return
+    columns = list(model.__table__.primary_key.columns)
+    await db.execute(delete(model).where(tuple_(*columns).in_(keys)))
+
+async def existing_keys(db: AsyncSession, model, keys: Iterable[tuple]) -> set:
+    """Which of the given primary key tuples exist in a config table."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    columns = list(model.__table__.primary_key.columns)
+    return set((await db.execute(select(*columns).where(tuple_(*columns).in_(keys)))).tuples().all())
+
+def _category_filter(category: str):
+    if category == UNKNOWN_CATEGORY:
+        return or_(SkuRecord.category.in_([category, ""]), SkuRecord.category.is_(None))
+    return SkuRecord.category == category
+
+def sku_scope(markets: Iterable[str] = (), channels: Iterable[tuple] = (), categories: Iterable[tuple] = ()):
+    """
+    WHERE clause for the SKUs scored against the given market, (market, channel) and
+    (market, channel, category) configs. Rows already covered by a broader one are dropped.
+    """
+    markets = set(markets)
+    channels = {(m, ch) for m, ch in channels if m not in markets}
+    categories = {(m, ch, cat) for m, ch, cat in categories if m not in markets and (m, ch) not in channels}
+    clauses = []
+    if markets:
+        clauses.append(SkuRecord.target_market.in_(markets))
+    clauses += [and_(SkuRecord.target_market == m, SkuRecord.primary_channel == ch) for m, ch in channels]
+    clauses += [and_(SkuRecord.target_market == m, SkuRecord.primary_channel == ch, _category_filter(cat))
+                for m, ch, cat in categories]
+    return or_(*clauses) if clauses else false()
@@ -0,0 +1,323 @@
+"""
+Near-duplicate detection over SKU name, brand and category.
+
+Each SKU is reduced to a set of shingles (character trigrams of its normalized name, plus one
+token each for brand and category) and a NUM_PERM-value MinHash signature of that set, whose
+agreement rate estimates the Jaccard similarity of two SKUs. The head of the signature is cut
+into LSH_BANDS bands of LSH_ROWS values; SKUs sharing any band's bucket are candidate pairs, so
+only SKUs that are likely similar are ever compared (pairs at Jaccard 0.7 are caught with
+~98% probability, pairs at 0.2 under 8% of the time).
+
+The index (sku_minhash) is maintained incrementally: refresh_duplicate_index() recomputes
+only the SKUs whose name/brand/category text changed since their row was written, and runs
+after every upload as well as before clusters are reported. Signatures and band keys are
+computed in NumPy for whole chunks of SKUs at a time.
+"""
+import asyncio
+import re
+import zlib
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy import text, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import upsert
+from app.models.duplicates import SkuMinhash
+from app.models.skus import SkuRecord, SkuCalculationCache
+
+NUM_PERM = 60
+# Banding uses the first LSH_BANDS * LSH_ROWS signature values; similarity is estimated from all of them
+LSH_BANDS = 10
+LSH_ROWS = 3
+BAND_COLUMNS = [f"band_{b}" for b in range(LSH_BANDS)]
+DEFAULT_THRESHOLD = 0.7
+# Buckets larger than this (e.g. hundreds of identically named SKUs) are not enumerated pairwise;
+# each member is compared with its LARGE_BUCKET_WINDOW neighbours instead
+MAX_BUCKET_PAIRS_SIZE = 100
+LARGE_BUCKET_WINDOW = 8
+INDEX_CHUNK_SIZE = 20000
+PAIR_CHUNK_SIZE = 1 << 20
+
+# Universal hashing (a*x + b) mod p with p = 2^32 - 5, so products of 32-bit values fit uint64
+_PRIME = np.uint64(4294967291)
+_rng = np.random.RandomState(20240607)
+_A = _rng.randint(1, 4294967291, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 4294967291, size=NUM_PERM, dtype=np.uint64)
+# Odd 64-bit multipliers combining a band's rows into one bucket key
+_BAND_MIX = (_rng.randint(1, 2 ** 62, size=LSH_ROWS, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+# sku_name|brand|category in SQL; must match source_text()
+_SOURCE_SQL = "s.sku_name || '|' || COALESCE(s.brand, '') || '|' || s.category"
+
+def _normalize(value) -> str:
+    return _NON_ALNUM.sub(" ", str(value or "").lower()).strip()
+
+def source_text(sku_name: str, brand: str, category: str) -> str:
+    return f"{sku_name}|{brand or ''}|{category}"
+
+def _token_id(kind: str, value: str, cache: dict) -> int:
+    key = (kind, value)
+    if key not in cache:
+        cache[key] = zlib.crc32(f"{kind}:{value}".encode("utf-8"))
+    return cache[key]
+
+def _shingles(names: Sequence[str], brands: Sequence[str], categories: Sequence[str]) -> tuple:
+    """(shingle ids as uint64, owning row) sorted by owner; every row has at least its category token."""
+    n = len(names)
+    # Name trigrams, vectorized over one byte buffer of all (space-padded) names
+    encoded = [f" {_normalize(name)} ".encode("utf-8") for name in names]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=n)
+    buf = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    counts = np.maximum(lengths - 2, 0)
+    starts = np.cumsum(lengths) - lengths
+    first = np.cumsum(counts) - counts
+    owners = np.repeat(np.arange(n), counts)
+    pos = np.repeat(starts, counts) + (np.arange(counts.sum()) - np.repeat(first, counts))
+    trigrams = (buf[pos] << np.uint64(16)) | (buf[pos + 1] << np.uint64(8)) | buf[pos + 2]
+
+    cache = {}
+    brand_rows = [i for i, b in enumerate(brands) if _normalize(b)]
+    brand_ids = np.array([_token_id("brand", _normalize(brands[i]), cache) for i in brand_rows], dtype=np.uint64)
+    category_ids = np.array([_token_id("category", _normalize(c), cache) for c in categories], dtype=np.uint64)
+
+    ids = _mix(np.concatenate([trigrams, brand_ids, category_ids]))
+    rows = np.concatenate([owners, np.array(brand_rows, dtype=np.int64), np.arange(n)])
+    order = np.argsort(rows, kind="stable")
+    return ids[order], rows[order]
+
+def _mix(ids: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, truncated to 32 bits. Trigram codes are highly structured and a
+    linear hash of them alone is far from min-wise independent."""
+    with np.errstate(over="ignore"):
+        z = ids + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return z & np.uint64(0xFFFFFFFF)
+
+def minhash_signatures(names: Sequence[str], brands: Sequence[str], categories: Sequence[str]) -> np.ndarray:
+    """(n, NUM_PERM) uint32 MinHash signatures."""
+    n = len(names)
+    ids, rows = _shingles(names, brands, categories)
+    segment_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    signatures = np.empty((n, NUM_PERM), dtype=np.uint32)
+    for k in range(NUM_PERM):
+        hashed = (_A[k] * ids + _B[k]) % _PRIME
+        signatures[:, k] = np.minimum.reduceat(hashed, segment_starts)
+    return signatures
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """(n, LSH_BANDS) non-negative int64 bucket keys, one per band of LSH_ROWS signature values."""
+    values = signatures[:, :LSH_BANDS * LSH_ROWS].astype(np.uint64).reshape(len(signatures), LSH_BANDS, LSH_ROWS)
+    with np.errstate(over="ignore"):
+        mixed = (values * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+    return (mixed >> np.uint64(1)).astype(np.int64)
+
+def _signature_array(blobs: Sequence[bytes]) -> np.ndarray:
+    return np.frombuffer(b"".join(blobs), dtype="<u4").reshape(len(blobs), NUM_PERM)
+
+def _index_rows(rows: list) -> list:
+    """sku_minhash values for (sku_id, sku_name, brand, category) rows. Pure CPU work, run off the event loop."""
+    signatures = minhash_signatures([r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows])
+    keys = band_keys(signatures)
+    blobs = signatures.astype("<u4")
+    return [
+        {"sku_id": r[0], "source": source_text(r[1], r[2], r[3]), "signature": blobs[i].tobytes(),
+         **dict(zip(BAND_COLUMNS, keys[i].tolist()))}
+        for i, r in enumerate(rows)
+    ]
+
+async def refresh_duplicate_index(db: AsyncSession) -> int:
+    """Indexes new SKUs and SKUs whose name/brand/category changed, drops deleted ones, and commits."""
+    stale = (await db.execute(text(f"""
+        SELECT s.sku_id, s.sku_name, s.brand, s.category
+        FROM sku_records s LEFT JOIN sku_minhash m ON m.sku_id = s.sku_id
+        WHERE m.sku_id IS NULL OR m.source <> {_SOURCE_SQL}
+    """))).all()
+    table = SkuMinhash.__table__
+    for start in range(0, len(stale), INDEX_CHUNK_SIZE):
+        values = await asyncio.to_thread(_index_rows, stale[start:start + INDEX_CHUNK_SIZE])
+        stmt = upsert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["sku_id"],
+            set_={c: stmt.excluded[c] for c in ["source", "signature", *BAND_COLUMNS]},
+        )
+        await db.execute(stmt, values)
+    await db.execute(text("DELETE FROM sku_minhash WHERE NOT EXISTS (SELECT 1 FROM sku_records s WHERE s.sku_id = sku_minhash.sku_id)"))
+    await db.commit()
+    return len(stale)
+
+def candidate_pairs(keys: np.ndarray):
+    """
+    Yields (m, 2) arrays of row index pairs sharing a band bucket, one bucket-offset step of one
+    band at a time so memory stays O(rows); a pair sharing several bands is yielded for each.
+    """
+    n, bands = keys.shape
+    for b in range(bands):
+        # Within a bucket, rows that also share the next band's bucket end up adjacent
+        order = np.lexsort((keys[:, (b + 1) % bands], keys[:, b]))
+        bucket = keys[order, b]
+        run_start = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        run_size = np.diff(np.r_[run_start, n])
+        small = np.repeat(run_size, run_size) <= MAX_BUCKET_PAIRS_SIZE
+        # Pair rows d apart within a bucket for d = 1, 2, ...: every pair of a small bucket,
+        # a sliding window over a large one
+        for d in range(1, min(MAX_BUCKET_PAIRS_SIZE, n)):
+            same = bucket[:-d] == bucket[d:]
+            if not same.any():
+                break
+            if d > LARGE_BUCKET_WINDOW:
+                same &= small[:-d]
+            yield np.stack([order[:-d][same], order[d:][same]], axis=1)
+
+def pair_similarity(signatures: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of each pair: the fraction of agreeing signature values."""
+    similarity = np.empty(len(pairs))
+    for start in range(0, len(pairs), PAIR_CHUNK_SIZE):
+        chunk = pairs[start:start + PAIR_CHUNK_SIZE]
+        similarity[start:start + len(chunk)] = (signatures[chunk[:, 0]] == signatures[chunk[:, 1]]).mean(axis=1)
+    return similarity
+
+def connected_components(n: int, pairs: np.ndarray) -> np.ndarray:
+    """Component label (its smallest row index) of each of n rows, joined by `pairs`."""
+    labels = np.arange(n)
+    if not len(pairs):
+        return labels
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        before = labels.copy()
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        # Pointer jumping collapses chains in a few rounds
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, before):
+            return labels
+
+def _cluster_signatures(signatures: np.ndarray, threshold: float) -> tuple:
+    """(component labels, verified pairs, their similarity). Pure CPU work, run off the event loop."""
+    verified_pairs, verified_similarity = [np.empty((0, 2), dtype=np.int64)], [np.empty(0)]
+    # Candidates are verified as they are generated; only pairs above the threshold are kept
+    for pairs in candidate_pairs(band_keys(signatures)):
+        similarity = pair_similarity(signatures, pairs)
+        verified = similarity >= threshold
+        verified_pairs.append(np.sort(pairs[verified], axis=1))
+        verified_similarity.append(similarity[verified])
+    pairs = np.concatenate(verified_pairs)
+    n = len(signatures)
+    # Drop pairs found through more than one band
+    _, index = np.unique(pairs[:, 0] * n + pairs[:, 1], return_index=True)
+    pairs, similarity = pairs[index], np.concatenate(verified_similarity)[index]
+    return connected_components(len(signatures), pairs), pairs, similarity
+
+MEMBER_FIELDS = ["sku_id", "sku_name", "brand", "category", "target_market", "primary_channel",
+                 "final_recommendation", "monthly_revenue"]
+
+async def _load_signatures(db: AsyncSession, market: str = None, category: str = None) -> tuple:
+    query = "SELECT m.sku_id, m.signature FROM sku_minhash m JOIN sku_records s ON s.sku_id = m.sku_id"
+    conditions, params = [], {}
+    if market:
+        conditions.append("s.target_market = :market")
+        params["market"] = market
+    if category:
+        conditions.append("s.category = :category")
+        params["category"] = category
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    rows = (await db.execute(text(query + " ORDER BY m.sku_id"), params)).all()
+    return [r[0] for r in rows], [r[1] for r in rows]
+
+async def _members(db: AsyncSession, sku_ids: list) -> dict:
+    members = {}
+    for start in range(0, len(sku_ids), INDEX_CHUNK_SIZE):
+        result = await db.execute(
+            select(SkuRecord.sku_id, SkuRecord.sku_name, SkuRecord.brand, SkuRecord.category,
+                   SkuRecord.target_market, SkuRecord.primary_channel,
+                   SkuCalculationCache.final_recommendation, SkuCalculationCache.monthly_revenue)
+            .outerjoin(SkuCalculationCache, SkuCalculationCache.sku_id == SkuRecord.sku_id)
+            .where(SkuRecord.sku_id.in_(sku_ids[start:start + INDEX_CHUNK_SIZE]))
+        )
+        members.update({r.sku_id: dict(r._mapping) for r in result.all()})
+    return members
+
+async def find_duplicate_clusters(db: AsyncSession, threshold: float = DEFAULT_THRESHOLD, market: str = None,
+                                  category: str = None, skip: int = 0, limit: int = 100) -> dict:
+    """
+    Groups of SKUs connected by estimated name/brand/category similarity >= `threshold`, largest
+    first. Each cluster reports how many of its SKUs are Launch Now and their summed monthly
+    revenue, i.e. what the duplicates inflate; the totals cover every cluster, not just the page.
+    """
+    await refresh_duplicate_index(db)
+    sku_ids, blobs = await _load_signatures(db, market, category)
+    empty = {"threshold": threshold, "cluster_count": 0, "clustered_skus": 0, "excess_launch_now": 0, "clusters": []}
+    if not sku_ids:
+        return empty
+    labels, pairs, similarity = await asyncio.to_thread(_cluster_signatures, _signature_array(blobs), threshold)
+
+    roots, sizes = np.unique(labels, return_counts=True)
+    roots, sizes = roots[sizes > 1], sizes[sizes > 1]
+    if not len(roots):
+        return empty
+    order = np.lexsort((roots, -sizes))
+    roots, sizes = roots[order], sizes[order]
+    # Lowest verified similarity inside each cluster
+    pair_label = labels[pairs[:, 0]]
+    lowest = {}
+    for label, s in zip(pair_label.tolist(), similarity.tolist()):
+        lowest[label] = min(s, lowest.get(label, 1.0))
+
+    members_by_root = {}
+    for i in np.flatnonzero(np.isin(labels, roots)).tolist():
+        members_by_root.setdefault(int(labels[i]), []).append(sku_ids[i])
+    details = await _members(db, [s for m in members_by_root.values() for s in m])
+
+    excess_launch_now = 0
+    clusters = []
+    for rank, root in enumerate(roots.tolist()):
+        members = [details[s] for s in members_by_root[root] if s in details]
+        launch_now = sum(1 for m in members if m["final_recommendation"] == "Launch Now")
+        excess_launch_now += max(launch_now - 1, 0)
+        if skip <= rank < skip + limit:
+            clusters.append({
+                "size": len(members),
+                "min_similarity": round(lowest.get(root, 1.0), 4),
+                "launch_now": launch_now,
+                "monthly_revenue": sum(m["monthly_revenue"] or 0.0 for m in members),
+                "members": [{f: m[f] for f in MEMBER_FIELDS} for m in members],
+            })
+    return {
+        "threshold": threshold,
+        "cluster_count": len(roots),
+        "clustered_skus": int(sizes.sum()),
+        "excess_launch_now": excess_launch_now,
+        "clusters": clusters,
+    }
+
+async def find_sku_duplicates(db: AsyncSession, sku_id: str, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Near-duplicates of one SKU, most similar first, found by probing its band buckets."""
+    await refresh_duplicate_index(db)
+    entry = await db.get(SkuMinhash, sku_id)
+    if entry is None:
+        return None
+    probes = or_(*[getattr(SkuMinhash, c) == getattr(entry, c) for c in BAND_COLUMNS])
+    rows = (await db.execute(
+        select(SkuMinhash.sku_id, SkuMinhash.signature).where(probes, SkuMinhash.sku_id != sku_id)
+    )).all()
+    if not rows:
+        return []
+    own = _signature_array([entry.signature])[0]
+    similarity = (_signature_array([r.signature for r in rows]) == own).mean(axis=1)
+    matches = sorted(
+        ((float(s), r.sku_id) for s, r in zip(similarity, rows) if s >= threshold),
+        key=lambda m: (-m[0], m[1]),
+    )
+    details = await _members(db, [s for _, s in matches])
+    return [{**{f: details[s][f] for f in MEMBER_FIELDS}, "similarity": round(sim, 4)} for sim, s in matches if s in details]
@@ -1,15 +1,32 @@
+import asyncio
 import pandas as pd
 import io
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func
 from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
 
 from app.models.settings import GlobalSetting
-from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig
-from app.models.skus import SkuRecord, SkuCalculationCache
-from app.core.calculator import CalculationEngine
+from app.models.multidimensional import MarketConfig, MarketChannelConfig
+from app.models.skus import SkuRecord
+from app.services.progress import ImportProgress
+from app.services.recalculator import recalculate_all_skus
+from app.services.rollups import RollupDelta
+from app.services.change_feed import change_feed
+from app.services.duplicates import refresh_duplicate_index
 
-async def parse_and_seed_excel(file_bytes: bytes, db: AsyncSession, mapping: dict = None, default_market: str = None) -> dict:
-    """Parses the Excel file and seeds the database."""
+UPSERT_CHUNK_SIZE = 2000
+
+# Rows decoded from the top of the SKU sheet when looking for its header row
+HEADER_SCAN_ROWS = 50
+
+async def parse_and_seed_excel(source, db: AsyncSession, mapping: dict = None, default_market: str = None, progress: ImportProgress = None) -> dict:
+    """Parses the Excel file and seeds the database.
+
+    `source` is the workbook bytes, or an UploadSession whose staged (and possibly already
+    decoded) workbook is used. Workbook decoding and row coercion run in a worker thread;
+    coerced rows come back in chunks and are upserted here on the event loop.
+    """
     stats = {"settings": 0, "channels": 0, "cts_rows": 0, "skus": 0}
     
     mapping = mapping or {}
@@ -17,65 +34,90 @@ async def parse_and_seed_excel(file_bytes: bytes, db: AsyncSession, mapping: dic
     # Pre-seed the default configurations (so the tool works even if uploading just a SKU list)
     await _seed_default_configs(db)
     
-    with io.BytesIO(file_bytes) as f:
-        # Check available sheets
-        try:
-            excel_file = pd.ExcelFile(f)
-            sheet_names = excel_file.sheet_names
-            
-            # If the user uploaded the full file, update config. Otherwise, skip gracefully.
-            if "SETTINGS" in sheet_names:
-                df_settings = pd.read_excel(excel_file, sheet_name="SETTINGS")
-                await _parse_settings(df_settings, db)
-                stats["settings"] = len(df_settings)
-                
-            if "SCENARIO_SETUP" in sheet_names:
-                df_scenarios = pd.read_excel(excel_file, sheet_name="SCENARIO_SETUP")
-                await _parse_channels(df_scenarios, db)
-                stats["channels"] = 4 
-                
-            if "CTS_Components" in sheet_names:
-                df_cts = pd.read_excel(excel_file, sheet_name="CTS_Components")
-                await _parse_cts(df_cts, db)
-                stats["cts_rows"] = len(df_cts)
-                
-            # Find the SKU list
-            df_skus = _get_sku_df(excel_file)
-            stats["skus"] = await _parse_skus(df_skus, db, mapping, default_market)
-                
-        except Exception as e:
-            print(f"Error parsing Excel file: {e}")
-            raise e
+    try:
+        if progress:
+            await progress.update(stage="reading")
+        if isinstance(source, (bytes, bytearray)):
+            sheets, df_skus = await asyncio.to_thread(read_workbook, io.BytesIO(source))
+        else:
+            sheets, df_skus = await source.workbook()
+
+        # If the user uploaded the full file, update config. Otherwise, skip gracefully.
+        if "SETTINGS" in sheets:
+            await _parse_settings(sheets["SETTINGS"], db)
+            stats["settings"] = len(sheets["SETTINGS"])
+
+        if "SCENARIO_SETUP" in sheets:
+            await _parse_channels(sheets["SCENARIO_SETUP"], db)
+            stats["channels"] = 4 
+
+        if "CTS_Components" in sheets:
+            await _parse_cts(sheets["CTS_Components"], db)
+            stats["cts_rows"] = len(sheets["CTS_Components"])
+
+        stats["skus"] = await _parse_skus(df_skus, db, mapping, default_market, progress)
+
+    except Exception as e:
+        print(f"Error parsing Excel file: {e}")
+        raise e
 
     return stats
 
-def _get_sku_df(excel_file: pd.ExcelFile) -> pd.DataFrame:
-    sheet_names = excel_file.sheet_names
-    sku_sheet = None
+def read_workbook(source, sku_sheet: str = None, header_row: int = None) -> tuple:
+    """
+    Blocking pandas/openpyxl work. Returns the config sheets and the SKU sheet as DataFrames;
+    pass the sheet and header row found by inspect_workbook() to skip detecting them again.
+    """
+    sheets = {}
+    with pd.ExcelFile(source) as excel_file:
+        for name in ("SETTINGS", "SCENARIO_SETUP", "CTS_Components"):
+            if name in excel_file.sheet_names:
+                sheets[name] = pd.read_excel(excel_file, sheet_name=name)
+
+        # Find the SKU list
+        return sheets, _get_sku_df(excel_file, sku_sheet, header_row)
+
+def inspect_workbook(source) -> dict:
+    """Sheet names, the SKU sheet and its header row and columns; decodes only the top rows of the sheet."""
+    with pd.ExcelFile(source) as excel_file:
+        sku_sheet = _find_sku_sheet(excel_file.sheet_names)
+        header_row = _find_header_row(excel_file, sku_sheet)
+        head = pd.read_excel(excel_file, sheet_name=sku_sheet, header=header_row, nrows=0)
+        return {
+            "sheet_names": excel_file.sheet_names,
+            "sku_sheet": sku_sheet,
+            "header_row": header_row,
+            "headers": [str(col).strip() for col in head.columns],
+        }
+
+def _find_sku_sheet(sheet_names: list) -> str:
     if "SKUs Shortlist" in sheet_names:
-        sku_sheet = "SKUs Shortlist"
+        return "SKUs Shortlist"
     elif "Sheet1" in sheet_names:
-        sku_sheet = "Sheet1"
+        return "Sheet1"
     elif len(sheet_names) == 1:
-        sku_sheet = sheet_names[0]
-        
-    if sku_sheet:
-        df_skus = pd.read_excel(excel_file, sheet_name=sku_sheet, header=None)
-        header_row_idx = 0
-        for idx, row in df_skus.iterrows():
-            row_str = str(row.values).lower()
-            if 'sku' in row_str or 'name' in row_str or 'category' in row_str:
-                header_row_idx = idx
-                break
-        return pd.read_excel(excel_file, sheet_name=sku_sheet, header=header_row_idx)
-    else:
-        raise Exception("Could not find a valid SKU sheet in the uploaded file.")
+        return sheet_names[0]
+    raise Exception("Could not find a valid SKU sheet in the uploaded file.")
+
+def _find_header_row(excel_file: pd.ExcelFile, sku_sheet: str) -> int:
+    head = pd.read_excel(excel_file, sheet_name=sku_sheet, header=None, nrows=HEADER_SCAN_ROWS)
+    for idx, row in head.iterrows():
+        row_str = str(row.values).lower()
+        if 'sku' in row_str or 'name' in row_str or 'category' in row_str:
+            return int(idx)
+    return 0
+
+def _get_sku_df(excel_file: pd.ExcelFile, sku_sheet: str = None, header_row: int = None) -> pd.DataFrame:
+    sku_sheet = sku_sheet or _find_sku_sheet(excel_file.sheet_names)
+    if header_row is None:
+        header_row = _find_header_row(excel_file, sku_sheet)
+    df_skus = pd.read_excel(excel_file, sheet_name=sku_sheet, header=header_row)
+    df_skus.columns = [str(c).strip() for c in df_skus.columns]
+    return df_skus
 
 def extract_headers(file_bytes: bytes) -> list:
     with io.BytesIO(file_bytes) as f:
-        excel_file = pd.ExcelFile(f)
-        df = _get_sku_df(excel_file)
-        return [str(col).strip() for col in df.columns]
+        return inspect_workbook(f)["headers"]
 
 async def _seed_default_configs(db: AsyncSession):
     """Inserts the default values into the DB if they don't exist yet."""
@@ -141,22 +183,14 @@ async def _parse_channels(df: pd.DataFrame, db: AsyncSession):
 async def _parse_cts(df: pd.DataFrame, db: AsyncSession):
     pass
 
-async def _parse_skus(df: pd.DataFrame, db: AsyncSession, mapping: dict, default_market: str = None) -> int:
-    # 1. Fetch existing SKUs to allow upserting instead of wiping everything
-    res = await db.execute(select(SkuRecord))
-    existing_skus = {s.sku_id: s for s in res.scalars().all()}
-    
-    count = 0
-    records_to_insert = []
-    
+def _coerce_sku_rows(records: list, mapping: dict, default_market: str = None) -> list:
+    """Turns raw sheet rows into SkuRecord column dicts. Pure CPU work, run off the event loop."""
     def get_val(cols, key, default=''):
         excel_col = mapping.get(key, key)
         return cols.get(excel_col, default)
-    
-    for _, row in df.iterrows():
-        # Clean col names mapping
-        cols = {str(k).strip(): v for k, v in row.to_dict().items()}
-        
+
+    rows = []
+    for cols in records:
         sku_id = str(get_val(cols, 'SKU ID'))
         if not sku_id or sku_id == 'nan' or pd.isna(get_val(cols, 'SKU Name', None)):
             continue
@@ -164,93 +198,111 @@ async def _parse_skus(df: pd.DataFrame, db: AsyncSession, mapping: dict, default
         target_mkt = str(get_val(cols, 'Target Market', '')) if not pd.isna(get_val(cols, 'Target Market', None)) else None
         if default_market:
             target_mkt = default_market
-            
-        # 2. Check if it exists for Upsert vs Create
-        is_new = False
-        record = existing_skus.get(sku_id)
-        if not record:
-            record = SkuRecord(sku_id=sku_id)
-            is_new = True
-            
-        record.sku_name = str(get_val(cols, 'SKU Name', ''))
-        record.brand = str(get_val(cols, 'Brand', '')) if not pd.isna(get_val(cols, 'Brand', None)) else None
-        record.category = str(get_val(cols, 'Category', ''))
-        record.target_market = target_mkt
-        record.primary_channel = str(get_val(cols, 'Primary Channel', '')) if not pd.isna(get_val(cols, 'Primary Channel', None)) else None
+
+        record = {"sku_id": sku_id}
+        record["sku_name"] = str(get_val(cols, 'SKU Name', ''))
+        record["brand"] = str(get_val(cols, 'Brand', '')) if not pd.isna(get_val(cols, 'Brand', None)) else None
+        record["category"] = str(get_val(cols, 'Category', ''))
+        record["target_market"] = target_mkt
+        record["primary_channel"] = str(get_val(cols, 'Primary Channel', '')) if not pd.isna(get_val(cols, 'Primary Channel', None)) else None
         
-        record.ramp_month = int(get_val(cols, 'Ramp Month (1-4+)', 0)) if not pd.isna(get_val(cols, 'Ramp Month (1-4+)', None)) else None
-        record.regulatory_eligible = (str(get_val(cols, 'Regulatory Eligible', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Regulatory Eligible', None)) else None
-        record.regulatory_prohibition = (str(get_val(cols, 'Regulatory Prohibition', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Regulatory Prohibition', None)) else None
-        record.ip_risk_high = (str(get_val(cols, 'IP Risk High', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'IP Risk High', None)) else False
-        record.supply_ready = (str(get_val(cols, 'Supply Ready', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Supply Ready', None)) else None
+        record["ramp_month"] = int(get_val(cols, 'Ramp Month (1-4+)', 0)) if not pd.isna(get_val(cols, 'Ramp Month (1-4+)', None)) else None
+        record["regulatory_eligible"] = (str(get_val(cols, 'Regulatory Eligible', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Regulatory Eligible', None)) else None
+        record["regulatory_prohibition"] = (str(get_val(cols, 'Regulatory Prohibition', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Regulatory Prohibition', None)) else None
+        record["ip_risk_high"] = (str(get_val(cols, 'IP Risk High', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'IP Risk High', None)) else False
+        record["supply_ready"] = (str(get_val(cols, 'Supply Ready', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Supply Ready', None)) else None
             
-        record.moq = int(get_val(cols, 'MOQ', 0)) if not pd.isna(get_val(cols, 'MOQ', None)) else None
-        record.lead_time_days = int(get_val(cols, 'Lead Time (days)', 0)) if not pd.isna(get_val(cols, 'Lead Time (days)', None)) else None
-        record.shelf_life_months = int(get_val(cols, 'Shelf Life (months)', 0)) if not pd.isna(get_val(cols, 'Shelf Life (months)', None)) else None
+        record["moq"] = int(get_val(cols, 'MOQ', 0)) if not pd.isna(get_val(cols, 'MOQ', None)) else None
+        record["lead_time_days"] = int(get_val(cols, 'Lead Time (days)', 0)) if not pd.isna(get_val(cols, 'Lead Time (days)', None)) else None
+        record["shelf_life_months"] = int(get_val(cols, 'Shelf Life (months)', 0)) if not pd.isna(get_val(cols, 'Shelf Life (months)', None)) else None
             
-        record.local_list_price = float(get_val(cols, 'Local List Price (calc)', 0.0)) if not pd.isna(get_val(cols, 'Local List Price (calc)', None)) else None
-        record.landed_cost = float(get_val(cols, 'Landed Cost (calc)', 0.0)) if not pd.isna(get_val(cols, 'Landed Cost (calc)', None)) else None
+        record["local_list_price"] = float(get_val(cols, 'Local List Price (calc)', 0.0)) if not pd.isna(get_val(cols, 'Local List Price (calc)', None)) else None
+        record["landed_cost"] = float(get_val(cols, 'Landed Cost (calc)', 0.0)) if not pd.isna(get_val(cols, 'Landed Cost (calc)', None)) else None
             
-        record.score_consumer_trend = int(get_val(cols, 'Consumer Trend', 0)) if not pd.isna(get_val(cols, 'Consumer Trend', None)) else None
-        record.score_point_of_diff = int(get_val(cols, 'Point of Diff', 0)) if not pd.isna(get_val(cols, 'Point of Diff', None)) else None
-        record.score_channel_suitability = int(get_val(cols, 'Channel Suitability', 0)) if not pd.isna(get_val(cols, 'Channel Suitability', None)) else None
-        record.score_strategic_role = int(get_val(cols, 'Strategic Role', 0)) if not pd.isna(get_val(cols, 'Strategic Role', None)) else None
-        record.score_marketing_leverage = int(get_val(cols, 'Marketing Leverage', 0)) if not pd.isna(get_val(cols, 'Marketing Leverage', None)) else None
+        record["score_consumer_trend"] = int(get_val(cols, 'Consumer Trend', 0)) if not pd.isna(get_val(cols, 'Consumer Trend', None)) else None
+        record["score_point_of_diff"] = int(get_val(cols, 'Point of Diff', 0)) if not pd.isna(get_val(cols, 'Point of Diff', None)) else None
+        record["score_channel_suitability"] = int(get_val(cols, 'Channel Suitability', 0)) if not pd.isna(get_val(cols, 'Channel Suitability', None)) else None
+        record["score_strategic_role"] = int(get_val(cols, 'Strategic Role', 0)) if not pd.isna(get_val(cols, 'Strategic Role', None)) else None
+        record["score_marketing_leverage"] = int(get_val(cols, 'Marketing Leverage', 0)) if not pd.isna(get_val(cols, 'Marketing Leverage', None)) else None
             
-        record.score_price_ladder = int(get_val(cols, 'Price Ladder', 0)) if not pd.isna(get_val(cols, 'Price Ladder', None)) else None
-        record.score_usage_occasion = int(get_val(cols, 'Usage Occasion', 0)) if not pd.isna(get_val(cols, 'Usage Occasion', None)) else None
-        record.score_channel_diff = int(get_val(cols, 'Channel Diff', 0)) if not pd.isna(get_val(cols, 'Channel Diff', None)) else None
-        record.score_story_cohesion = int(get_val(cols, 'Story Cohesion', 0)) if not pd.isna(get_val(cols, 'Story Cohesion', None)) else None
-        record.score_operational_synergy = int(get_val(cols, 'Operational Synergy', 0)) if not pd.isna(get_val(cols, 'Operational Synergy', None)) else None
+        record["score_price_ladder"] = int(get_val(cols, 'Price Ladder', 0)) if not pd.isna(get_val(cols, 'Price Ladder', None)) else None
+        record["score_usage_occasion"] = int(get_val(cols, 'Usage Occasion', 0)) if not pd.isna(get_val(cols, 'Usage Occasion', None)) else None
+        record["score_channel_diff"] = int(get_val(cols, 'Channel Diff', 0)) if not pd.isna(get_val(cols, 'Channel Diff', None)) else None
+        record["score_story_cohesion"] = int(get_val(cols, 'Story Cohesion', 0)) if not pd.isna(get_val(cols, 'Story Cohesion', None)) else None
+        record["score_operational_synergy"] = int(get_val(cols, 'Operational Synergy', 0)) if not pd.isna(get_val(cols, 'Operational Synergy', None)) else None
             
-        record.score_regulatory_delay = int(get_val(cols, 'Regulatory Delay', 0)) if not pd.isna(get_val(cols, 'Regulatory Delay', None)) else None
-        record.score_retail_listing = int(get_val(cols, 'Retail Listing', 0)) if not pd.isna(get_val(cols, 'Retail Listing', None)) else None
-        record.score_competitive = int(get_val(cols, 'Competitive', 0)) if not pd.isna(get_val(cols, 'Competitive', None)) else None
-        record.score_supply_chain = int(get_val(cols, 'Supply Chain', 0)) if not pd.isna(get_val(cols, 'Supply Chain', None)) else None
-        record.score_price_war = int(get_val(cols, 'Price War', 0)) if not pd.isna(get_val(cols, 'Price War', None)) else None
+        record["score_regulatory_delay"] = int(get_val(cols, 'Regulatory Delay', 0)) if not pd.isna(get_val(cols, 'Regulatory Delay', None)) else None
+        record["score_retail_listing"] = int(get_val(cols, 'Retail Listing', 0)) if not pd.isna(get_val(cols, 'Retail Listing', None)) else None
+        record["score_competitive"] = int(get_val(cols, 'Competitive', 0)) if not pd.isna(get_val(cols, 'Competitive', None)) else None
+        record["score_supply_chain"] = int(get_val(cols, 'Supply Chain', 0)) if not pd.isna(get_val(cols, 'Supply Chain', None)) else None
+        record["score_price_war"] = int(get_val(cols, 'Price War', 0)) if not pd.isna(get_val(cols, 'Price War', None)) else None
             
-        record.pass_portfolio_balance = (str(get_val(cols, 'Pass: Portfolio Balance (manual)', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Pass: Portfolio Balance (manual)', None)) else None
-        record.suggested_launch_wave = str(get_val(cols, 'Suggested Launch Wave', '')) if not pd.isna(get_val(cols, 'Suggested Launch Wave', None)) else None
-        
-        if is_new:
-            records_to_insert.append(record)
-        count += 1
-        
-    if records_to_insert:
-        db.add_all(records_to_insert)
-    
-    # Needs a flush so they get IDs / attached to DB session
-    await db.flush()
-    
-    # Calculate for all inserted
-    settings_res = await db.execute(select(GlobalSetting))
-    settings = {s.setting_key: s.setting_value for s in settings_res.scalars().all()}
-    
-    market_res = await db.execute(select(MarketConfig))
-    markets = {m.market_name: m for m in market_res.scalars().all()}
-    
-    channel_res = await db.execute(select(MarketChannelConfig))
-    market_channels = {f"{c.market_id}_{c.channel}": c for c in channel_res.scalars().all()}
-    
-    category_res = await db.execute(select(MarketCategoryConfig))
-    market_categories = {f"{c.market_id}_{c.channel}_{c.category}": c for c in category_res.scalars().all()}
-        
-    engine = CalculationEngine(settings, markets, market_channels, market_categories)
-    
-    # 3. Handle Calculation Cache Upserts
-    for sku_obj in list(existing_skus.values()) + records_to_insert:
-        cache_data = engine.calculate_sku(sku_obj)
-        
-        # Check if cache exists
-        existing_cache_res = await db.execute(select(SkuCalculationCache).filter_by(sku_id=sku_obj.sku_id))
-        existing_cache = existing_cache_res.scalars().first()
-        
-        if existing_cache:
-            for k, v in cache_data.__dict__.items():
-                if not k.startswith('_') and k != 'sku_id':
-                    setattr(existing_cache, k, v)
-        else:
-            db.add(cache_data)
+        record["pass_portfolio_balance"] = (str(get_val(cols, 'Pass: Portfolio Balance (manual)', '')).lower() == 'yes') if not pd.isna(get_val(cols, 'Pass: Portfolio Balance (manual)', None)) else None
+        record["suggested_launch_wave"] = str(get_val(cols, 'Suggested Launch Wave', '')) if not pd.isna(get_val(cols, 'Suggested Launch Wave', None)) else None
+        rows.append(record)
+    return rows
+
+def _coerce_sku_frame(df: pd.DataFrame, mapping: dict, default_market: str = None) -> list:
+    return _coerce_sku_rows(df.to_dict("records"), mapping, default_market)
+
+async def _parse_skus(df_skus: pd.DataFrame, db: AsyncSession, mapping: dict, default_market: str = None, progress: ImportProgress = None) -> int:
+    count = 0
+    if progress:
+        await progress.update(stage="upserting", rows_total=len(df_skus))
+
+    for start in range(0, len(df_skus), UPSERT_CHUNK_SIZE):
+        chunk = df_skus.iloc[start:start + UPSERT_CHUNK_SIZE]
+        rows = await asyncio.to_thread(_coerce_sku_frame, chunk, mapping, default_market)
+
+        # Upsert instead of wiping everything; only this chunk's SKUs are loaded. Their rows are locked
+        # (selectinload reads the caches afterwards) so the rollups re-key the cache values as they stand
+        res = await db.execute(
+            select(SkuRecord).options(selectinload(SkuRecord.cache))
+            .filter(SkuRecord.sku_id.in_([r["sku_id"] for r in rows]))
+            .order_by(SkuRecord.sku_id).with_for_update(of=SkuRecord)
+        )
+        existing_skus = {s.sku_id: s for s in res.scalars().all()}
+        rollup_delta = RollupDelta()
+        for row in rows:
+            record = existing_skus.get(row["sku_id"])
+            if not record:
+                record = SkuRecord(sku_id=row["sku_id"])
+                db.add(record)
+                # Later duplicates of the same SKU ID in the file update this record
+                existing_skus[row["sku_id"]] = record
+            elif record.cache is not None:
+                # Re-key the existing cached contribution if the SKU moves market/channel/category;
+                # the rescore below then adjusts its values
+                rollup_delta.remove(
+                    {"target_market": record.target_market, "primary_channel": record.primary_channel, "category": record.category},
+                    record.cache,
+                )
+            for k, v in row.items():
+                setattr(record, k, v)
+            if record.cache is not None:
+                rollup_delta.add(record, record.cache)
+        await rollup_delta.apply(db)
+
+        # Needs a flush so they get IDs / attached to DB session
+        await db.flush()
+        count += len(rows)
+        if progress:
+            await progress.update(rows_parsed=start + len(chunk), rows_upserted=count)
+
+    # Records changed wholesale, not only scores: subscribers reload instead of patching
+    await change_feed.publish_resync(db)
     await db.commit()
+    # Only the uploaded SKUs whose name/brand/category changed are (re)indexed
+    await refresh_duplicate_index(db)
+
+    # Calculate for all SKUs, new and existing
+    on_scored = None
+    if progress:
+        total = await db.execute(select(func.count()).select_from(SkuRecord))
+        await progress.update(stage="scoring", rows_to_score=total.scalar())
+
+        async def on_scored(n):
+            await progress.update(rows_scored=n)
+    await recalculate_all_skus(db, on_progress=on_scored)
     
     return count
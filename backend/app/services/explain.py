@@ -0,0 +1,93 @@
+"""
+Explain mode: why a SKU got its recommendation.
+
+CalculationEngine.explain() rescores SKUs and keeps what the batch path discards: every
+intermediate (EXPLAIN_FIELDS), the market / channel constants and cascade multipliers each
+SKU was scored with, and which cascade tier or config row supplied each of them. Nothing on
+the recalculation path calls it, so tracing costs nothing unless someone asks.
+
+explain_record() shapes one SKU of a trace for GET /skus/{id}/explain. For debugging the
+whole portfolio, this module dumps a trace as columnar .npz (one array per field):
+
+    python -m app.services.explain --out trace.npz [--market Nepal] [--channel GT]
+"""
+import argparse
+import asyncio
+import sys
+
+import numpy as np
+from sqlalchemy import and_, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import CONFIG_ROW_FIELDS, EXPLAIN_FIELDS
+from app.core.database import AsyncSessionLocal
+from app.models.skus import SkuRecord
+from app.services.recalculator import LOAD_CHUNK_SIZE, build_calc_engine, load_sku_rows
+
+def _value(value):
+    value = value.item() if isinstance(value, np.generic) else value
+    return None if isinstance(value, float) and not np.isfinite(value) else value
+
+async def explain_skus(db: AsyncSession, where) -> dict:
+    """CalculationEngine.explain() of the SKUs matching `where`, with their cached values alongside."""
+    rows = await load_sku_rows(db, where)
+    if not rows:
+        return {}
+    engine = await build_calc_engine(db)
+    trace = engine.explain([row for row, _ in rows])
+    trace["cached_recommendation"] = np.array([cache and cache["final_recommendation"] for _, cache in rows], dtype=object)
+    return trace
+
+def explain_record(trace: dict, i: int = 0) -> dict:
+    """SKU `i` of a trace: its config values with their sources, then the calculation steps in order."""
+    scorable = bool(trace["scorable"][i])
+    return {
+        "sku_id": trace["sku_id"][i],
+        "scorable": scorable,
+        "config": {
+            field: {"value": _value(trace[field][i]), "source": trace[f"{field}_source"][i]}
+            for field in CONFIG_ROW_FIELDS
+        },
+        # An unscorable SKU (no market or channel) gets no cache values, so its steps are only informative
+        "steps": {field: _value(trace[field][i]) for field in EXPLAIN_FIELDS},
+        # Differs from the final_recommendation step while the cache is stale
+        "cached_recommendation": trace["cached_recommendation"][i],
+    }
+
+def _columns(trace: dict) -> dict:
+    """Trace fields as .npz-friendly arrays: strings and flags as fixed-width / bool, missing strings as ''."""
+    columns = {"sku_id": np.array(trace["sku_id"], dtype=str)}
+    for field in CONFIG_ROW_FIELDS:
+        columns[field] = trace[field]
+        columns[f"{field}_source"] = trace[f"{field}_source"].astype(str)
+    for field in ["scorable"] + EXPLAIN_FIELDS + ["cached_recommendation"]:
+        values = np.asarray(trace[field])
+        columns[field] = np.array(["" if v is None else v for v in values], dtype=str) if values.dtype == object else values
+    return columns
+
+async def _main(out: str, market: str = None, channel: str = None) -> int:
+    where = and_(
+        SkuRecord.target_market == market if market else true(),
+        SkuRecord.primary_channel == channel if channel else true(),
+    )
+    chunks = []
+    async with AsyncSessionLocal() as db:
+        sku_ids = (await db.execute(select(SkuRecord.sku_id).where(where))).scalars().all()
+        for start in range(0, len(sku_ids), LOAD_CHUNK_SIZE):
+            trace = await explain_skus(db, SkuRecord.sku_id.in_(sku_ids[start:start + LOAD_CHUNK_SIZE]))
+            chunks.append(_columns(trace))
+    if not chunks:
+        print("No SKUs to explain", file=sys.stderr)
+        return 1
+    np.savez_compressed(out, **{field: np.concatenate([c[field] for c in chunks]) for field in chunks[0]})
+    print(f"{len(sku_ids)} SKUs x {len(chunks[0])} fields -> {out}")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dump the explain trace of the portfolio as columnar .npz")
+    parser.add_argument("--out", default="trace.npz")
+    parser.add_argument("--market")
+    parser.add_argument("--channel")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.out, args.market, args.channel)))
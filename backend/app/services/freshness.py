@@ -0,0 +1,124 @@
+"""
+Cache freshness: which SKUs were scored under the current configuration.
+
+Config writes that can change scores bump a single counter (config_generation), and every
+cache row is stamped with the generation it was scored under, so a row is stale when its
+stamp is older than the counter. CONSISTENCY_MODE picks what a config write does:
+  - "eager" (default): bump, then rescore the whole portfolio before responding, as before;
+  - "lazy": only bump - O(1) - and leave the rescoring to the readers and the sweeper. The
+    list, export and summary endpoints rescore the stale rows they are about to return (the
+    summary needs all of them, since rollups sum the whole portfolio), and StaleSweeper
+    catches up the rest in small batches in the background.
+Edits to one market's, channel's or category's config only reach the SKUs sold there, so they
+leave the generation alone and mark just those rows stale (mark_stale()).
+Both modes report freshness (freshness_report()) so clients can tell whether values are current.
+"""
+import asyncio
+import logging
+import os
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import AsyncSessionLocal, db_url, is_in_memory, upsert
+from app.models.settings import ConfigGeneration
+from app.models.skus import SkuCalculationCache, SkuRecord
+
+CONSISTENCY_MODE = os.getenv("CONSISTENCY_MODE", "eager")  # "eager" or "lazy"
+# How often an idle sweeper looks for stale rows (config writes made by this worker wake it at once)
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "30"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "1000"))
+# Pause between sweeper batches, so request handlers get the event loop and the database first
+SWEEP_PAUSE_SECONDS = 0.1
+# Stamp of rows marked stale by mark_stale(): older than every generation, including the initial 0
+STALE_STAMP = -1
+
+logger = logging.getLogger(__name__)
+
+async def current_generation(db: AsyncSession) -> int:
+    generation = (await db.execute(select(ConfigGeneration.generation).where(ConfigGeneration.id == 1))).scalar()
+    return generation or 0
+
+async def bump_generation(db: AsyncSession) -> int:
+    """Marks every cache row stale by advancing the generation. Returns the new one. Does not commit."""
+    table = ConfigGeneration.__table__
+    stmt = upsert(db, table).values(id=1, generation=1)
+    stmt = stmt.on_conflict_do_update(index_elements=["id"], set_={"generation": table.c.generation + 1})
+    return (await db.execute(stmt.returning(table.c.generation))).scalar_one()
+
+async def mark_stale(db: AsyncSession, where) -> int:
+    """Marks the cache rows of the SKUs matching `where` stale under any generation. Returns how many. Does not commit."""
+    result = await db.execute(
+        update(SkuCalculationCache)
+        .where(SkuCalculationCache.sku_id.in_(select(SkuRecord.sku_id).where(where)))
+        .values(config_generation=STALE_STAMP)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def stale_filter(generation: int):
+    """Cache rows scored before `generation` (rows from before stamping count as generation 0)."""
+    stamp = SkuCalculationCache.config_generation
+    return or_(stamp < generation, stamp.is_(None)) if generation > 0 else stamp < 0
+
+async def freshness_report(db: AsyncSession) -> dict:
+    generation = await current_generation(db)
+    stale = (await db.execute(
+        select(func.count()).select_from(SkuCalculationCache).where(stale_filter(generation))
+    )).scalar()
+    return {"mode": CONSISTENCY_MODE, "config_generation": generation, "stale_skus": stale, "fresh": stale == 0}
+
+def freshness_headers(report: dict) -> dict:
+    return {
+        "X-Config-Generation": str(report["config_generation"]),
+        "X-Stale-Skus": str(report["stale_skus"]),
+    }
+
+class StaleSweeper:
+    """Background task (lazy mode only) that rescores stale cache rows a batch at a time."""
+
+    def __init__(self):
+        self._task = None
+        self._wake = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        # An in-memory database has one connection for every session, which a sweep would interleave
+        # with request transactions; there readers alone catch up
+        if CONSISTENCY_MODE == "lazy" and not self.running and not is_in_memory(db_url):
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        from app.services.recalculator import recalculate_stale
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), SWEEP_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                async with AsyncSessionLocal() as db:
+                    # Rows another worker (or a reader) is rescoring are skipped, not waited for
+                    while await recalculate_stale(db, max_batches=1, batch_size=SWEEP_BATCH_SIZE, skip_locked=True):
+                        await asyncio.sleep(SWEEP_PAUSE_SECONDS)
+            except Exception:
+                logger.exception("Stale cache sweep failed; retrying on the next interval")
+
+stale_sweeper = StaleSweeper()
@@ -0,0 +1,44 @@
+"""
+Goal-seek: the list price, landed cost or score a SKU would need to pass the GM floor or
+reach Launch Now, for many SKUs in one call (CalculationEngine.goal_seek()).
+"""
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import SKU_INPUT_FIELDS
+from app.models.skus import SkuRecord
+from app.services.recalculator import build_calc_engine
+
+def _values(values: np.ndarray) -> list:
+    if values.dtype.kind == "f" and not np.isfinite(values).all():
+        finite = np.isfinite(values)
+        values = values.astype(object)
+        values[~finite] = None
+    return values.tolist()
+
+async def goal_seek(db: AsyncSession, variable: str, goal: str, sku_ids: Sequence[str] = ()) -> dict:
+    """Solves for the selected SKUs (all when `sku_ids` is empty), loaded in one query. Columnar, JSON-ready."""
+    engine = await build_calc_engine(db)
+    query = select(*[getattr(SkuRecord, f) for f in SKU_INPUT_FIELDS])
+    if sku_ids:
+        query = query.where(SkuRecord.sku_id.in_(sku_ids))
+    skus = (await db.execute(query.order_by(SkuRecord.sku_id))).all()
+    if not skus:
+        return {"variable": variable, "goal": goal, "method": None, "sku_ids": [], "current": [],
+                "required": [], "direction": [], "status": [], "met": []}
+    result = engine.goal_seek(skus, variable, goal)
+    return {
+        "variable": variable,
+        "goal": goal,
+        "method": result["method"],
+        "sku_ids": list(result["sku_id"]),
+        "current": _values(result["current"]),
+        "required": _values(result["required"]),
+        # Only meaningful for solved SKUs
+        "direction": np.where(result["status"] == "solved", result["direction"], None).tolist(),
+        "status": result["status"].tolist(),
+        "met": result["met"].tolist(),
+    }
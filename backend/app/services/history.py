@@ -0,0 +1,166 @@
+"""
+Append-only recommendation history.
+
+Every cache write path passes its change-feed deltas to record_history(), which appends a
+narrow row (recommendation code, layer-B score, monthly GM$ as REALs) for each SKU whose
+tracked values differ from its latest history row. Rows are tagged with the config version
+the SKU was scored under: a new version is opened whenever the engine's configuration
+fingerprint differs from the latest one.
+
+Because only changes are stored, a SKU's state as of version V is its latest row with
+config_version <= V; both the version diff and the per-SKU trajectory are index lookups.
+On Postgres the table is range-partitioned by month; the embedded SQLite mode uses one table.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.calculator import CalculationEngine
+
+RECOMMENDATION_CODES = {"Phase Later": 0, "Launch Now": 1, "Do Not Launch": 2}
+RECOMMENDATIONS = {code: name for name, code in RECOMMENDATION_CODES.items()}
+# Cache fields a history row is derived from; deltas touching none of them are skipped
+HISTORY_SOURCE_FIELDS = {"final_recommendation", "weighted_score_layer_b", "monthly_gm_dollar"}
+
+# pg_advisory_xact_lock keys serializing the check-then-create steps below across writers
+CONFIG_VERSION_LOCK_KEY = 0x5C0F1601
+PARTITION_LOCK_KEY = 0x5C0F1602
+
+_RECOMMENDATION_SQL = "CASE c.final_recommendation " + " ".join(
+    f"WHEN '{name}' THEN {code}" for name, code in RECOMMENDATION_CODES.items()) + " END"
+
+async def _lock(db: AsyncSession, key: int):
+    """Held until the transaction ends; a no-op on SQLite, which serializes writers anyway."""
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": key})
+
+def config_fingerprint(engine: CalculationEngine) -> str:
+    return hashlib.sha256(json.dumps(engine.snapshot(), sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+async def config_version(db: AsyncSession, engine: CalculationEngine) -> int:
+    """The latest config version if it matches `engine`'s configuration, else a newly opened one."""
+    fingerprint = config_fingerprint(engine)
+    latest_query = text("SELECT version, fingerprint FROM config_versions ORDER BY version DESC LIMIT 1")
+    latest = (await db.execute(latest_query)).first()
+    if latest and latest.fingerprint == fingerprint:
+        return latest.version
+    # Concurrent writers after a config change would otherwise each open a version; re-check under the lock
+    await _lock(db, CONFIG_VERSION_LOCK_KEY)
+    latest = (await db.execute(latest_query)).first()
+    if latest and latest.fingerprint == fingerprint:
+        return latest.version
+    result = await db.execute(
+        text("INSERT INTO config_versions (fingerprint) VALUES (:fingerprint) RETURNING version"),
+        {"fingerprint": fingerprint},
+    )
+    return result.scalar_one()
+
+def _month_start(when: datetime) -> datetime:
+    return when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+async def ensure_partition(db: AsyncSession, when: datetime):
+    """Creates the monthly partition holding `when` if it does not exist yet."""
+    start = _month_start(when)
+    end = _month_start(start + timedelta(days=32))
+    name = f"recommendation_history_{start:%Y_%m}"
+    exists = text("SELECT to_regclass(:name)")
+    # A catalog lookup, so the parent table is only locked in the rare case a partition is missing
+    if (await db.execute(exists, {"name": name})).scalar() is not None:
+        return
+    # IF NOT EXISTS alone still fails on a concurrent create (duplicate pg_type row): serialize and re-check
+    await _lock(db, PARTITION_LOCK_KEY)
+    if (await db.execute(exists, {"name": name})).scalar() is None:
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF recommendation_history "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+def _distinct(a: str, b: str) -> str:
+    return " OR ".join(f"{a}.{c} IS DISTINCT FROM {b}.{c}" for c in ("recommendation", "score", "gm_dollar"))
+
+async def record_history(db: AsyncSession, deltas: list, engine: CalculationEngine):
+    """
+    Appends history rows, tagged with `engine`'s config version, for the SKUs in `deltas` whose
+    recommendation, score or GM$ moved. Reads the cache rows written in this transaction, so
+    call it after writing them and before committing.
+    """
+    sku_ids = [d["sku_id"] for d in deltas if HISTORY_SOURCE_FIELDS.intersection(d.get("fields") or ())]
+    if not sku_ids:
+        return
+    # Pending ORM cache writes must reach the database before the INSERT ... SELECT reads them
+    await db.flush()
+    version = await config_version(db, engine)
+    now = datetime.now(timezone.utc)
+    if db.bind.dialect.name == "sqlite":
+        # One JSON parameter rather than one bound variable per SKU
+        id_filter, ids = "c.sku_id IN (SELECT value FROM json_each(:sku_ids))", json.dumps(sku_ids)
+    else:
+        await ensure_partition(db, now)
+        id_filter, ids = "c.sku_id = ANY(:sku_ids)", sku_ids
+    await db.execute(text(f"""
+        INSERT INTO recommendation_history (sku_id, recorded_at, config_version, recommendation, score, gm_dollar)
+        SELECT n.sku_id, :recorded_at, :version, n.recommendation, n.score, n.gm_dollar
+        FROM (
+            SELECT c.sku_id, CAST({_RECOMMENDATION_SQL} AS SMALLINT) AS recommendation,
+                   CAST(c.weighted_score_layer_b AS REAL) AS score, CAST(c.monthly_gm_dollar AS REAL) AS gm_dollar
+            FROM sku_calculation_cache c
+            WHERE {id_filter}
+        ) n
+        LEFT JOIN recommendation_history prev ON prev.sku_id = n.sku_id AND prev.recorded_at = (
+            SELECT MAX(h.recorded_at) FROM recommendation_history h WHERE h.sku_id = n.sku_id
+        )
+        WHERE {_distinct("prev", "n")}
+    """), {"recorded_at": now, "version": version, "sku_ids": ids})
+
+def _state(row: dict, prefix: str) -> dict:
+    if row[f"{prefix}_version"] is None:
+        return None
+    return {
+        "config_version": row[f"{prefix}_version"],
+        "recorded_at": row[f"{prefix}_at"],
+        "recommendation": RECOMMENDATIONS.get(row[f"{prefix}_recommendation"]),
+        "score": row[f"{prefix}_score"],
+        "gm_dollar": row[f"{prefix}_gm_dollar"],
+    }
+
+def _state_as_of(param: str) -> str:
+    """recorded_at of a changed SKU's latest row with config_version <= :param (an index probe)."""
+    return f"""(
+        SELECT h.recorded_at FROM recommendation_history h
+        WHERE h.sku_id = changed.sku_id AND h.config_version <= :{param}
+        ORDER BY h.config_version DESC, h.recorded_at DESC LIMIT 1
+    )"""
+
+async def version_diff(db: AsyncSession, from_version: int, to_version: int, recommendation_changed: bool = False,
+                       skip: int = 0, limit: int = 1000) -> list:
+    """Per-SKU state as of `from_version` and as of `to_version`, for SKUs whose state differs."""
+    lo, hi = sorted((from_version, to_version))
+    columns = ", ".join(
+        f"{side}.config_version AS {side}_version, {side}.recorded_at AS {side}_at, {side}.recommendation AS {side}_recommendation, "
+        f"{side}.score AS {side}_score, {side}.gm_dollar AS {side}_gm_dollar" for side in ("a", "b"))
+    compare = "a.recommendation IS DISTINCT FROM b.recommendation" if recommendation_changed else _distinct("a", "b")
+    result = await db.execute(text(f"""
+        WITH changed AS (
+            SELECT DISTINCT sku_id FROM recommendation_history
+            WHERE config_version > :lo AND config_version <= :hi
+        )
+        SELECT changed.sku_id, {columns}
+        FROM changed
+        LEFT JOIN recommendation_history a ON a.sku_id = changed.sku_id AND a.recorded_at = {_state_as_of("from_version")}
+        LEFT JOIN recommendation_history b ON b.sku_id = changed.sku_id AND b.recorded_at = {_state_as_of("to_version")}
+        WHERE {compare}
+        ORDER BY changed.sku_id
+        LIMIT :limit OFFSET :skip
+    """), {"lo": lo, "hi": hi, "from_version": from_version, "to_version": to_version, "skip": skip, "limit": limit})
+    return [{"sku_id": r["sku_id"], "from": _state(r, "a"), "to": _state(r, "b")} for r in result.mappings().all()]
+
+async def sku_trajectory(db: AsyncSession, sku_id: str) -> list:
+    """Every recorded state of one SKU, oldest first."""
+    result = await db.execute(text("""
+        SELECT config_version, recorded_at, recommendation, score, gm_dollar FROM recommendation_history
+        WHERE sku_id = :sku_id ORDER BY recorded_at
+    """), {"sku_id": sku_id})
+    return [{**r, "recommendation": RECOMMENDATIONS.get(r["recommendation"])} for r in result.mappings().all()]
@@ -0,0 +1,83 @@
+"""
+Placement evaluation: where should a SKU launch?
+
+Every selected SKU is scored against every configured (market, channel) in one
+CalculationEngine.evaluate_placements() call (SKUs x placements broadcast as flat arrays),
+then placements are ranked per SKU: Launch Now before Phase Later before Do Not Launch,
+and by base-scenario monthly GM$ within a recommendation.
+"""
+from typing import List, Sequence
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import CalculationEngine, SKU_INPUT_FIELDS
+from app.models.skus import SkuRecord
+from app.services.recalculator import build_calc_engine
+
+# Values that can be reported for each SKU x placement cell
+PLACEMENT_FIELDS = [
+    "final_recommendation", "weighted_score_layer_b", "channel_weighted_score", "risk_score_layer_d",
+    "gm_pct", "monthly_revenue", "monthly_gm_base", "adj_units_base", "initial_stock_investment",
+]
+DEFAULT_MATRIX_FIELDS = ["final_recommendation", "monthly_gm_base"]
+
+def configured_placements(engine: CalculationEngine, markets: Sequence[str] = (), channels: Sequence[str] = ()) -> List[tuple]:
+    """(market, channel) of every market_channel_config row, optionally limited to some markets/channels."""
+    placements = sorted((mc.market_id, mc.channel) for mc in engine.market_channels.values())
+    return [(m, c) for m, c in placements if (not markets or m in markets) and (not channels or c in channels)]
+
+def _values(values: np.ndarray) -> list:
+    if values.dtype.kind == "f" and not np.isfinite(values).all():
+        finite = np.isfinite(values)
+        values = values.astype(object)
+        values[~finite] = None
+    return values.tolist()
+
+def rank_placements(engine: CalculationEngine, skus: Sequence, placements: List[tuple], top_k: int = None,
+                    fields: Sequence[str] = DEFAULT_MATRIX_FIELDS) -> dict:
+    """
+    Scores `skus` in every placement and ranks the placements per SKU. The result is columnar:
+    best[field][i] is SKU i's value in its best placement, matrix["placement"][i][r] the index
+    (into placements) of its r-th best placement, and matrix[field][i][r] that cell's value.
+    """
+    n, n_placements = len(skus), len(placements)
+    env = engine.evaluate_placements(skus, placements)
+
+    tier = np.where(env["do_not_launch"], 0, np.where(env["launch_now"], 2, 1)).reshape(n_placements, n)
+    gm = np.nan_to_num(env["monthly_gm_base"], nan=-np.inf).reshape(n_placements, n)
+    # (placements, SKUs) -> per SKU, placement indexes from best to worst
+    order = np.lexsort((-gm, -tier), axis=0).T[:, :top_k]
+    rows = np.arange(n)[:, None]
+
+    grid = {field: env[field].reshape(n_placements, n).T for field in PLACEMENT_FIELDS}
+    best = {field: _values(values[rows[:, 0], order[:, 0]]) for field, values in grid.items()}
+    matrix = {"placement": order.tolist()}
+    for field in fields:
+        matrix[field] = _values(grid[field][rows, order])
+
+    placement_index = {p: i for i, p in enumerate(placements)}
+    return {
+        "placements": [{"market": m, "channel": c} for m, c in placements],
+        "sku_ids": [s.sku_id for s in skus],
+        "current_placement": [placement_index.get((s.target_market, s.primary_channel)) for s in skus],
+        "best_placement": order[:, 0].tolist(),
+        "best": best,
+        "matrix": matrix,
+    }
+
+async def evaluate_placements(db: AsyncSession, sku_ids: Sequence[str] = (), markets: Sequence[str] = (),
+                              channels: Sequence[str] = (), top_k: int = None,
+                              fields: Sequence[str] = DEFAULT_MATRIX_FIELDS) -> dict:
+    """Loads the selected SKUs (all when `sku_ids` is empty) in one query and ranks their placements."""
+    engine = await build_calc_engine(db)
+    query = select(*[getattr(SkuRecord, f) for f in SKU_INPUT_FIELDS])
+    if sku_ids:
+        query = query.where(SkuRecord.sku_id.in_(sku_ids))
+    skus = (await db.execute(query.order_by(SkuRecord.sku_id))).all()
+    placements = configured_placements(engine, markets, channels)
+    if not skus or not placements:
+        return {"placements": [{"market": m, "channel": c} for m, c in placements], "sku_ids": [],
+                "current_placement": [], "best_placement": [], "best": {}, "matrix": {}}
+    return rank_placements(engine, skus, placements, top_k, fields)
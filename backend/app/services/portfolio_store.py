@@ -0,0 +1,417 @@
+"""
+Compact in-memory portfolio store, one per API worker.
+
+Listing, filtering and aggregating the portfolio through the ORM costs a SkuRecord plus a
+SkuCalculationCache object per SKU (hundreds of bytes each, plus identity-map overhead) and a
+database round trip per request. PortfolioStore keeps just the columns those reads need, as
+struct-of-arrays: sku_id as fixed-width bytes (rows sorted by it, so lookups are binary
+searches), market / channel / category / brand / recommendation as dictionary codes, and the
+scores and money columns as float32 - about 60 bytes per SKU plus the id. Filters are
+vectorized masks, sort orders are cached until the data changes, and aggregates are one
+bincount per summed column.
+
+It is loaded at startup and follows the change feed: a background task patches cache and
+record values in place as deltas arrive and tombstones deleted SKUs. SKUs it has not seen
+yet, and resync messages (uploads, or a feed subscriber that fell behind), are loaded from
+the database by the next read. Values are as fresh as the cache (in lazy consistency mode
+they can be stale), float32 carries about 7 significant digits (rows are returned rounded to
+them, and aggregate sums can differ slightly from /skus/summary's), and on SQLite with several
+worker processes each store only sees its own worker's writes.
+
+    PORTFOLIO_STORE=off   # don't keep the store (its endpoints answer 503)
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models.skus import SkuRecord, SkuCalculationCache
+from app.services.change_feed import change_feed
+from app.services.rollups import SUM_FIELDS, COUNT_FIELDS
+
+PORTFOLIO_STORE = os.getenv("PORTFOLIO_STORE", "on") != "off"
+# Rows fetched per round trip while loading
+LOAD_PARTITION_SIZE = 50000
+# SKU ids per IN list when loading SKUs the store has not seen yet
+LOAD_CHUNK_SIZE = 10000
+# Deleted rows are compacted away once they are this share of the arrays
+MAX_TOMBSTONE_SHARE = 0.25
+# Sort orders kept at once (4 bytes per SKU each)
+MAX_CACHED_ORDERS = 4
+# Rows of a sort order checked against the filters per step while filling a page
+PAGE_SCAN_BLOCK = 16384
+# Aggregates count straight into one slot per group combination up to this many combinations
+MAX_DENSE_GROUPS = 1 << 20
+
+# Dictionary-encoded column -> (model, source column)
+STRING_COLUMNS = {
+    "market": (SkuRecord, "target_market"),
+    "channel": (SkuRecord, "primary_channel"),
+    "category": (SkuRecord, "category"),
+    "brand": (SkuRecord, "brand"),
+    "recommendation": (SkuCalculationCache, "final_recommendation"),
+}
+# float32 columns, named as their source column
+NUMBER_COLUMNS = {
+    "local_list_price": SkuRecord,
+    "landed_cost": SkuRecord,
+    "weighted_score_layer_b": SkuCalculationCache,
+    "channel_weighted_score": SkuCalculationCache,
+    "risk_score_layer_d": SkuCalculationCache,
+    "initial_stock_investment": SkuCalculationCache,
+    **{field: SkuCalculationCache for field in SUM_FIELDS.values()},
+}
+GROUP_COLUMNS = list(STRING_COLUMNS)
+SORT_COLUMNS = ["sku_id"] + list(STRING_COLUMNS) + list(NUMBER_COLUMNS)
+# Change-feed field (cache "fields" or SKU "record") -> store column
+_SOURCES = {
+    "cache": {**{src: col for col, (model, src) in STRING_COLUMNS.items() if model is SkuCalculationCache},
+              **{col: col for col, model in NUMBER_COLUMNS.items() if model is SkuCalculationCache}},
+    "record": {**{src: col for col, (model, src) in STRING_COLUMNS.items() if model is SkuRecord},
+               **{col: col for col, model in NUMBER_COLUMNS.items() if model is SkuRecord}},
+}
+
+logger = logging.getLogger(__name__)
+
+class StoreUnavailable(Exception):
+    """PORTFOLIO_STORE is off, or the worker has not loaded it."""
+
+class _Dictionary:
+    """String <-> small integer code; code 0 is None."""
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+        self._ranks = None
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self._ranks = None
+        return code
+
+    def encode_many(self, values: Iterable) -> np.ndarray:
+        codes = np.fromiter((self.encode(v) for v in values), dtype=np.uint32)
+        return codes.astype(self.dtype)
+
+    @property
+    def dtype(self):
+        return np.uint16 if len(self.values) <= np.iinfo(np.uint16).max else np.uint32
+
+    def ranks(self) -> np.ndarray:
+        """Sort position of each code's string (None first)."""
+        if self._ranks is None:
+            order = sorted(range(len(self.values)), key=lambda c: (self.values[c] is not None, self.values[c] or ""))
+            self._ranks = np.empty(len(order), dtype=np.uint32)
+            self._ranks[order] = np.arange(len(order), dtype=np.uint32)
+        return self._ranks
+
+def _floats(values: Iterable) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+
+def _encode_ids(sku_ids: Iterable[str]) -> np.ndarray:
+    return np.array([sku_id.encode("utf-8") for sku_id in sku_ids], dtype=np.bytes_)
+
+class PortfolioStore:
+    def __init__(self):
+        self.dictionaries = {column: _Dictionary() for column in STRING_COLUMNS}
+        self.columns = None
+        self.loaded_at = None
+        self._orders = {}
+        self._tombstones = 0
+        self._missing = set()
+        self._resync = False
+        self._replay = None
+        self._changes = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.columns is not None
+
+    # --- Loading ---
+
+    def _query(self):
+        cache = SkuCalculationCache
+        return (
+            select(SkuRecord.sku_id,
+                   *[getattr(model, src) for model, src in STRING_COLUMNS.values()],
+                   *[getattr(model, col) for col, model in NUMBER_COLUMNS.items()],
+                   cache.sku_id.isnot(None))
+            .outerjoin(cache, cache.sku_id == SkuRecord.sku_id)
+        )
+
+    def _build(self, rows: list) -> dict:
+        """Column arrays for rows of _query(), in query order."""
+        values = list(zip(*rows)) if rows else [[]] * (2 + len(STRING_COLUMNS) + len(NUMBER_COLUMNS))
+        columns = {"sku_id": _encode_ids(values[0])}
+        for i, column in enumerate(STRING_COLUMNS, 1):
+            columns[column] = self.dictionaries[column].encode_many(values[i])
+        for i, column in enumerate(NUMBER_COLUMNS, 1 + len(STRING_COLUMNS)):
+            columns[column] = _floats(values[i])
+        columns["cached"] = np.array(values[-1], dtype=bool)
+        columns["alive"] = np.ones(len(rows), dtype=bool)
+        return columns
+
+    async def _fetch(self, db: AsyncSession, where=None) -> dict:
+        query = self._query() if where is None else self._query().where(where)
+        parts = []
+        result = await db.stream(query.execution_options(yield_per=LOAD_PARTITION_SIZE))
+        async for rows in result.partitions(LOAD_PARTITION_SIZE):
+            parts.append(self._build(rows))
+        return _concat(parts) if parts else self._build([])
+
+    async def load(self, db: AsyncSession):
+        """(Re)loads every SKU. Changes arriving meanwhile are replayed onto the new arrays."""
+        self._replay, self._resync, self._missing = [], False, set()
+        try:
+            columns = _sorted(await self._fetch(db))
+        except BaseException:
+            self._replay = None
+            raise
+        self.columns, self._tombstones, self._orders = columns, 0, {}
+        replay, self._replay = self._replay, None
+        for message in replay:
+            self._apply(message)
+        self.loaded_at = time.time()
+
+    async def _load_missing(self, db: AsyncSession):
+        missing, self._missing = list(self._missing), set()
+        found = [await self._fetch(db, SkuRecord.sku_id.in_(missing[start:start + LOAD_CHUNK_SIZE]))
+                 for start in range(0, len(missing), LOAD_CHUNK_SIZE)]
+        fresh = _concat(found)
+        # A SKU can have been loaded by an earlier batch, or deleted again, since it was noticed
+        known = self._find(fresh["sku_id"])
+        if (known >= 0).any():
+            fresh = {name: array[known < 0] for name, array in fresh.items()}
+        if len(fresh["sku_id"]):
+            self.columns = _sorted(_concat([self.columns, fresh]))
+            self._orders = {}
+
+    async def sync(self, db: AsyncSession):
+        """Brings in what the change feed could not patch in place: a resync, or SKUs first seen in a delta."""
+        if not PORTFOLIO_STORE or not self.ready:
+            raise StoreUnavailable()
+        if not self._resync and not self._missing:
+            return
+        async with self._lock:
+            if self._resync:
+                await self.load(db)
+            elif self._missing:
+                await self._load_missing(db)
+
+    # --- Change feed ---
+
+    async def start(self, db: AsyncSession):
+        """Subscribes to the change feed, then loads; deltas committed during the load are not lost."""
+        if not PORTFOLIO_STORE or self._task is not None:
+            return
+        self._changes = change_feed.subscribe()
+        self._task = asyncio.create_task(self._follow())
+        await self.load(db)
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            change_feed.unsubscribe(self._changes)
+
+    async def _follow(self):
+        while True:
+            message = await self._changes.get()
+            try:
+                self._apply(message)
+            except Exception:
+                logger.exception("Could not apply a change-feed message; reloading the portfolio store")
+                self._resync = True
+
+    def _apply(self, message: dict):
+        if self._replay is not None:
+            self._replay.append(message)
+        if message.get("resync"):
+            self._resync = True
+            return
+        if self.columns is None:
+            return
+        deltas = message.get("deltas", [])
+        if not deltas:
+            return
+        rows = self._find(_encode_ids(d["sku_id"] for d in deltas))
+        for delta, row in zip(deltas, rows):
+            if row < 0:
+                if not delta.get("deleted"):
+                    self._missing.add(delta["sku_id"])
+                continue
+            if delta.get("deleted"):
+                if self.columns["alive"][row]:
+                    self.columns["alive"][row] = False
+                    self._tombstones += 1
+                continue
+            if delta.get("fields"):
+                self.columns["cached"][row] = True
+            for source, values in (("cache", delta.get("fields") or {}), ("record", delta.get("record") or {})):
+                for field, value in values.items():
+                    column = _SOURCES[source].get(field)
+                    if column in STRING_COLUMNS:
+                        self._set_code(column, row, value)
+                    elif column is not None:
+                        self.columns[column][row] = np.nan if value is None else value
+        self._orders = {}
+        if self._tombstones > MAX_TOMBSTONE_SHARE * len(self.columns["alive"]):
+            alive = self.columns["alive"]
+            self.columns = {name: array[alive] for name, array in self.columns.items()}
+            self._tombstones = 0
+
+    def _set_code(self, column: str, row: int, value):
+        dictionary = self.dictionaries[column]
+        code = dictionary.encode(value)
+        if self.columns[column].dtype != dictionary.dtype:
+            self.columns[column] = self.columns[column].astype(dictionary.dtype)
+        self.columns[column][row] = code
+
+    def _find(self, sku_ids: np.ndarray) -> np.ndarray:
+        """Row of each id, or -1 if the store does not hold it."""
+        ids = self.columns["sku_id"]
+        rows = np.searchsorted(ids, sku_ids)
+        inside = rows < len(ids)
+        found = np.zeros(len(sku_ids), dtype=bool)
+        found[inside] = ids[rows[inside]] == sku_ids[inside]
+        return np.where(found, rows, -1)
+
+    # --- Reads ---
+
+    def _mask(self, filters: Dict[str, str], cached_only: bool = False) -> np.ndarray:
+        mask = self.columns["alive"] & self.columns["cached"] if cached_only else self.columns["alive"].copy()
+        for column, value in filters.items():
+            if value is None:
+                continue
+            code = self.dictionaries[column].codes.get(value)
+            if code is None:
+                return np.zeros_like(mask)
+            mask &= self.columns[column] == code
+        return mask
+
+    def _order(self, sort_by: str, descending: bool) -> Optional[np.ndarray]:
+        """Row order for a sort key (None: by sku_id, the storage order); ties keep sku_id order."""
+        if sort_by == "sku_id":
+            return np.arange(len(self.columns["sku_id"]))[::-1] if descending else None
+        key = (sort_by, descending)
+        if key not in self._orders:
+            if sort_by in STRING_COLUMNS:
+                values = self.dictionaries[sort_by].ranks()[self.columns[sort_by]].astype(np.int64)
+            else:
+                # Missing values sort last either way
+                values = self.columns[sort_by]
+            self._orders[key] = np.argsort(-values if descending else values, kind="stable").astype(np.int32)
+            while len(self._orders) > MAX_CACHED_ORDERS:
+                self._orders.pop(next(iter(self._orders)))
+        return self._orders[key]
+
+    def _rows(self, page: np.ndarray) -> list:
+        columns = {"sku_id": [sku_id.decode("utf-8") for sku_id in self.columns["sku_id"][page].tolist()]}
+        for column in STRING_COLUMNS:
+            values = self.dictionaries[column].values
+            columns[column] = [values[code] for code in self.columns[column][page].tolist()]
+        for column in NUMBER_COLUMNS:
+            # NaN (missing) is the only value unequal to itself. Rounded to float32's ~7 digits, or
+            # the widened float would show digits that were never stored (2.0612683 -> 2.0612683296...)
+            columns[column] = [None if v != v else float(f"{v:.7g}") for v in self.columns[column][page].tolist()]
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def query(self, filters: Dict[str, str], sort_by: str = "sku_id", descending: bool = False,
+              skip: int = 0, limit: int = 100) -> dict:
+        """One page of the SKUs matching `filters` (exact values of STRING_COLUMNS), sorted, with the total match count."""
+        mask = self._mask(filters)
+        order = self._order(sort_by, descending)
+        if order is None:
+            page = np.flatnonzero(mask)[skip:skip + limit]
+        else:
+            # Walks the sort order a block at a time until the page is filled, so early pages skip most of it
+            page, seen, wanted = [], 0, skip + limit
+            for start in range(0, len(order), PAGE_SCAN_BLOCK):
+                block = order[start:start + PAGE_SCAN_BLOCK]
+                block = block[mask[block]]
+                page.append(block)
+                seen += len(block)
+                if seen >= wanted:
+                    break
+            page = np.concatenate(page)[skip:wanted] if page else order[:0]
+        return {"total": int(np.count_nonzero(mask)), "skus": self._rows(page)}
+
+    def aggregate(self, group_by: List[str], filters: Dict[str, str]) -> list:
+        """
+        SKU counts and the rollup sums (plus average GM%) of the cached SKUs matching `filters`,
+        per combination of the `group_by` columns, as GET /skus/summary reports them.
+        """
+        mask = self._mask(filters, cached_only=True)
+        sizes = [len(self.dictionaries[column].values) for column in group_by]
+        keys = np.zeros(int(np.count_nonzero(mask)), dtype=np.int64)
+        for column, size in zip(group_by, sizes):
+            keys = keys * size + self.columns[column][mask]
+        if np.prod(sizes, dtype=float) <= max(len(keys), MAX_DENSE_GROUPS):
+            # Few enough combinations to count into directly, without sorting the keys
+            counts = np.bincount(keys, minlength=int(np.prod(sizes)))
+            groups = np.flatnonzero(counts)
+            counts, inverse, slots = counts[groups], keys, groups
+        else:
+            groups, inverse = np.unique(keys, return_inverse=True)
+            counts, slots = np.bincount(inverse, minlength=len(groups)), np.arange(len(groups))
+        sums = {
+            rollup_field: np.bincount(inverse, weights=np.nan_to_num(self.columns[field][mask]).astype(np.float64),
+                                      minlength=int(slots[-1]) + 1 if len(slots) else 0)[slots]
+            for rollup_field, field in SUM_FIELDS.items()
+        }
+        sums.update({
+            rollup_field: np.bincount(inverse, weights=~np.isnan(self.columns[field][mask]),
+                                      minlength=int(slots[-1]) + 1 if len(slots) else 0)[slots]
+            for rollup_field, field in COUNT_FIELDS.items()
+        })
+        result = []
+        for g, key in enumerate(groups.tolist()):
+            values = []
+            for size, column in zip(reversed(sizes), reversed(group_by)):
+                values.append(self.dictionaries[column].values[key % size])
+                key //= size
+            group = dict(zip(group_by, reversed(values)))
+            group["sku_count"] = int(counts[g])
+            group.update({field: float(values[g]) for field, values in sums.items()})
+            gm_pct_count = group.pop("gm_pct_count")
+            group["avg_gm_pct"] = group.pop("gm_pct_sum") / gm_pct_count if gm_pct_count else None
+            result.append(group)
+        return result
+
+    def stats(self) -> dict:
+        skus = int(self.columns["alive"].sum()) if self.ready else 0
+        size = sum(a.nbytes for a in self.columns.values()) if self.ready else 0
+        return {
+            "enabled": PORTFOLIO_STORE,
+            "ready": self.ready,
+            "skus": skus,
+            "bytes": size,
+            # Arrays only: the dictionaries hold one string per distinct value
+            "bytes_per_sku": size / skus if skus else None,
+            "distinct_values": {column: len(d.values) - 1 for column, d in self.dictionaries.items()},
+            "loaded_at": self.loaded_at,
+        }
+
+def _concat(parts: List[dict]) -> dict:
+    """Concatenates column dicts; code columns widen to the widest part's dtype."""
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+def _sorted(columns: dict) -> dict:
+    order = np.argsort(columns["sku_id"], kind="stable")
+    return {name: array[order] for name, array in columns.items()}
+
+portfolio_store = PortfolioStore()
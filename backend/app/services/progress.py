@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+# Finished jobs are kept around briefly so a late SSE subscriber still sees the final state
+FINISHED_JOB_TTL_SECONDS = 300
+# A stream opened for a job id no upload has used yet is dropped after this long, and at most
+# this many such ids are kept (oldest dropped first), so arbitrary ids cannot pile up
+UNSTARTED_JOB_TTL_SECONDS = 600
+MAX_UNSTARTED_JOBS = 1000
+
+class ImportProgress:
+    """Progress counters for one upload job. Only touched from the event loop thread."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.stage = "queued"
+        self.rows_total = 0
+        self.rows_parsed = 0
+        self.rows_upserted = 0
+        self.rows_scored = 0
+        self.rows_to_score = 0
+        self.done = False
+        self.error = None
+        self.finished_at = None
+        self.created_at = time.monotonic()
+        # Set once an upload reports to this job; until then only progress streams know it
+        self.started = False
+        self._changed = asyncio.Condition()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "stage": self.stage,
+            "rows_total": self.rows_total,
+            "rows_parsed": self.rows_parsed,
+            "rows_upserted": self.rows_upserted,
+            "rows_scored": self.rows_scored,
+            "rows_to_score": self.rows_to_score,
+            "done": self.done,
+            "error": self.error,
+        }
+
+    async def update(self, **fields):
+        for k, v in fields.items():
+            setattr(self, k, v)
+        if self.done and self.finished_at is None:
+            self.finished_at = time.monotonic()
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_for_change(self, timeout: float):
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def events(self, keepalive_seconds: float = 15.0):
+        """Yields Server-Sent Events frames until the job finishes."""
+        last = None
+        while True:
+            state = self.to_dict()
+            if state != last:
+                yield f"data: {json.dumps(state)}\n\n"
+                last = state
+            elif not self.done:
+                yield ": keepalive\n\n"
+            if self.done:
+                return
+            await self.wait_for_change(keepalive_seconds)
+            if _jobs.get(self.job_id) is not self:
+                # Evicted before any upload used it
+                return
+
+# Per-process registry: the SSE stream must hit the same worker as the upload
+_jobs = {}
+
+def get_progress(job_id: str) -> ImportProgress:
+    """The job an upload reports to, created if no progress stream opened it first."""
+    progress = watch_progress(job_id)
+    progress.started = True
+    return progress
+
+def watch_progress(job_id: str) -> ImportProgress:
+    """The job a progress stream follows; created (unstarted) if its upload has not been posted yet."""
+    _evict()
+    if job_id not in _jobs:
+        unstarted = [j for j, p in _jobs.items() if not p.started]
+        # Insertion order is creation order
+        for stale_id in unstarted[:max(0, len(unstarted) - MAX_UNSTARTED_JOBS + 1)]:
+            del _jobs[stale_id]
+        _jobs[job_id] = ImportProgress(job_id)
+    return _jobs[job_id]
+
+def _evict():
+    now = time.monotonic()
+    for job_id in [
+        j for j, p in _jobs.items()
+        if (p.finished_at and now - p.finished_at > FINISHED_JOB_TTL_SECONDS)
+        or (not p.started and now - p.created_at > UNSTARTED_JOB_TTL_SECONDS)
+    ]:
+        del _jobs[job_id]
@@ -0,0 +1,124 @@
+"""
+12/24-month unit, revenue and GM$ projections.
+
+CalculationEngine.project() turns a scored batch into a scenario x SKU x month array in one
+shot; this module stores it as one row of per-scenario float arrays per SKU and aggregates
+portfolio curves in the database by unnesting those arrays (json_each in the embedded SQLite mode).
+"""
+import numpy as np
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import CalculationEngine, SCENARIOS, PROJECTION_MONTHS
+from app.core.database import upsert
+from app.models.projections import SkuProjection
+from app.models.skus import SkuRecord
+
+WRITE_CHUNK_SIZE = 5000
+# Dimensions curves can be grouped by -> sku_records column
+GROUP_COLUMNS = {"market": "target_market", "channel": "primary_channel", "category": "category"}
+
+def projection_rows(engine: CalculationEngine, env: dict, start: int = 0, stop: int = None) -> tuple:
+    """Projection rows for SKUs [start, stop) of an evaluate() result, plus the unscorable SKU ids."""
+    rows_slice = slice(start, stop)
+    units = np.nan_to_num(engine.project(env, rows_slice), nan=0.0, posinf=0.0, neginf=0.0)
+    prices = np.nan_to_num(env["adj_list_price"][rows_slice]).tolist()
+    margins = np.nan_to_num(env["gm_dollar_per_unit"][rows_slice]).tolist()
+    per_scenario = [units[i].tolist() for i in range(len(SCENARIOS))]
+
+    rows, unscorable = [], []
+    for i, (sku_id, scorable) in enumerate(zip(env["sku_id"][rows_slice], env["scorable"][rows_slice].tolist())):
+        if not scorable:
+            unscorable.append(sku_id)
+            continue
+        row = {"sku_id": sku_id, "unit_price": prices[i], "gm_per_unit": margins[i]}
+        for scenario, values in zip(SCENARIOS, per_scenario):
+            row[f"units_{scenario}"] = values[i]
+        rows.append(row)
+    return rows, unscorable
+
+async def write_projection_rows(db: AsyncSession, rows: list, unscorable: list):
+    table = SkuProjection.__table__
+    if rows:
+        stmt = upsert(db, table)
+        value_cols = [c.name for c in table.columns if c.name != "sku_id"]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["sku_id"],
+            set_={c: stmt.excluded[c] for c in value_cols},
+            # Rewrites only rows whose projection actually moved
+            where=(
+                table.c.units_base.is_distinct_from(stmt.excluded.units_base)
+                | table.c.units_best.is_distinct_from(stmt.excluded.units_best)
+                | table.c.units_worst.is_distinct_from(stmt.excluded.units_worst)
+                | table.c.unit_price.is_distinct_from(stmt.excluded.unit_price)
+                | table.c.gm_per_unit.is_distinct_from(stmt.excluded.gm_per_unit)
+            ),
+        )
+        await db.execute(stmt, rows)
+    if unscorable:
+        await db.execute(delete(SkuProjection).where(SkuProjection.sku_id.in_(unscorable)))
+
+async def write_projections(db: AsyncSession, engine: CalculationEngine, env: dict):
+    """Stores projections for every SKU of an evaluate() result, in bounded chunks. Does not commit."""
+    n = len(env["sku_id"])
+    for start in range(0, n, WRITE_CHUNK_SIZE):
+        rows, unscorable = projection_rows(engine, env, start, start + WRITE_CHUNK_SIZE)
+        await write_projection_rows(db, rows, unscorable)
+
+async def rebuild_projections(db: AsyncSession):
+    """Recomputes every SKU's projection, e.g. after a ramp curve or launch-wave spacing change."""
+    from app.services.recalculator import build_calc_engine
+
+    engine = await build_calc_engine(db)
+    result = await db.execute(select(SkuRecord))
+    skus = result.scalars().all()
+    if skus:
+        await write_projections(db, engine, engine.evaluate(skus))
+    await db.commit()
+
+async def portfolio_curves(db: AsyncSession, horizon: int = 12, group_by: list = (), filters: dict = None) -> list:
+    """
+    Monthly units, revenue and GM$ per scenario, summed over the portfolio (or per group)
+    by the database. `filters` maps GROUP_COLUMNS keys to required values.
+    """
+    horizon = max(1, min(horizon, PROJECTION_MONTHS))
+    dims = [f"s.{GROUP_COLUMNS[d]} AS {d}" for d in group_by]
+    dim_refs = [f"s.{GROUP_COLUMNS[d]}" for d in group_by]
+    if db.bind.dialect.name == "sqlite":
+        # Embedded mode stores the arrays as JSON lists; json_each yields (0-based key, value) per month
+        units = {"base": "b.value", "best": "be.value", "worst": "w.value"}
+        month = "(b.key + 1)"
+        source = """json_each(p.units_base) b
+            JOIN json_each(p.units_best) be ON be.key = b.key
+            JOIN json_each(p.units_worst) w ON w.key = b.key"""
+    else:
+        units = {scenario: f"t.units_{scenario}" for scenario in SCENARIOS}
+        month = "t.month"
+        source = """LATERAL unnest(p.units_base, p.units_best, p.units_worst)
+            WITH ORDINALITY AS t(units_base, units_best, units_worst, month)"""
+    sums = []
+    for s in SCENARIOS:
+        sums += [
+            f"SUM({units[s]}) AS units_{s}",
+            f"SUM({units[s]} * p.unit_price) AS revenue_{s}",
+            f"SUM({units[s]} * p.gm_per_unit) AS gm_{s}",
+        ]
+    where = [f"{month} <= :horizon"]
+    params = {"horizon": horizon}
+    for key, value in (filters or {}).items():
+        if value is not None:
+            where.append(f"s.{GROUP_COLUMNS[key]} = :{key}")
+            params[key] = value
+
+    sql = f"""
+        SELECT {", ".join(dims + [f"{month} AS month"] + sums)}
+        FROM sku_projections p
+        JOIN sku_records s ON s.sku_id = p.sku_id
+        CROSS JOIN {source}
+        WHERE {" AND ".join(where)}
+        GROUP BY {", ".join(dim_refs + [month])}
+        ORDER BY {", ".join(dim_refs + [month])}
+    """
+    result = await db.execute(text(sql), params)
+    return [dict(r) for r in result.mappings().all()]
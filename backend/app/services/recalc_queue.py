@@ -0,0 +1,373 @@
+"""
+Distributed recalculation through a Postgres work queue.
+
+A job splits the portfolio into sku_id ranges of RECALC_TASK_SIZE SKUs, one recalc_tasks
+row each. Any number of worker processes, on any number of hosts, claim tasks with
+SELECT ... FOR UPDATE SKIP LOCKED, so two workers never take the same range and none waits
+on another. A worker scores its range with CalculationEngine and writes cache rows,
+rollups, projections, history and change-feed deltas exactly like the in-process paths,
+then commits them together with the task's "done" mark.
+
+A claim is a lease: a task still "running" RECALC_TASK_LEASE_SECONDS after it was claimed
+(its worker crashed or lost its connection) is claimable again, up to
+RECALC_TASK_MAX_ATTEMPTS attempts in all, after which it is marked failed. Finishing is
+fenced on the claim (worker and attempt), so a worker whose lease was taken over discards
+its results instead of counting the range twice in the rollups.
+
+With RECALC_ENGINE=queue, recalculate_all_skus() enqueues a job and works on it alongside
+any running workers until every task is finished (following a newer job that superseded
+it to the end, if there is one). Workers run as
+
+    python -m app.services.recalc_queue work [--processes 4] [--job ID] [--exit-when-idle]
+
+and the same CLI queues jobs, shows their progress (also GET /api/recalc/jobs) and runs a
+local scaling benchmark:
+
+    python -m app.services.recalc_queue enqueue
+    python -m app.services.recalc_queue status [JOB]
+    python -m app.services.recalc_queue bench --processes 1 2 4 8
+
+Postgres only: SQLite has no row locks to skip.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import and_, func, insert, or_, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import AsyncSessionLocal, engine as db_engine
+from app.models.recalc_queue import RecalcJob, RecalcTask
+from app.models.skus import SkuRecord
+from app.services.freshness import current_generation
+from app.services.history import config_version
+from app.services.recalculator import _score_rows, _write_partition, build_calc_engine, load_sku_rows
+from app.services.synergy import refresh_synergy
+
+RECALC_TASK_SIZE = int(os.getenv("RECALC_TASK_SIZE", "5000"))
+RECALC_TASK_LEASE_SECONDS = float(os.getenv("RECALC_TASK_LEASE_SECONDS", "300"))
+RECALC_TASK_MAX_ATTEMPTS = int(os.getenv("RECALC_TASK_MAX_ATTEMPTS", "3"))
+# How often an idle worker (or a caller waiting on its job) looks for claimable tasks
+RECALC_POLL_SECONDS = float(os.getenv("RECALC_POLL_SECONDS", "1"))
+# Longest task error message kept
+MAX_ERROR_LENGTH = 500
+
+logger = logging.getLogger(__name__)
+
+class RecalcJobFailed(Exception):
+    """Some of a job's tasks failed RECALC_TASK_MAX_ATTEMPTS times; their SKUs keep their old scores."""
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _range_filter(lo: Optional[str], hi: Optional[str]):
+    return and_(
+        SkuRecord.sku_id >= lo if lo is not None else true(),
+        SkuRecord.sku_id < hi if hi is not None else true(),
+    )
+
+async def _plan_ranges(db: AsyncSession) -> list:
+    """[lo, hi) sku_id bounds of RECALC_TASK_SIZE SKUs each, from every RECALC_TASK_SIZE-th id; open at both ends."""
+    numbered = select(
+        SkuRecord.sku_id, func.row_number().over(order_by=SkuRecord.sku_id).label("n")
+    ).subquery()
+    res = await db.execute(
+        select(numbered.c.sku_id).where((numbered.c.n - 1) % RECALC_TASK_SIZE == 0).order_by(numbered.c.sku_id)
+    )
+    bounds = [None, *res.scalars().all()[1:], None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+async def enqueue_job(db: AsyncSession) -> int:
+    """
+    Queues a recalculation of every SKU and commits. Unclaimed tasks of older jobs are
+    cancelled, since this one covers their SKUs under a config at least as new. Returns the job id.
+    """
+    engine = await build_calc_engine(db)
+    if engine.computed_synergy:
+        # As recalculate_all_skus: computed scores are inputs, so they are refreshed before scoring
+        await refresh_synergy(db, engine)
+    # Opened here rather than by the first writer, so concurrent workers tag history with one version
+    await config_version(db, engine)
+    sku_count = (await db.execute(select(func.count()).select_from(SkuRecord))).scalar()
+    job = RecalcJob(config_generation=await current_generation(db), sku_count=sku_count)
+    db.add(job)
+    await db.flush()
+    await db.execute(update(RecalcTask).where(RecalcTask.status == "pending").values(status="cancelled"))
+    await db.execute(insert(RecalcTask), [
+        {"job_id": job.id, "lo_sku_id": lo, "hi_sku_id": hi, "status": "pending", "attempts": 0}
+        for lo, hi in await _plan_ranges(db)
+    ])
+    await db.commit()
+    return job.id
+
+async def claim_task(db: AsyncSession, worker: str, job_id: int = None) -> Optional[dict]:
+    """
+    Claims the oldest open task (of `job_id`, if given): a pending one, or a running one whose
+    lease expired. Tasks other workers are claiming are skipped, not waited for. Commits.
+    Returns the claimed task as a dict, or None if there is nothing to claim.
+    """
+    lease_expired = RecalcTask.claimed_at < func.now() - timedelta(seconds=RECALC_TASK_LEASE_SECONDS)
+    query = (
+        select(RecalcTask.id, RecalcTask.job_id, RecalcTask.lo_sku_id, RecalcTask.hi_sku_id, RecalcTask.attempts)
+        .where(or_(RecalcTask.status == "pending", and_(RecalcTask.status == "running", lease_expired)))
+        .order_by(RecalcTask.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if job_id is not None:
+        query = query.where(RecalcTask.job_id == job_id)
+    while True:
+        task = (await db.execute(query)).mappings().first()
+        if task is None:
+            await db.commit()
+            return None
+        if task["attempts"] >= RECALC_TASK_MAX_ATTEMPTS:
+            # Its last worker died holding it
+            await db.execute(update(RecalcTask).where(RecalcTask.id == task["id"]).values(
+                status="failed", finished_at=func.now(), error=func.coalesce(RecalcTask.error, "Worker lost")))
+            await db.commit()
+            continue
+        attempt = task["attempts"] + 1
+        await db.execute(update(RecalcTask).where(RecalcTask.id == task["id"]).values(
+            status="running", worker=worker, attempts=attempt, claimed_at=func.now()))
+        await db.commit()
+        return {**task, "attempts": attempt}
+
+def _held_by(task: dict, worker: str):
+    """The task row, as long as this claim still holds it."""
+    return and_(RecalcTask.id == task["id"], RecalcTask.status == "running",
+                RecalcTask.worker == worker, RecalcTask.attempts == task["attempts"])
+
+async def run_task(db: AsyncSession, task: dict, worker: str) -> int:
+    """
+    Scores and writes one claimed task, committing its results with its "done" mark. A failed
+    attempt goes back to pending (or failed, after the last attempt). Returns the SKUs scored.
+    """
+    try:
+        engine = await build_calc_engine(db)
+        generation = await current_generation(db)
+        rows = await load_sku_rows(db, _range_filter(task["lo_sku_id"], task["hi_sku_id"]), for_update=True)
+        scored = _score_rows(engine, rows, generation)
+        finished = await db.execute(update(RecalcTask).where(_held_by(task, worker)).values(
+            status="done", finished_at=func.now(), sku_count=len(rows), error=None))
+        if finished.rowcount != 1:
+            # The lease expired and another worker took the task over; its results count instead
+            await db.rollback()
+            logger.warning("Recalc task %s was taken over from %s; discarding its results", task["id"], worker)
+            return 0
+        await _write_partition(db, engine, *scored)
+        return len(rows)
+    except Exception as e:
+        await db.rollback()
+        logger.exception("Recalc task %s failed (attempt %s)", task["id"], task["attempts"])
+        last_attempt = task["attempts"] >= RECALC_TASK_MAX_ATTEMPTS
+        await db.execute(update(RecalcTask).where(_held_by(task, worker)).values(
+            status="failed" if last_attempt else "pending",
+            finished_at=func.now() if last_attempt else None,
+            error=f"{type(e).__name__}: {e}"[:MAX_ERROR_LENGTH]))
+        await db.commit()
+        return 0
+
+async def job_progress(db: AsyncSession, job_id: int) -> Optional[dict]:
+    """Task counts by status, SKUs scored so far and throughput of one job; None if there is no such job."""
+    job = await db.get(RecalcJob, job_id)
+    if job is None:
+        return None
+    res = await db.execute(
+        select(RecalcTask.status, func.count(), func.coalesce(func.sum(RecalcTask.sku_count), 0),
+               func.min(RecalcTask.claimed_at), func.max(RecalcTask.finished_at))
+        .where(RecalcTask.job_id == job_id)
+        .group_by(RecalcTask.status)
+    )
+    tasks = {status: 0 for status in ("pending", "running", "done", "failed", "cancelled")}
+    skus_done, started, finished = 0, [], []
+    for status, count, sku_count, first_claim, last_finish in res.all():
+        tasks[status] = count
+        if status == "done":
+            skus_done = sku_count
+        started += [first_claim] if first_claim else []
+        finished += [last_finish] if last_finish else []
+    workers = (await db.execute(
+        select(func.count(RecalcTask.worker.distinct())).where(RecalcTask.job_id == job_id, RecalcTask.status == "running")
+    )).scalar()
+
+    if tasks["pending"] + tasks["running"]:
+        status = "running" if tasks["running"] or tasks["done"] else "queued"
+    else:
+        status = "failed" if tasks["failed"] else "superseded" if tasks["cancelled"] else "done"
+    elapsed = (max(finished) - min(started)).total_seconds() if started and finished else None
+    return {
+        "job_id": job.id,
+        "status": status,
+        "config_generation": job.config_generation,
+        "created_at": job.created_at,
+        "finished_at": max(finished) if finished and status != "running" else None,
+        "skus": job.sku_count,
+        "skus_done": skus_done,
+        "tasks": tasks,
+        "active_workers": workers,
+        # From the first claim to the latest finished task: excludes time spent queued
+        "elapsed_seconds": elapsed,
+        "skus_per_second": skus_done / elapsed if elapsed else None,
+    }
+
+async def recent_jobs(db: AsyncSession, limit: int = 20) -> list:
+    res = await db.execute(select(RecalcJob.id).order_by(RecalcJob.id.desc()).limit(limit))
+    return [await job_progress(db, job_id) for job_id in res.scalars().all()]
+
+async def recalculate_queued(db: AsyncSession, on_progress=None):
+    """
+    recalculate_all_skus for RECALC_ENGINE=queue: enqueues a job and works on it until none of
+    its tasks is open, whether this process or other workers scored them. If a newer job
+    cancelled some of its tasks, that job is followed (and helped) instead, since only it
+    covers those SKUs. `on_progress` is awaited with the SKUs scored so far by the job
+    followed. Raises RecalcJobFailed if any task failed.
+    """
+    job_id = await enqueue_job(db)
+    worker = worker_name()
+    while True:
+        task = await claim_task(db, worker, job_id)
+        if task is not None:
+            await run_task(db, task, worker)
+        progress = await job_progress(db, job_id)
+        if on_progress:
+            await on_progress(progress["skus_done"])
+        if not progress["tasks"]["pending"] + progress["tasks"]["running"]:
+            if not progress["tasks"]["cancelled"]:
+                break
+            newer = (await db.execute(select(func.min(RecalcJob.id)).where(RecalcJob.id > job_id))).scalar()
+            await db.commit()
+            if newer is None:
+                raise RecalcJobFailed(f"Recalculation job {job_id}: tasks were cancelled but no newer job exists")
+            job_id = newer
+            continue
+        if task is None:
+            # Every open task is held by another worker (or waits for a lease to expire)
+            await asyncio.sleep(RECALC_POLL_SECONDS)
+    if progress["tasks"]["failed"]:
+        raise RecalcJobFailed(f"Recalculation job {job_id}: {progress['tasks']['failed']} task(s) failed")
+
+async def work(job_id: int = None, exit_when_idle: bool = False) -> int:
+    """A worker's loop: claims and runs tasks until idle (with `exit_when_idle`) or cancelled. Returns the SKUs scored."""
+    worker = worker_name()
+    scored = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            task = await claim_task(db, worker, job_id)
+            if task is None:
+                if exit_when_idle:
+                    return scored
+                await asyncio.sleep(RECALC_POLL_SECONDS)
+                continue
+            scored += await run_task(db, task, worker)
+
+# --- CLI ---
+
+def _work_process(job_id: Optional[int], exit_when_idle: bool):
+    """Entry point of one spawned worker process."""
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s {worker_name()} %(levelname)s %(message)s")
+    try:
+        asyncio.run(work(job_id, exit_when_idle))
+    except KeyboardInterrupt:
+        # A task claimed at this moment stays running until its lease expires, then is retried
+        pass
+
+def _run_processes(n: int, job_id: Optional[int], exit_when_idle: bool, spawn: bool = False) -> int:
+    if n == 1 and not spawn:
+        _work_process(job_id, exit_when_idle)
+        return 0
+    # spawn, not fork: each worker opens its own event loop and connections
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_work_process, args=(job_id, exit_when_idle)) for _ in range(n)]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.join()
+    return 0 if all(p.exitcode == 0 for p in processes) else 1
+
+# The CLI helpers below each run under their own asyncio.run(), so they close their connections on the way out
+
+async def _enqueue() -> int:
+    try:
+        async with AsyncSessionLocal() as db:
+            return await enqueue_job(db)
+    finally:
+        await db_engine.dispose()
+
+async def _progress(job_id: Optional[int]) -> list:
+    try:
+        async with AsyncSessionLocal() as db:
+            if job_id is None:
+                return await recent_jobs(db, limit=10)
+            progress = await job_progress(db, job_id)
+            return [progress] if progress else []
+    finally:
+        await db_engine.dispose()
+
+def _print_progress(progress: dict):
+    tasks = " ".join(f"{status}={n}" for status, n in progress["tasks"].items() if n)
+    rate = f", {progress['skus_per_second']:.0f} SKUs/s" if progress["skus_per_second"] else ""
+    print(f"job {progress['job_id']}: {progress['status']}, {progress['skus_done']}/{progress['skus']} SKUs "
+          f"({tasks}), {progress['active_workers']} active worker(s){rate}")
+
+def _bench(process_counts: list) -> int:
+    """One full recalculation per worker count, timed from first claim to last finished task."""
+    baseline = None
+    for n in process_counts:
+        job_id = asyncio.run(_enqueue())
+        wall = time.perf_counter()
+        _run_processes(n, job_id, exit_when_idle=True, spawn=True)
+        wall = time.perf_counter() - wall
+        progress = asyncio.run(_progress(job_id))[0]
+        if progress["status"] != "done":
+            _print_progress(progress)
+            return 1
+        rate = progress["skus_per_second"]
+        baseline = baseline or rate
+        print(f"{n:>3} worker(s): {progress['skus_done']} SKUs in {progress['elapsed_seconds']:.2f}s "
+              f"({wall:.2f}s with process startup), {rate:.0f} SKUs/s, speedup x{rate / baseline:.2f}")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Distributed recalculation workers (Postgres only)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    work_cmd = commands.add_parser("work", help="Claim and run recalculation tasks")
+    work_cmd.add_argument("--processes", type=int, default=1)
+    work_cmd.add_argument("--job", type=int, help="Only work on this job")
+    work_cmd.add_argument("--exit-when-idle", action="store_true", help="Exit when no task is claimable")
+    commands.add_parser("enqueue", help="Queue a recalculation of every SKU")
+    status_cmd = commands.add_parser("status", help="Progress of one job, or of the latest ones")
+    status_cmd.add_argument("job", type=int, nargs="?")
+    bench_cmd = commands.add_parser("bench", help="Time a full recalculation with each number of local worker processes")
+    bench_cmd.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    if db_engine.dialect.name != "postgresql":
+        print("The recalculation queue needs Postgres (FOR UPDATE SKIP LOCKED)", file=sys.stderr)
+        return 1
+    if args.command == "work":
+        return _run_processes(args.processes, args.job, args.exit_when_idle)
+    if args.command == "enqueue":
+        print(asyncio.run(_enqueue()))
+        return 0
+    if args.command == "status":
+        jobs = asyncio.run(_progress(args.job))
+        for progress in jobs:
+            _print_progress(progress)
+        return 0 if jobs else 1
+    return _bench(args.processes)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,407 @@
+import asyncio
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 
-from app.models.skus import SkuRecord
-from app.models.settings import GlobalSetting
-from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig
+from app.core.database import AsyncSessionLocal, upsert
+from app.models.skus import SkuRecord, SkuCalculationCache
+from app.models.settings import GlobalSetting, ScoringFormula
+from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig, ChannelRampCurve
 from app.core.calculator import CalculationEngine
+from app.services.change_feed import change_feed, cache_delta
+from app.services.rollups import RollupDelta, ROLLUP_CACHE_FIELDS
+from app.services.sql_engine import recalculate_all_skus_sql
+from app.services.projections import projection_rows, write_projection_rows, write_projections, rebuild_projections
+from app.services.history import record_history
+from app.services.synergy import moved_groups, refresh_synergy
+from app.services.freshness import CONSISTENCY_MODE, bump_generation, current_generation, mark_stale, stale_filter, stale_sweeper
+
+# Parallel recalculation: RECALC_WORKERS > 1 scores partitions in a process pool
+RECALC_WORKERS = int(os.getenv("RECALC_WORKERS", "1"))
+RECALC_PARTITION_BY = os.getenv("RECALC_PARTITION_BY", "hash")  # "hash" or "market"
+RECALC_PARTITIONS = int(os.getenv("RECALC_PARTITIONS", "0")) or RECALC_WORKERS * 4
+RECALC_MAX_PARTITION_SIZE = 10000
+PROGRESS_EVERY = 1000
+# SKU ids per IN list when loading rows by id (keeps under driver parameter limits)
+LOAD_CHUNK_SIZE = 10000
+# "python" scores in this process (or the pool); "sql" runs the set-based statement in Postgres;
+# "queue" hands sku_id ranges to recalculation workers (services/recalc_queue.py, Postgres only)
+RECALC_ENGINE = os.getenv("RECALC_ENGINE", "python")
+# SQLite has no row locks, so its stale batches are serialized per process instead
+_stale_lock = asyncio.Lock()
+
+SKU_FIELDS = [c.name for c in SkuRecord.__table__.columns]
+# Config generation a cache row was scored under (services/freshness.py); written with, but not part of, its values
+STAMP_FIELD = "config_generation"
+# rank_* columns are not produced by the engine, so they are left untouched on write
+CACHE_FIELDS = [c.name for c in SkuCalculationCache.__table__.columns
+                if c.name not in ("sku_id", STAMP_FIELD) and not c.name.startswith("rank_")]
+
+_pool = None
 
 async def build_calc_engine(db: AsyncSession) -> CalculationEngine:
     settings_res = await db.execute(select(GlobalSetting))
     settings = {s.setting_key: s.setting_value for s in settings_res.scalars().all()}
-    
+
     market_res = await db.execute(select(MarketConfig))
     markets = {m.market_name: m for m in market_res.scalars().all()}
-    
+
     channel_res = await db.execute(select(MarketChannelConfig))
     market_channels = {f"{c.market_id}_{c.channel}": c for c in channel_res.scalars().all()}
-    
+
     category_res = await db.execute(select(MarketCategoryConfig))
     market_categories = {f"{c.market_id}_{c.channel}_{c.category}": c for c in category_res.scalars().all()}
-        
-    return CalculationEngine(settings, markets, market_channels, market_categories)
 
-async def recalculate_all_skus(db: AsyncSession):
+    formula_res = await db.execute(select(ScoringFormula))
+    formulas = {f.formula_key: f.expression for f in formula_res.scalars().all()}
+
+    curve_res = await db.execute(select(ChannelRampCurve))
+    ramp_curves = {c.channel: [float(v) for v in c.curve.split(",")] for c in curve_res.scalars().all()}
+
+    return CalculationEngine(settings, markets, market_channels, market_categories, formulas, ramp_curves)
+
+async def recalculate_all_skus(db: AsyncSession, on_progress=None):
+    """Rescores every SKU. `on_progress`, if given, is awaited with the running count of scored SKUs."""
+    if RECALC_ENGINE == "queue" and db.bind.dialect.name == "postgresql":
+        from app.services.recalc_queue import recalculate_queued
+        await recalculate_queued(db, on_progress=on_progress)
+        return
     engine = await build_calc_engine(db)
-    result = await db.execute(select(SkuRecord).options(selectinload(SkuRecord.cache)))
+    generation = await current_generation(db)
+    if engine.computed_synergy:
+        # Settings, markets or the whole portfolio may have changed: every group's signals are refreshed
+        # first, and committed so the parallel writers' sessions score against them too
+        if await refresh_synergy(db, engine):
+            await db.commit()
+    if RECALC_ENGINE == "sql" and db.bind.dialect.name == "postgresql":
+        has_formulas = (await db.execute(select(ScoringFormula.formula_key).limit(1))).first()
+        if not has_formulas:
+            await recalculate_all_skus_sql(db, generation, on_progress=on_progress)
+            await rebuild_projections(db)
+            return
+    if RECALC_WORKERS > 1:
+        await recalculate_all_skus_parallel(db, generation, on_progress=on_progress)
+        return
+
+    # populate_existing: SKUs already in the session must see the refreshed computed scores. The records
+    # are locked, and their caches read by selectinload's own statement afterwards, so the old values the
+    # rollups subtract are the ones this transaction replaces
+    result = await db.execute(
+        select(SkuRecord).options(selectinload(SkuRecord.cache)).order_by(SkuRecord.sku_id)
+        .with_for_update(of=SkuRecord).execution_options(populate_existing=True)
+    )
     skus = result.scalars().all()
-    
-    for db_sku in skus:
-        new_cache = engine.calculate_sku(db_sku)
+
+    env = engine.evaluate(skus) if skus else None
+    deltas = []
+    rollup_delta = RollupDelta()
+    for i, (db_sku, new_values) in enumerate(zip(skus, engine.cache_rows(env) if skus else []), 1):
+        old_values = old_rollup = None
         if db_sku.cache:
-            for k, v in new_cache.__dict__.items():
-                if not k.startswith('_'):
-                    setattr(db_sku.cache, k, v)
+            old_values = {k: getattr(db_sku.cache, k) for k in new_values}
+            old_rollup = {k: getattr(db_sku.cache, k) for k in ROLLUP_CACHE_FIELDS}
+            for k, v in new_values.items():
+                setattr(db_sku.cache, k, v)
         else:
-            db_sku.cache = new_cache
-            
+            db_sku.cache = SkuCalculationCache(**new_values)
+        setattr(db_sku.cache, STAMP_FIELD, generation)
+        changed = cache_delta(old_values, new_values)
+        if changed or old_values is None:
+            rollup_delta.remove(db_sku, old_rollup)
+            rollup_delta.add(db_sku, db_sku.cache)
+        deltas.append({"sku_id": db_sku.sku_id, "fields": changed})
+        if i % PROGRESS_EVERY == 0:
+            # Yield so other requests and progress streams get a turn during long rescoring
+            await asyncio.sleep(0)
+            if on_progress:
+                await on_progress(i)
+
+    if skus:
+        await write_projections(db, engine, env)
+    await rollup_delta.apply(db)
+    await record_history(db, deltas, engine)
+    await change_feed.publish(db, deltas)
     await db.commit()
+    if on_progress:
+        await on_progress(len(skus))
+
+async def recalculate_skus(db: AsyncSession, where, before: list) -> list:
+    """
+    Rescores the SKUs matching `where` in one batch after their records were edited in this
+    transaction, and commits. `before` holds their (row, cache) pairs from load_sku_rows(...,
+    for_update=True) taken before the edit, so rollups move out of a SKU's old
+    market/channel/category; SKUs missing from it are new. With computed synergy on, SKUs whose computed scores moved because
+    of the edit (same market/category, see services/synergy.py) are rescored in the same batch.
+    Returns (sku_id, old cache, new cache values) per SKU matching `where`.
+    """
+    previous = {row["sku_id"]: (row, old_cache) for row, old_cache in before}
+    rows = await load_sku_rows(db, where, for_update=True)
+    engine = await build_calc_engine(db)
+    generation = await current_generation(db)
+    edited = {row["sku_id"] for row, _ in rows}
+    if engine.computed_synergy:
+        groups = moved_groups([row for row, _ in before], [row for row, _ in rows])
+        moved = await refresh_synergy(db, engine, groups) if groups else []
+        if moved:
+            neighbours = [sku_id for sku_id in moved if sku_id not in edited]
+            rows = await load_sku_rows(db, where) + await load_sku_rows_by_id(db, neighbours, for_update=True)
+    env = engine.evaluate([row for row, _ in rows]) if rows else None
+
+    results, deltas, scored = [], [], []
+    rollup_delta = RollupDelta()
+    for (row, old_cache), values in zip(rows, engine.cache_rows(env) if rows else []):
+        out = {"sku_id": row["sku_id"]}
+        for field in CACHE_FIELDS:
+            out[field] = values.get(field)
+        changed = cache_delta(old_cache, out)
+        old_row = previous.get(row["sku_id"], (row, old_cache))[0]
+        # Edited record fields ride along, for subscribers that track more than the cache
+        record = {f: v for f, v in row.items() if old_row.get(f) != v}
+        rewrite = changed or old_cache is None or old_cache[STAMP_FIELD] != generation
+        if rewrite:
+            results.append({**out, STAMP_FIELD: generation})
+        if rewrite or record:
+            deltas.append({"sku_id": row["sku_id"], "fields": changed, **({"record": record} if record else {})})
+        rollup_delta.remove(old_row, old_cache)
+        rollup_delta.add(row, out)
+        if row["sku_id"] in edited:
+            scored.append((row["sku_id"], old_cache, out))
+
+    await _write_partition(db, engine, results, deltas, rollup_delta, projection_rows(engine, env) if rows else ([], []))
+    return scored
+
+async def recalculate_stale(db: AsyncSession, where=None, batch_size: int = RECALC_MAX_PARTITION_SIZE,
+                            max_batches: int = None, skip_locked: bool = False) -> int:
+    """
+    Rescores cached SKUs (those matching `where`, if given) scored under an older config
+    generation, `batch_size` at a time, committing each batch; at most `max_batches` batches.
+    A batch's SKU and cache rows are locked while it is scored, so concurrent callers never
+    rescore the same SKU twice: they wait for it (and then find it fresh), or skip it with `skip_locked`.
+    Returns the number of SKUs rescored.
+    """
+    done = batches = 0
+    while max_batches is None or batches < max_batches:
+        if db.bind.dialect.name == "sqlite":
+            async with _stale_lock:
+                rescored = await _recalculate_stale_batch(db, where, batch_size, skip_locked)
+        else:
+            rescored = await _recalculate_stale_batch(db, where, batch_size, skip_locked)
+        if not rescored:
+            break
+        done += rescored
+        batches += 1
+    return done
+
+async def _recalculate_stale_batch(db: AsyncSession, where, batch_size: int, skip_locked: bool) -> int:
+    cache = SkuCalculationCache.__table__
+    generation = await current_generation(db)
+    query = select(cache.c.sku_id).join(SkuRecord, SkuRecord.sku_id == cache.c.sku_id).where(stale_filter(generation))
+    if where is not None:
+        query = query.where(where)
+    # SKU row before cache row, in sku_id order, as every cache writer locks them
+    query = query.order_by(cache.c.sku_id).limit(batch_size).with_for_update(
+        of=[SkuRecord.__table__, cache], skip_locked=skip_locked)
+    sku_ids = (await db.execute(query)).scalars().all()
+    if not sku_ids:
+        await db.commit()
+        return 0
+    engine = await build_calc_engine(db)
+    rows = await load_sku_rows(db, SkuRecord.sku_id.in_(sku_ids))
+    await _write_partition(db, engine, *_score_rows(engine, rows, generation))
+    return len(sku_ids)
+
+async def config_changed(db: AsyncSession, where=None):
+    """
+    Call instead of committing a config write that can change scores. Commits it with a new
+    config generation, then rescores the portfolio (CONSISTENCY_MODE=eager) or leaves the
+    stale rows to readers and the sweeper (lazy). With `where`, the write only reaches the
+    SKUs it matches (e.g. one market's): just their rows are marked stale and rescored.
+    Returns how many SKUs were marked stale, or None for the whole portfolio.
+    """
+    marked = None
+    if where is None:
+        await bump_generation(db)
+    else:
+        marked = await mark_stale(db, where)
+    await db.commit()
+    if CONSISTENCY_MODE != "lazy":
+        if where is None:
+            await recalculate_all_skus(db)
+        elif marked:
+            await recalculate_stale(db, where)
+        return marked
+    if where is None:
+        engine = await build_calc_engine(db)
+        if engine.computed_synergy and await refresh_synergy(db, engine):
+            # Computed scores are inputs rather than results, so they are brought up to date now
+            await db.commit()
+    stale_sweeper.wake()
+    return marked
+
+# --- Parallel Mode ---
+
+def get_recalc_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent holds an event loop and open DB connections
+        _pool = ProcessPoolExecutor(max_workers=RECALC_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_recalc_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _score_rows(engine: CalculationEngine, rows: list, generation: int) -> tuple:
+    """
+    Scores (sku_row, old_cache_row) pairs, e.g. one partition. Returns the cache rows that
+    need writing (stamped with `generation`), the per-SKU deltas, the rollup adjustments and
+    the rows' projections.
+    """
+    results, deltas = [], []
+    rollup_delta = RollupDelta()
+    if not rows:
+        return results, deltas, rollup_delta, ([], [])
+    env = engine.evaluate([row for row, _ in rows])
+    scored = engine.cache_rows(env)
+    for (row, old_cache), values in zip(rows, scored):
+        out = {"sku_id": row["sku_id"]}
+        for field in CACHE_FIELDS:
+            out[field] = values.get(field)
+        changed = cache_delta(old_cache, out)
+        # Unchanged rows are only restamped; new SKUs always get a cache row
+        if changed or old_cache is None:
+            deltas.append({"sku_id": row["sku_id"], "fields": changed})
+            rollup_delta.remove(row, old_cache)
+            rollup_delta.add(row, out)
+        if changed or old_cache is None or old_cache[STAMP_FIELD] != generation:
+            results.append({**out, STAMP_FIELD: generation})
+    return results, deltas, rollup_delta, projection_rows(engine, env)
+
+def _score_partition(snapshot: tuple, rows: list, generation: int) -> tuple:
+    """Runs inside a pool worker: _score_rows() for one partition."""
+    return _score_rows(CalculationEngine.from_snapshot(snapshot), rows, generation)
+
+async def _plan_partitions(db: AsyncSession) -> list:
+    """Returns one WHERE clause per partition."""
+    if RECALC_PARTITION_BY == "market":
+        res = await db.execute(select(SkuRecord.target_market).distinct())
+        return [SkuRecord.target_market.is_(None) if m is None else SkuRecord.target_market == m
+                for m in res.scalars().all()]
+
+    res = await db.execute(select(SkuRecord.sku_id))
+    sku_ids = res.scalars().all()
+    n_parts = max(RECALC_PARTITIONS, -(-len(sku_ids) // RECALC_MAX_PARTITION_SIZE), 1)
+    buckets = [[] for _ in range(n_parts)]
+    for sku_id in sku_ids:
+        # crc32 rather than hash(): stable across processes and restarts
+        buckets[zlib.crc32(sku_id.encode("utf-8")) % n_parts].append(sku_id)
+    return [SkuRecord.sku_id.in_(ids) for ids in buckets if ids]
+
+async def load_sku_rows(db: AsyncSession, where, for_update: bool = False) -> list:
+    """
+    SKU rows matching `where` (e.g. one partition), each paired with its current cache values (None if uncached).
+    With `for_update`, the SKU rows are locked until the transaction ends, so no other writer
+    changes their cache in between and the rollups subtract exactly the values read here.
+    """
+    cache = SkuCalculationCache.__table__
+    if for_update:
+        # Locked by a statement of its own: one that waited for a lock would still read the
+        # cache as of its start, i.e. the values the lock holder has just replaced
+        await db.execute(select(SkuRecord.sku_id).where(where).order_by(SkuRecord.sku_id).with_for_update())
+    res = await db.execute(
+        select(
+            *SkuRecord.__table__.columns,
+            cache.c.sku_id.label("cache__sku_id"),
+            *[cache.c[f].label(f"cache__{f}") for f in CACHE_FIELDS + [STAMP_FIELD]],
+        )
+        .outerjoin(cache, cache.c.sku_id == SkuRecord.sku_id)
+        .where(where)
+    )
+    rows = []
+    for r in res.mappings().all():
+        row = {f: r[f] for f in SKU_FIELDS}
+        old_cache = None
+        if r["cache__sku_id"] is not None:
+            old_cache = {f: r[f"cache__{f}"] for f in CACHE_FIELDS + [STAMP_FIELD]}
+        rows.append((row, old_cache))
+    return rows
+
+async def load_sku_rows_by_id(db: AsyncSession, sku_ids: list, for_update: bool = False) -> list:
+    """load_sku_rows() for a list of ids of any length, a bounded IN list at a time."""
+    rows = []
+    if for_update:
+        sku_ids = sorted(sku_ids)
+    for start in range(0, len(sku_ids), LOAD_CHUNK_SIZE):
+        rows += await load_sku_rows(db, SkuRecord.sku_id.in_(sku_ids[start:start + LOAD_CHUNK_SIZE]), for_update)
+    return rows
+
+async def _locked_rollup_delta(db: AsyncSession, results: list) -> RollupDelta:
+    """
+    Locks the SKUs of scored cache rows and builds their rollup adjustments from the cache
+    values the rows are about to replace, for results scored from rows read without a lock.
+    """
+    new = {out["sku_id"]: out for out in results}
+    rollup_delta = RollupDelta()
+    for row, old_cache in await load_sku_rows_by_id(db, list(new), for_update=True):
+        rollup_delta.remove(row, old_cache)
+        rollup_delta.add(row, new[row["sku_id"]])
+    return rollup_delta
+
+async def _write_partition(db: AsyncSession, engine: CalculationEngine, results: list, deltas: list, rollup_delta: RollupDelta, projections: tuple):
+    await write_projection_rows(db, *projections)
+    if results:
+        stmt = upsert(db, SkuCalculationCache.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["sku_id"],
+            set_={f: stmt.excluded[f] for f in CACHE_FIELDS + [STAMP_FIELD]},
+        )
+        await db.execute(stmt, results)
+    await rollup_delta.apply(db)
+    await record_history(db, deltas, engine)
+    await change_feed.publish(db, deltas)
+    await db.commit()
+
+async def recalculate_all_skus_parallel(db: AsyncSession, generation: int, on_progress=None):
+    """
+    Partitioned recalculation, pipelined in three stages:
+    the reader loads partition N+1 while the pool scores partition N
+    and a separate writer session upserts partition N-1.
+    """
+    engine = await build_calc_engine(db)
+    snapshot = engine.snapshot()
+    partitions = await _plan_partitions(db)
+
+    loop = asyncio.get_running_loop()
+    pool = get_recalc_pool()
+    # Bounded so at most a few scored partitions are held in memory at once
+    in_flight = asyncio.Queue(maxsize=RECALC_WORKERS * 2)
+
+    async def read_and_submit():
+        for where in partitions:
+            rows = await load_sku_rows(db, where)
+            await in_flight.put((loop.run_in_executor(pool, _score_partition, snapshot, rows, generation), len(rows)))
+        await in_flight.put(None)
+
+    async def write_results():
+        scored = 0
+        async with AsyncSessionLocal() as writer:
+            while (item := await in_flight.get()) is not None:
+                future, partition_size = item
+                # The reader took no locks, so the rollups are adjusted against what the writer replaces
+                results, deltas, _, projections = await future
+                rollup_delta = await _locked_rollup_delta(writer, results)
+                await _write_partition(writer, engine, results, deltas, rollup_delta, projections)
+                scored += partition_size
+                if on_progress:
+                    await on_progress(scored)
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(read_and_submit())
+        tg.create_task(write_results())
@@ -0,0 +1,170 @@
+"""
+Incrementally maintained market x channel x category x recommendation aggregates.
+
+Every code path that writes SkuCalculationCache rows (or moves a cached SKU to another
+market/channel/category) collects a RollupDelta - the old contribution subtracted, the
+new one added - and applies it in the same transaction. The old contribution is read only
+once the SKU rows are locked (load_sku_rows(..., for_update=True)), so two writers of the same
+SKU never both subtract the same values. rebuild_rollups() recomputes the
+table from scratch and can report drift against the incrementally maintained copy.
+"""
+import asyncio
+import math
+
+from sqlalchemy import func, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import upsert
+from app.models.rollups import PortfolioRollup
+from app.models.skus import SkuRecord, SkuCalculationCache
+
+KEY_FIELDS = ["market", "channel", "category", "recommendation"]
+# rollup column -> cache column it sums
+SUM_FIELDS = {
+    "revenue_sum": "monthly_revenue",
+    "gm_dollar_sum": "monthly_gm_dollar",
+    "gm_base_sum": "monthly_gm_base",
+    "gm_best_sum": "monthly_gm_best",
+    "gm_worst_sum": "monthly_gm_worst",
+    "gm_pct_sum": "gm_pct",
+}
+# rollup column -> cache column whose non-null values it counts (the divisor for an average)
+COUNT_FIELDS = {"gm_pct_count": "gm_pct"}
+# Column order of RollupDelta group values
+DELTA_FIELDS = ["sku_count"] + list(COUNT_FIELDS) + list(SUM_FIELDS)
+# Cache columns a rollup contribution depends on
+ROLLUP_CACHE_FIELDS = ["final_recommendation"] + list(SUM_FIELDS.values())
+
+def _get(source, field):
+    return source.get(field) if isinstance(source, dict) else getattr(source, field, None)
+
+def rollup_key(sku, cache) -> tuple:
+    """Group key for a SKU (SkuRecord or column dict) and its cache values."""
+    return (
+        _get(sku, "target_market") or "",
+        _get(sku, "primary_channel") or "",
+        _get(sku, "category") or "",
+        _get(cache, "final_recommendation") or "",
+    )
+
+class RollupDelta:
+    """Per-group count/sum adjustments. Plain dicts only, so it pickles out of recalc workers."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def add(self, sku, cache, sign: int = 1):
+        """Adds (sign=1) or removes (sign=-1) one SKU's contribution."""
+        if cache is None:
+            return
+        group = self.groups.setdefault(rollup_key(sku, cache), [0] * (1 + len(COUNT_FIELDS)) + [0.0] * len(SUM_FIELDS))
+        group[0] += sign
+        for i, cache_field in enumerate(COUNT_FIELDS.values(), 1):
+            group[i] += sign * (_get(cache, cache_field) is not None)
+        for i, cache_field in enumerate(SUM_FIELDS.values(), 1 + len(COUNT_FIELDS)):
+            group[i] += sign * (_get(cache, cache_field) or 0.0)
+
+    def remove(self, sku, cache):
+        self.add(sku, cache, -1)
+
+    def merge(self, other: "RollupDelta"):
+        for key, values in other.groups.items():
+            group = self.groups.setdefault(key, [0] * (1 + len(COUNT_FIELDS)) + [0.0] * len(SUM_FIELDS))
+            for i, v in enumerate(values):
+                group[i] += v
+
+    async def apply(self, db: AsyncSession):
+        """Upserts the adjustments in one statement; call inside the transaction that wrote the cache rows."""
+        rows = []
+        # In key order, so concurrent writers (e.g. queue workers) lock shared rollup rows in the same order
+        for key, values in sorted(self.groups.items()):
+            if values[0] == 0 and not any(values[1:]):
+                continue
+            row = dict(zip(KEY_FIELDS, key))
+            row.update(zip(DELTA_FIELDS, values))
+            rows.append(row)
+        self.groups = {}
+        if not rows:
+            return
+
+        table = PortfolioRollup.__table__
+        stmt = upsert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=KEY_FIELDS,
+            set_={f: table.c[f] + stmt.excluded[f] for f in DELTA_FIELDS},
+        )
+        await db.execute(stmt, rows)
+        await db.execute(delete(PortfolioRollup).where(PortfolioRollup.sku_count <= 0))
+
+async def _compute_rollups(db: AsyncSession) -> dict:
+    """Full GROUP BY over every cached SKU: the ground truth the table should match."""
+    cache = SkuCalculationCache
+    key_cols = [
+        func.coalesce(SkuRecord.target_market, "").label("market"),
+        func.coalesce(SkuRecord.primary_channel, "").label("channel"),
+        func.coalesce(SkuRecord.category, "").label("category"),
+        func.coalesce(cache.final_recommendation, "").label("recommendation"),
+    ]
+    count_cols = [func.count(getattr(cache, src)).label(dst) for dst, src in COUNT_FIELDS.items()]
+    sum_cols = [func.coalesce(func.sum(getattr(cache, src)), 0.0).label(dst) for dst, src in SUM_FIELDS.items()]
+    res = await db.execute(
+        select(*key_cols, func.count().label("sku_count"), *count_cols, *sum_cols)
+        .join(cache, cache.sku_id == SkuRecord.sku_id)
+        .group_by(*key_cols)
+    )
+    return {tuple(r[k] for k in KEY_FIELDS): dict(r) for r in res.mappings().all()}
+
+def _diff_rollups(expected: dict, actual: dict, rel_tol: float = 1e-6) -> list:
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        exp, act = expected.get(key), actual.get(key)
+        if exp is None or act is None:
+            mismatches.append({"group": dict(zip(KEY_FIELDS, key)), "expected": exp, "actual": act})
+            continue
+        if any(not math.isclose(exp[f], act[f], rel_tol=rel_tol, abs_tol=1e-6) for f in DELTA_FIELDS):
+            mismatches.append({"group": dict(zip(KEY_FIELDS, key)), "expected": exp, "actual": act})
+    return mismatches
+
+async def rebuild_rollups(db: AsyncSession, verify_only: bool = False) -> dict:
+    """
+    Recomputes the rollup table from the cache and reports groups where the incrementally
+    maintained rows had drifted. With verify_only the table is left untouched.
+    """
+    expected = await _compute_rollups(db)
+    res = await db.execute(select(PortfolioRollup))
+    actual = {
+        tuple(getattr(r, k) for k in KEY_FIELDS): {f: getattr(r, f) for f in KEY_FIELDS + DELTA_FIELDS}
+        for r in res.scalars().all()
+    }
+    mismatches = _diff_rollups(expected, actual)
+
+    if not verify_only:
+        await db.execute(delete(PortfolioRollup))
+        if expected:
+            await db.execute(PortfolioRollup.__table__.insert(), list(expected.values()))
+        await db.commit()
+    return {"groups": len(expected), "mismatches": mismatches}
+
+async def ensure_rollups(db: AsyncSession):
+    """Builds the table once for databases that had cache rows before rollups existed."""
+    has_rollups = (await db.execute(select(PortfolioRollup.market).limit(1))).first()
+    has_cache = (await db.execute(select(SkuCalculationCache.sku_id).limit(1))).first()
+    if has_cache and not has_rollups:
+        await rebuild_rollups(db)
+
+async def _main(verify_only: bool):
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        report = await rebuild_rollups(db, verify_only=verify_only)
+    print(f"{report['groups']} groups, {len(report['mismatches'])} mismatched")
+    for m in report["mismatches"]:
+        print(m)
+
+if __name__ == "__main__":
+    # python -m app.services.rollups [--verify]
+    import sys
+    asyncio.run(_main(verify_only="--verify" in sys.argv))
@@ -0,0 +1,239 @@
+"""
+Set-based scoring backend: the CalculationEngine math as one INSERT ... SELECT ... ON CONFLICT.
+
+sku_records is joined with market_config, market_channel_config, market_category_config and
+a one-row pivot of global_settings; the category -> channel -> global override cascade is a
+COALESCE. Rows whose values did not change are left alone (IS DISTINCT FROM), and only the
+changed rows come back - paired with their pre-update values - for rollups and the change feed.
+Postgres only; recalculate_all_skus picks it when RECALC_ENGINE=sql and no custom scoring
+formulas are configured (those only exist as NumPy kernels).
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.calculator import SETTING_DEFAULTS, SYNERGY_SCORE_FIELDS, CACHE_OUTPUT_FIELDS as CACHE_COLUMNS
+from app.services.change_feed import change_feed, cache_delta
+from app.services.rollups import RollupDelta
+from app.services.history import record_history
+
+def _score_column(col: str) -> str:
+    computed = SYNERGY_SCORE_FIELDS.get(col)
+    if computed is None:
+        return f"s.{col}"
+    # CalculationEngine.computed_synergy: the computed score when switched on and present
+    return f"CASE WHEN cfg.computed_synergy >= 0.5 THEN COALESCE(s.{computed}, s.{col}) ELSE s.{col} END"
+
+def _weighted_sum(pairs) -> str:
+    return " + ".join(f"COALESCE({_score_column(col)}, 0) * cfg.{weight}" for col, weight in pairs)
+
+def _scenario_units(name: str) -> str:
+    return (
+        f"u.common_units * POWER(1.0 / (cfg.price_eff_index * (1.0 + cfg.scenario_{name}_price_delta)), cfg.price_elasticity_abs)"
+        f" * cfg.scenario_{name}_marketing_mult * cfg.scenario_{name}_adoption_mult * cfg.scenario_{name}_competitor_mult"
+    )
+
+def _pivot_settings() -> str:
+    return ",\n            ".join(
+        f"COALESCE(MAX(CASE WHEN setting_key = '{key}' THEN setting_value END), {default}) AS {key}"
+        for key, default in SETTING_DEFAULTS.items()
+    )
+
+SCORING_CTES = f"""
+    settings_pivot AS (
+        SELECT
+            {_pivot_settings()}
+        FROM global_settings
+    ),
+    cfg AS (
+        SELECT p.*, 1.0 * (1.0 + p.global_price_adjustment_pct) AS price_eff_index FROM settings_pivot p
+    ),
+    base AS (
+        SELECT
+            s.sku_id,
+            COALESCE(s.ip_risk_high, FALSE) OR COALESCE(s.regulatory_prohibition, FALSE) AS hard_stop,
+            COALESCE(s.regulatory_eligible, TRUE) AS pass_regulatory,
+            COALESCE(s.supply_ready, TRUE) AS pass_supply_ready,
+            CASE WHEN mk.market_name IS NOT NULL THEN COALESCE(s.local_list_price, 0) * mk.price_multiplier
+                 ELSE COALESCE(s.local_list_price, 0) END AS adj_list_price,
+            CASE WHEN mk.market_name IS NOT NULL
+                 THEN COALESCE(s.landed_cost, 0) * (1.0 + mk.import_freight_pct) * (1.0 + mk.duties_taxes_pct)
+                 ELSE COALESCE(s.landed_cost, 0) END AS imported_cogs,
+            CASE WHEN mc.market_id IS NOT NULL
+                 THEN mc.commission_pct + mc.fulfillment_pct + mc.cod_pct + mc.returns_allowance_pct
+                      + mc.listing_fees_pct + mc.trade_terms_pct + mc.rebates_pct + mc.promo_accrual_pct
+                 ELSE 0.0 END AS cts_pct,
+            {_weighted_sum([("score_consumer_trend", "consumer_trend_weight"), ("score_point_of_diff", "point_of_diff_weight"),
+                            ("score_channel_suitability", "channel_suitability_weight"), ("score_strategic_role", "strategic_role_weight"),
+                            ("score_marketing_leverage", "marketing_leverage_weight")])} AS score_b,
+            {_weighted_sum([("score_price_ladder", "price_ladder_weight"), ("score_usage_occasion", "usage_occasion_weight"),
+                            ("score_channel_diff", "channel_diff_weight"), ("score_story_cohesion", "story_cohesion_weight"),
+                            ("score_operational_synergy", "operational_synergy_weight")])} AS score_c,
+            {_weighted_sum([("score_regulatory_delay", "regulatory_delay_weight"), ("score_retail_listing", "retail_listing_weight"),
+                            ("score_competitive", "competitive_weight"), ("score_supply_chain", "supply_chain_weight"),
+                            ("score_price_war", "price_war_weight")])} AS score_d,
+            CASE WHEN mk.market_name IS NOT NULL THEN COALESCE(mk.doc_distributor, 0) + COALESCE(mk.doc_retail, 0)
+                 ELSE 0.0 END AS doc_days,
+            CASE WHEN s.moq > 0 THEN s.moq END AS moq,
+            CASE WHEN s.shelf_life_months > 0 THEN s.shelf_life_months END AS shelf_life,
+            COALESCE(s.lead_time_days, 0) AS lead_time,
+            CASE WHEN mc.market_id IS NOT NULL THEN mc.channel_weight ELSE 1.0 END AS ch_weight,
+            CASE WHEN mc.market_id IS NOT NULL THEN mc.base_units_month ELSE 0.0 END AS base_units,
+            -- 3-tier cascade: category override -> market-channel default -> global setting
+            COALESCE(cat.marketing_lift_override, mc.marketing_lift, cfg.marketing_lift) AS marketing_budget_multiplier,
+            COALESCE(cat.adoption_rate_override, mc.retail_adoption_rate, cfg.adoption_rate) AS adoption_factor,
+            COALESCE(cat.competitor_idx_override, mc.competitor_activity_idx, cfg.competitor_idx) AS target_comp_index
+        FROM sku_records s
+        CROSS JOIN cfg
+        LEFT JOIN market_config mk ON mk.market_name = s.target_market
+        LEFT JOIN market_channel_config mc ON mc.market_id = s.target_market AND mc.channel = s.primary_channel
+        LEFT JOIN market_category_config cat
+               ON cat.market_id = s.target_market AND cat.channel = s.primary_channel
+              AND cat.category = COALESCE(NULLIF(s.category, ''), 'Unknown')
+        WHERE COALESCE(s.target_market, '') <> '' AND COALESCE(s.primary_channel, '') <> ''
+    ),
+    factors AS (
+        SELECT
+            b.*,
+            b.adj_list_price - (b.imported_cogs + b.cts_pct * b.adj_list_price) AS gm_dollar_per_unit,
+            b.score_b * b.ch_weight AS channel_weighted_score,
+            GREATEST(cfg.global_risk_floor, 1.0 - cfg.global_risk_slope * (b.score_d - 1.0)) AS risk_factor,
+            GREATEST(0.85, LEAST(1.15, 1.0 * b.marketing_budget_multiplier)) AS marketing_factor,
+            GREATEST(1.0 - LEAST(cfg.risk_penalty_cap,
+                                 (cfg.competitive_weight * b.target_comp_index + cfg.price_war_weight * b.target_comp_index)
+                                 * (b.score_d / 5.0)), 0.6) AS competitor_factor
+        FROM base b CROSS JOIN cfg
+    ),
+    units AS (
+        SELECT
+            f.*,
+            CASE WHEN f.adj_list_price > 0 THEN f.gm_dollar_per_unit / f.adj_list_price ELSE 0.0 END AS gm_pct,
+            f.base_units * GREATEST(0.6, f.channel_weighted_score / 5.0) * f.risk_factor
+                * f.marketing_factor * f.adoption_factor * f.competitor_factor AS common_units
+        FROM factors f
+    ),
+    scenarios AS (
+        SELECT
+            u.*,
+            {_scenario_units("base")} AS adj_units_base,
+            {_scenario_units("best")} AS adj_units_best,
+            {_scenario_units("worst")} AS adj_units_worst
+        FROM units u CROSS JOIN cfg
+    ),
+    stock AS (
+        -- First order = MOQ, or enough to fill lead time + distributor/retail days of cover
+        SELECT
+            sc.*,
+            GREATEST(COALESCE(sc.moq, 0), sc.adj_units_base / 30.0 * (sc.lead_time + sc.doc_days)) AS initial_stock_units
+        FROM scenarios sc
+    ),
+    working_capital AS (
+        SELECT
+            st.*,
+            st.initial_stock_units * st.imported_cogs AS initial_stock_investment,
+            CASE WHEN st.adj_units_base > 0 THEN st.moq / st.adj_units_base END AS moq_coverage_base,
+            CASE WHEN st.adj_units_best > 0 THEN st.moq / st.adj_units_best END AS moq_coverage_best,
+            CASE WHEN st.adj_units_worst > 0 THEN st.moq / st.adj_units_worst END AS moq_coverage_worst,
+            CASE WHEN st.adj_units_worst > 0 THEN st.initial_stock_units / (st.adj_units_worst / 30.0) END AS days_of_cover
+        FROM stock st
+    ),
+    scored AS (
+        SELECT
+            w.*,
+            w.days_of_cover / (w.shelf_life * 30.0) AS expiry_risk,
+            w.gm_pct >= cfg.gm_floor_pct AS pass_gm_floor,
+            w.moq IS NULL OR NOT COALESCE(w.adj_units_worst > 0, FALSE)
+                OR w.moq_coverage_worst <= cfg.max_moq_coverage_months AS pass_moq_coverage,
+            w.shelf_life IS NULL OR NOT COALESCE(w.adj_units_worst > 0, FALSE)
+                OR w.days_of_cover / (w.shelf_life * 30.0) <= cfg.max_shelf_life_consumed_pct AS pass_expiry,
+            CASE WHEN w.hard_stop THEN 'Do Not Launch'
+                 WHEN w.pass_regulatory AND w.pass_supply_ready AND w.gm_pct >= cfg.gm_floor_pct
+                      AND (w.moq IS NULL OR NOT COALESCE(w.adj_units_worst > 0, FALSE)
+                           OR w.moq_coverage_worst <= cfg.max_moq_coverage_months)
+                      AND (w.shelf_life IS NULL OR NOT COALESCE(w.adj_units_worst > 0, FALSE)
+                           OR w.days_of_cover / (w.shelf_life * 30.0) <= cfg.max_shelf_life_consumed_pct)
+                      AND w.score_b >= cfg.launch_now_min_score AND w.score_d <= cfg.launch_now_max_risk THEN 'Launch Now'
+                 ELSE 'Phase Later' END AS final_recommendation
+        FROM working_capital w CROSS JOIN cfg
+    )"""
+
+SELECT_CACHE_ROWS = f"""
+    SELECT
+        sku_id, gm_dollar_per_unit, gm_pct,
+        adj_units_base * adj_list_price AS monthly_revenue,
+        adj_units_base * gm_dollar_per_unit AS monthly_gm_dollar,
+        score_b AS weighted_score_layer_b, score_c AS synergy_score_layer_c, score_d AS risk_score_layer_d,
+        risk_factor, channel_weighted_score,
+        pass_regulatory, pass_supply_ready, pass_gm_floor,
+        final_recommendation, final_recommendation = 'Launch Now' AS select_for_wave_1,
+        adj_units_base, adj_units_best, adj_units_worst,
+        adj_units_base * gm_dollar_per_unit AS monthly_gm_base,
+        adj_units_best * gm_dollar_per_unit AS monthly_gm_best,
+        adj_units_worst * gm_dollar_per_unit AS monthly_gm_worst,
+        initial_stock_investment, moq_coverage_base, moq_coverage_best, moq_coverage_worst,
+        days_of_cover, expiry_risk, pass_moq_coverage, pass_expiry
+    FROM scored
+    UNION ALL
+    -- SKUs without a market or channel get an all-NULL row, as calculate_sku returns for them
+    SELECT sku_id, {', '.join(['NULL'] * len(CACHE_COLUMNS))}
+    FROM sku_records
+    WHERE COALESCE(target_market, '') = '' OR COALESCE(primary_channel, '') = ''"""
+
+_cols = ", ".join(CACHE_COLUMNS)
+_old_cols = ", ".join(f"o.{c} AS old_{c}" for c in CACHE_COLUMNS)
+_STAMPED_COLUMNS = CACHE_COLUMNS + ["config_generation"]
+
+UPSERT_SCORED_SQL = f"""
+WITH {SCORING_CTES},
+    upserted AS (
+        -- Rows are also rewritten when only their config generation stamp is out of date
+        INSERT INTO sku_calculation_cache (sku_id, {_cols}, config_generation)
+        SELECT r.*, CAST(:generation AS INTEGER) FROM ({SELECT_CACHE_ROWS}) r
+        ON CONFLICT (sku_id) DO UPDATE SET
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in _STAMPED_COLUMNS)}
+        WHERE ({", ".join(f"sku_calculation_cache.{c}" for c in _STAMPED_COLUMNS)})
+              IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in _STAMPED_COLUMNS)})
+        RETURNING sku_id, {_cols}
+    )
+-- Every sub-statement shares one snapshot, so o.* still holds the pre-update values (and no other
+-- writer can have changed them since: score_in_database locks every SKU row first)
+SELECT u.*, s.target_market, s.primary_channel, s.category, o.sku_id AS old_sku_id, {_old_cols}
+FROM upserted u
+JOIN sku_records s ON s.sku_id = u.sku_id
+LEFT JOIN sku_calculation_cache o ON o.sku_id = u.sku_id
+"""
+
+async def score_in_database(db: AsyncSession, generation: int = 0) -> list:
+    """Scores and upserts every SKU in one statement, stamped with `generation`; returns the rows that changed, as dicts."""
+    # Cache writers lock the SKU row first. Taken in a statement of its own, so the upsert's snapshot
+    # starts after any writer this waited for had committed
+    await db.execute(text("SELECT COUNT(*) FROM (SELECT 1 FROM sku_records ORDER BY sku_id FOR UPDATE) locked"))
+    res = await db.execute(text(UPSERT_SCORED_SQL), {"generation": generation})
+    return [dict(r) for r in res.mappings().all()]
+
+async def recalculate_all_skus_sql(db: AsyncSession, generation: int, on_progress=None):
+    """recalculate_all_skus for RECALC_ENGINE=sql: same cache rows, rollups and change feed, no Python scoring loop."""
+    changed = await score_in_database(db, generation)
+
+    deltas = []
+    rollup_delta = RollupDelta()
+    for row in changed:
+        new = {c: row[c] for c in CACHE_COLUMNS}
+        old = {c: row[f"old_{c}"] for c in CACHE_COLUMNS} if row["old_sku_id"] is not None else None
+        fields = cache_delta(old, new)
+        if not fields and old is not None:
+            # Only restamped
+            continue
+        rollup_delta.remove(row, old)
+        rollup_delta.add(row, new)
+        deltas.append({"sku_id": row["sku_id"], "fields": fields})
+
+    await rollup_delta.apply(db)
+    if deltas:
+        # Only for the config fingerprint history rows are tagged with; no Python scoring happens
+        from app.services.recalculator import build_calc_engine
+        await record_history(db, deltas, await build_calc_engine(db))
+    await change_feed.publish(db, deltas)
+    await db.commit()
+    if on_progress:
+        total = (await db.execute(text("SELECT COUNT(*) FROM sku_records"))).scalar()
+        await on_progress(total)
@@ -0,0 +1,147 @@
+"""
+Parity harness for the set-based SQL engine.
+
+Each round replaces the portfolio and every config table with a randomized one (missing
+markets, unconfigured channels, partial category overrides, unset global settings, blank
+scores), scores it with both CalculationEngine.calculate_batch and score_in_database, and
+compares every cache column. All writes happen in one transaction that is rolled back, but
+it still locks the tables while it runs - point DATABASE_URL at a scratch database.
+
+    python -m app.services.sql_parity [--skus 2000] [--rounds 5] [--seed 1]
+"""
+import argparse
+import asyncio
+import math
+import random
+import sys
+
+from sqlalchemy import delete
+
+from app.core.database import AsyncSessionLocal
+from app.models.skus import SkuRecord, SkuCalculationCache
+from app.models.projections import SkuProjection
+from app.models.settings import GlobalSetting, ScoringFormula
+from app.models.multidimensional import MarketConfig, MarketChannelConfig, MarketCategoryConfig
+from app.core.calculator import SYNERGY_SCORE_FIELDS
+from app.services.recalculator import build_calc_engine
+from app.services.sql_engine import CACHE_COLUMNS, SETTING_DEFAULTS, score_in_database
+
+MARKETS = ["Nepal", "India", "UAE", "Sri Lanka"]
+CHANNELS = ["E-Com", "MT", "GT", "Rx", "Clinic"]
+CATEGORIES = ["Skincare", "Haircare", "Supplements", "Oral Care", ""]
+SCORE_FIELDS = [c.name for c in SkuRecord.__table__.columns if c.name.startswith("score_")]
+
+def _maybe(rng: random.Random, value, p_none: float = 0.2):
+    return None if rng.random() < p_none else value
+
+def _random_portfolio(rng: random.Random, n_skus: int) -> list:
+    """ORM objects for one randomized portfolio and config set."""
+    objs = []
+    # One market SKUs can target without having a market_config row
+    configured = MARKETS[:-1]
+    for market in configured:
+        objs.append(MarketConfig(
+            market_name=market,
+            import_freight_pct=rng.uniform(0, 0.2), duties_taxes_pct=rng.uniform(0, 0.3),
+            price_multiplier=rng.uniform(0.5, 2.0), doc_distributor=rng.uniform(0, 60), doc_retail=rng.uniform(0, 30),
+        ))
+        for channel in rng.sample(CHANNELS, rng.randint(2, len(CHANNELS))):
+            objs.append(MarketChannelConfig(
+                market_id=market, channel=channel,
+                commission_pct=rng.uniform(0, 0.15), fulfillment_pct=rng.uniform(0, 0.1),
+                cod_pct=rng.uniform(0, 0.05), returns_allowance_pct=rng.uniform(0, 0.05),
+                listing_fees_pct=rng.uniform(0, 0.05), trade_terms_pct=rng.uniform(0, 0.1),
+                rebates_pct=rng.uniform(0, 0.05), promo_accrual_pct=rng.uniform(0, 0.05),
+                retail_adoption_rate=_maybe(rng, rng.uniform(0.3, 1.2)),
+                marketing_lift=_maybe(rng, rng.uniform(0.7, 1.3)),
+                competitor_activity_idx=_maybe(rng, rng.uniform(0, 2)),
+                base_units_month=rng.uniform(0, 5000), channel_weight=rng.uniform(0.5, 1.5),
+            ))
+            for category in rng.sample(CATEGORIES[:-1] + ["Unknown"], 2):
+                objs.append(MarketCategoryConfig(
+                    market_id=market, channel=channel, category=category,
+                    adoption_rate_override=_maybe(rng, rng.uniform(0.3, 1.2), 0.5),
+                    marketing_lift_override=_maybe(rng, rng.uniform(0.7, 1.3), 0.5),
+                    competitor_idx_override=_maybe(rng, rng.uniform(0, 2), 0.5),
+                ))
+
+    # Roughly half the settings are left unset so the engine defaults are exercised too
+    for key, default in SETTING_DEFAULTS.items():
+        if key == "computed_synergy":
+            # An on/off switch: either side of its threshold
+            objs.append(GlobalSetting(setting_key=key, setting_value=float(rng.random() < 0.5)))
+        elif rng.random() < 0.5:
+            objs.append(GlobalSetting(setting_key=key, setting_value=default * rng.uniform(0.5, 1.5) + rng.uniform(-0.05, 0.05)))
+
+    for i in range(n_skus):
+        sku = SkuRecord(
+            sku_id=f"PARITY-{i:06d}", sku_name=f"Parity SKU {i}", category=rng.choice(CATEGORIES),
+            target_market=_maybe(rng, rng.choice(MARKETS), 0.05),
+            primary_channel=_maybe(rng, rng.choice(CHANNELS), 0.05),
+            regulatory_eligible=_maybe(rng, rng.random() < 0.9, 0.3),
+            regulatory_prohibition=_maybe(rng, rng.random() < 0.05, 0.3),
+            ip_risk_high=_maybe(rng, rng.random() < 0.05, 0.3),
+            supply_ready=_maybe(rng, rng.random() < 0.9, 0.3),
+            local_list_price=_maybe(rng, rng.uniform(0, 100), 0.05),
+            landed_cost=_maybe(rng, rng.uniform(0, 40), 0.05),
+            moq=_maybe(rng, rng.randint(0, 5000), 0.3),
+            lead_time_days=_maybe(rng, rng.randint(0, 120), 0.3),
+            shelf_life_months=_maybe(rng, rng.randint(0, 36), 0.3),
+        )
+        for field in SCORE_FIELDS + list(SYNERGY_SCORE_FIELDS.values()):
+            setattr(sku, field, _maybe(rng, rng.randint(1, 5), 0.1))
+        objs.append(sku)
+    return objs
+
+def _same(a, b) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None:
+            return False
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+async def run_round(n_skus: int, seed: int) -> list:
+    """Returns (sku_id, column, python value, sql value) for every disagreement."""
+    rng = random.Random(seed)
+    async with AsyncSessionLocal() as db:
+        try:
+            for model in (SkuProjection, SkuCalculationCache, SkuRecord, MarketCategoryConfig, MarketChannelConfig, MarketConfig, GlobalSetting, ScoringFormula):
+                await db.execute(delete(model))
+            objs = _random_portfolio(rng, n_skus)
+            db.add_all(objs)
+            await db.flush()
+
+            engine = await build_calc_engine(db)
+            skus = [o for o in objs if isinstance(o, SkuRecord)]
+            expected = {values["sku_id"]: values for values in engine.calculate_batch(skus)}
+
+            actual = {row["sku_id"]: row for row in await score_in_database(db)}
+        finally:
+            await db.rollback()
+
+    mismatches = []
+    for sku_id, exp in expected.items():
+        act = actual.get(sku_id)
+        if act is None:
+            mismatches.append((sku_id, "*", "row", None))
+            continue
+        mismatches.extend((sku_id, c, exp[c], act[c]) for c in CACHE_COLUMNS if not _same(exp[c], act[c]))
+    return mismatches
+
+async def _main(n_skus: int, rounds: int, seed: int) -> int:
+    failed = 0
+    for r in range(rounds):
+        mismatches = await run_round(n_skus, seed + r)
+        print(f"round {r + 1}/{rounds} (seed {seed + r}): {n_skus} SKUs, {len(mismatches)} mismatched values")
+        for m in mismatches[:20]:
+            print("  ", m)
+        failed += bool(mismatches)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare SQL-engine scores with CalculationEngine on random portfolios")
+    parser.add_argument("--skus", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.skus, args.rounds, args.seed)))
@@ -0,0 +1,155 @@
+"""
+Computed synergy: Layer C's price-ladder and channel-differentiation scores derived from the portfolio.
+
+A SKU's place in the range is a property of its (market, category) group rather than of the
+SKU alone: does it fill a gap in the price ladder, or crowd a price point (and a channel)
+other SKUs already cover? For every SKU with a market and a positive list price this module
+computes, within its group,
+  - the ladder gap: the log distance from its price to the nearest other price,
+  - the price-band density: how many other SKUs are priced within synergy_price_band_pct of it,
+  - the channel overlap: how many of those are sold in the same channel,
+and maps them to 1-5 scores (computed_price_ladder / computed_channel_diff on sku_records).
+All groups are handled at once by one sort and searchsorted probes, O(n log n).
+
+A group shares one market, so the market's price_multiplier scales all of its adjusted list
+prices alike and leaves the relative gaps unchanged; the signals only move when a SKU's price,
+market, category or channel does, or when a SKU joins or leaves the group. refresh_synergy()
+recomputes just the groups it is given and returns the SKUs whose scores moved, so edits
+rescore those neighbours too. With the computed_synergy setting on, the engine reads these in
+place of the hand-entered score_price_ladder / score_channel_diff (which remain the fallback
+for SKUs without a computed score). The scores describe each SKU's current placement, so the
+placement matrix reuses them for other markets/channels.
+"""
+from typing import Iterable, List, Sequence
+
+import numpy as np
+from sqlalchemy import and_, bindparam, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import CalculationEngine, SETTING_DEFAULTS
+from app.models.skus import SkuRecord
+
+# SKU fields the signals are computed from; a change to any of them moves its groups
+SYNERGY_INPUT_FIELDS = ("target_market", "category", "primary_channel", "local_list_price")
+# Beyond this many affected groups one full pass is cheaper than per-group filters
+MAX_FILTERED_GROUPS = 200
+
+def _codes(*keys: Sequence) -> np.ndarray:
+    """Dense integer code per distinct tuple of keys."""
+    index = {}
+    return np.array([index.setdefault(k, len(index)) for k in zip(*keys)], dtype=np.int64).reshape(-1)
+
+def _band_counts(codes: np.ndarray, log_price: np.ndarray, band: float) -> np.ndarray:
+    """Per row, how many rows of the same code have a log price within `band` of its own (itself included)."""
+    # Groups laid end to end on one axis, far enough apart that a band never reaches into the next one
+    span = float(log_price.max() - log_price.min()) + 2 * band + 1.0
+    key = codes * span + (log_price - log_price.min())
+    ordered = np.sort(key)
+    return np.searchsorted(ordered, key + band, side="right") - np.searchsorted(ordered, key - band, side="left")
+
+def synergy_signals(markets: Sequence, categories: Sequence, channels: Sequence, prices: Sequence,
+                    band_pct: float = SETTING_DEFAULTS["synergy_price_band_pct"]) -> dict:
+    """
+    Ladder gap, band density, channel overlap and the two 1-5 scores per SKU, as arrays.
+    SKUs without a market or a positive price are left out of every group and get no scores
+    (valid False); SKUs without a channel get no channel_diff score.
+    """
+    n = len(prices)
+    price = np.array([p if p is not None else np.nan for p in prices], dtype=float)
+    valid = np.array([bool(m) for m in markets], dtype=bool) & (price > 0)
+    out = {
+        "valid": valid,
+        "ladder_gap": np.full(n, np.nan),
+        "band_density": np.zeros(n, dtype=np.int64),
+        "channel_overlap": np.zeros(n, dtype=np.int64),
+        "price_ladder": np.zeros(n, dtype=np.int64),
+        "channel_diff": np.zeros(n, dtype=np.int64),
+    }
+    if not valid.any():
+        return out
+    rows = np.flatnonzero(valid)
+    log_price = np.log(price[rows])
+    band = float(np.log1p(max(band_pct, 0.0)))
+    group = _codes([markets[i] for i in rows], [categories[i] or "" for i in rows])
+
+    # Nearest other price in the group: neighbours in (group, price) order
+    order = np.lexsort((log_price, group))
+    sorted_price, sorted_group = log_price[order], group[order]
+    step = np.diff(sorted_price)
+    same = sorted_group[1:] == sorted_group[:-1]
+    below = np.concatenate(([np.inf], np.where(same, step, np.inf)))
+    above = np.concatenate((np.where(same, step, np.inf), [np.inf]))
+    gap = np.empty(len(rows))
+    gap[order] = np.minimum(below, above)
+
+    density = _band_counts(group, log_price, band) - 1
+    channel = np.array([bool(channels[i]) for i in rows], dtype=bool)
+    overlap = _band_counts(_codes(group, [channels[i] or "" for i in rows]), log_price, band) - 1
+
+    # Alone in its band: 5 when the nearest price is at least two bands away (a real gap in the ladder),
+    # else 4; one point less per SKU crowding the band, down to 1
+    price_ladder = np.where(density == 0, np.where(gap >= 2 * band, 5, 4), np.clip(4 - density, 1, 3))
+    # 5 when no same-channel SKU shares the band, one point less per SKU that does
+    channel_diff = np.where(channel, np.clip(5 - overlap, 1, 5), 0)
+
+    out["ladder_gap"][rows] = gap
+    out["band_density"][rows] = density
+    out["channel_overlap"][rows] = np.where(channel, overlap, 0)
+    out["price_ladder"][rows] = price_ladder
+    out["channel_diff"][rows] = channel_diff
+    return out
+
+def moved_groups(before: Iterable[dict], after: Iterable[dict]) -> set:
+    """
+    (market, category) groups whose membership or prices differ between two sets of SKU rows,
+    e.g. load_sku_rows() before and after an edit. SKUs only in `after` count as new.
+    """
+    previous = {row["sku_id"]: row for row in before}
+    groups = set()
+    for row in after:
+        old = previous.get(row["sku_id"])
+        if old is not None and all(old[f] == row[f] for f in SYNERGY_INPUT_FIELDS):
+            continue
+        if old is not None:
+            groups.add((old["target_market"], old["category"]))
+        groups.add((row["target_market"], row["category"]))
+    return groups
+
+async def refresh_synergy(db: AsyncSession, engine: CalculationEngine, groups: Iterable[tuple] = None) -> List[str]:
+    """
+    Recomputes the computed scores of every SKU in `groups` ((market, category) pairs; all
+    SKUs when None) and writes those that changed. Returns their sku_ids. Does not commit.
+    """
+    band_pct = engine.settings.get("synergy_price_band_pct", SETTING_DEFAULTS["synergy_price_band_pct"])
+    query = select(SkuRecord.sku_id, *[getattr(SkuRecord, f) for f in SYNERGY_INPUT_FIELDS],
+                   SkuRecord.computed_price_ladder, SkuRecord.computed_channel_diff)
+    if groups is not None:
+        groups = {(m, c) for m, c in groups if m}
+        if not groups:
+            return []
+        if len(groups) <= MAX_FILTERED_GROUPS:
+            query = query.where(or_(*[and_(SkuRecord.target_market == m, SkuRecord.category == c) for m, c in groups]))
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return []
+
+    sku_ids, markets, categories, channels, prices, old_ladder, old_diff = zip(*rows)
+    signals = synergy_signals(markets, categories, channels, prices, band_pct)
+    valid, channel = signals["valid"], np.array([bool(c) for c in channels], dtype=bool)
+    price_ladder = [int(v) if ok else None for v, ok in zip(signals["price_ladder"], valid)]
+    channel_diff = [int(v) if ok else None for v, ok in zip(signals["channel_diff"], valid & channel)]
+
+    changes = [
+        {"b_sku_id": sku_id, "b_ladder": ladder, "b_diff": diff}
+        for sku_id, ladder, diff, old_l, old_d in zip(sku_ids, price_ladder, channel_diff, old_ladder, old_diff)
+        if ladder != old_l or diff != old_d
+    ]
+    if changes:
+        table = SkuRecord.__table__
+        await db.execute(
+            update(table).where(table.c.sku_id == bindparam("b_sku_id"))
+            .values(computed_price_ladder=bindparam("b_ladder"), computed_channel_diff=bindparam("b_diff")),
+            changes,
+        )
+    return [c["b_sku_id"] for c in changes]
@@ -0,0 +1,152 @@
+"""
+Live Launch Now counts for the threshold settings.
+
+Under the default launch_now formula a cached SKU is Launch Now when it passes every gate
+that does not depend on the three threshold settings (regulatory, supply, MOQ coverage,
+expiry, not Do Not Launch) and
+    weighted_score_layer_b >= launch_now_min_score
+    risk_score_layer_d     <= launch_now_max_risk
+    gm_pct                 >= gm_floor_pct
+so "how many SKUs would launch at these thresholds" needs no rescoring. ThresholdIndex keeps,
+per market/channel, the three metrics of those eligible SKUs, and for each metric its values
+sorted among the SKUs that pass the other two thresholds at their current settings. Moving
+one slider away from the settings is then one binary search per market/channel; moving
+several at once is a vectorized pass over the group's columns.
+
+Each API worker holds its own index, built from the cache on first use and rebuilt after
+the change feed reports cache changes (or after INDEX_MAX_AGE_SECONDS, which also covers
+SKUs moved between markets without a cache change).
+"""
+import asyncio
+import time
+from typing import Dict
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.calculator import SETTING_DEFAULTS
+from app.models.settings import GlobalSetting, ScoringFormula
+from app.models.skus import SkuRecord, SkuCalculationCache
+from app.services.change_feed import change_feed
+
+# Threshold setting -> the cached metric it is compared with
+THRESHOLD_METRICS = {
+    "launch_now_min_score": "weighted_score_layer_b",
+    "launch_now_max_risk": "risk_score_layer_d",
+    "gm_floor_pct": "gm_pct",
+}
+INDEX_MAX_AGE_SECONDS = 60.0
+
+class CustomLaunchFormula(Exception):
+    """Launch Now is decided by a custom formula, so the thresholds alone do not determine it."""
+
+def _passes(setting: str, values: np.ndarray, threshold: float) -> np.ndarray:
+    return values <= threshold if setting == "launch_now_max_risk" else values >= threshold
+
+def _count(setting: str, ordered: np.ndarray, threshold: float) -> int:
+    """How many of the sorted `ordered` pass `threshold`, by binary search."""
+    if setting == "launch_now_max_risk":
+        return int(np.searchsorted(ordered, threshold, side="right"))
+    return int(len(ordered) - np.searchsorted(ordered, threshold, side="left"))
+
+class _Group:
+    """One market/channel: metrics of its eligible SKUs, and the sorted conditionals for the current settings."""
+
+    def __init__(self, skus: int, metrics: Dict[str, np.ndarray]):
+        self.skus = skus
+        self.metrics = metrics
+        self.eligible = len(next(iter(metrics.values())))
+        self.sorted = {}
+        self.launch_now = 0
+
+    def anchor(self, settings: Dict[str, float]):
+        passing = {s: _passes(s, self.metrics[s], settings[s]) for s in THRESHOLD_METRICS}
+        self.launch_now = int(np.logical_and.reduce(list(passing.values())).sum())
+        for setting in THRESHOLD_METRICS:
+            others = np.logical_and.reduce([p for s, p in passing.items() if s != setting])
+            self.sorted[setting] = np.sort(self.metrics[setting][others])
+
+    def count(self, settings: Dict[str, float], thresholds: Dict[str, float]) -> int:
+        moved = [s for s in THRESHOLD_METRICS if thresholds[s] != settings[s]]
+        if not moved:
+            return self.launch_now
+        if len(moved) == 1:
+            return _count(moved[0], self.sorted[moved[0]], thresholds[moved[0]])
+        return int(np.logical_and.reduce([_passes(s, self.metrics[s], thresholds[s]) for s in THRESHOLD_METRICS]).sum())
+
+class ThresholdIndex:
+    def __init__(self):
+        self._groups = None
+        self._settings = None
+        self._built_at = 0.0
+        self._changes = None
+        self._lock = asyncio.Lock()
+
+    async def _current_settings(self, db: AsyncSession) -> Dict[str, float]:
+        res = await db.execute(select(GlobalSetting).where(GlobalSetting.setting_key.in_(list(THRESHOLD_METRICS))))
+        stored = {s.setting_key: s.setting_value for s in res.scalars().all()}
+        return {k: stored.get(k, SETTING_DEFAULTS[k]) for k in THRESHOLD_METRICS}
+
+    async def _load(self, db: AsyncSession) -> dict:
+        cache = SkuCalculationCache
+        res = await db.execute(
+            select(SkuRecord.target_market, SkuRecord.primary_channel, cache.final_recommendation,
+                   cache.pass_regulatory, cache.pass_supply_ready, cache.pass_moq_coverage, cache.pass_expiry,
+                   *[getattr(cache, m) for m in THRESHOLD_METRICS.values()])
+            .join(cache, cache.sku_id == SkuRecord.sku_id)
+            .where(cache.final_recommendation.isnot(None))
+        )
+        rows = {}
+        for market, channel, recommendation, *gates_and_metrics in res.all():
+            group = rows.setdefault((market, channel), [0, []])
+            group[0] += 1
+            gates, metrics = gates_and_metrics[:4], gates_and_metrics[4:]
+            if recommendation != "Do Not Launch" and all(gates):
+                group[1].append(metrics)
+        groups = {}
+        for key, (skus, eligible) in rows.items():
+            values = np.array([[np.nan if v is None else v for v in m] for m in eligible], dtype=float).reshape(-1, len(THRESHOLD_METRICS))
+            groups[key] = _Group(skus, {s: values[:, j] for j, s in enumerate(THRESHOLD_METRICS)})
+        return groups
+
+    def _changed(self) -> bool:
+        if self._changes is None:
+            self._changes = change_feed.subscribe()
+            return True
+        changed = not self._changes.empty()
+        while not self._changes.empty():
+            self._changes.get_nowait()
+        return changed
+
+    async def counts(self, db: AsyncSession, thresholds: Dict[str, float] = None) -> dict:
+        """
+        Launch Now counts at `thresholds` (missing ones at their current settings), overall and per
+        market/channel, from the cached metrics. Raises CustomLaunchFormula when they do not decide it.
+        """
+        if (await db.execute(select(ScoringFormula.formula_key).where(ScoringFormula.formula_key == "launch_now"))).first():
+            raise CustomLaunchFormula()
+        settings = await self._current_settings(db)
+        async with self._lock:
+            if self._changed() or self._groups is None or time.monotonic() - self._built_at > INDEX_MAX_AGE_SECONDS:
+                self._groups, self._settings = await self._load(db), None
+                self._built_at = time.monotonic()
+            if settings != self._settings:
+                for group in self._groups.values():
+                    group.anchor(settings)
+                self._settings = settings
+        thresholds = {**settings, **{k: v for k, v in (thresholds or {}).items() if v is not None}}
+        groups = [
+            {"market": market, "channel": channel, "skus": g.skus, "eligible": g.eligible,
+             "launch_now": g.count(settings, thresholds)}
+            for (market, channel), g in sorted(self._groups.items(), key=lambda kv: (kv[0][0] or "", kv[0][1] or ""))
+        ]
+        return {
+            "thresholds": thresholds,
+            "skus": sum(g["skus"] for g in groups),
+            "eligible": sum(g["eligible"] for g in groups),
+            "launch_now": sum(g["launch_now"] for g in groups),
+            "groups": groups,
+        }
+
+threshold_index = ThresholdIndex()
@@ -0,0 +1,217 @@
+"""
+Upload sessions: an import is uploaded once and its workbook decoded once.
+
+POST /upload/headers spools the file to UPLOAD_SPOOL_DIR, decodes only the top rows of the
+SKU sheet to find its header, and returns a session id. The full workbook is then decoded in
+the background while the user maps columns; the decoded sheets (pandas frames, i.e. columnar)
+are kept on the session and cached as parquet next to the staged file, so POST /upload/ with
+the session id reuses them - from any worker on the same host - instead of receiving and
+parsing the file again. Sessions are removed after a successful import, on cancel, or after
+UPLOAD_SESSION_TTL_SECONDS.
+
+The spool directory must belong to this process's user and not be writable by anyone else,
+since its files are read back as trusted input.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import secrets
+import shutil
+import stat
+import tempfile
+import time
+
+import pandas as pd
+
+SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "sku_uploads")
+SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", "3600"))
+SPOOL_CHUNK_BYTES = 1 << 20
+# Decoded-sheet cache files: <id>.sheet-<n>.parquet per config sheet, then <id>.sku.parquet last
+SKU_CACHE_SUFFIX = ".sku.parquet"
+
+logger = logging.getLogger(__name__)
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{32}$")
+
+class UploadSession:
+    """A staged workbook and what is known about it. Only touched from the event loop thread."""
+
+    def __init__(self, session_id: str, filename: str, info: dict):
+        self.session_id = session_id
+        self.filename = filename
+        self.info = info
+        self._workbook = None
+        self._decoding = None
+
+    @property
+    def path(self) -> str:
+        return _path(self.session_id, os.path.splitext(self.filename)[1].lower() or ".xlsx")
+
+    def to_dict(self) -> dict:
+        return {"session_id": self.session_id, "filename": self.filename, **self.info}
+
+    def _decode(self) -> tuple:
+        """Blocking: the decoded workbook from the parquet cache, else from the staged file (then cached)."""
+        if os.path.exists(_path(self.session_id, SKU_CACHE_SUFFIX)):
+            meta = _read_meta(self.session_id)
+            sheets = {
+                name: pd.read_parquet(_path(self.session_id, f".sheet-{n}.parquet"))
+                for n, name in enumerate(meta.get("cached_sheets", []))
+            }
+            return sheets, pd.read_parquet(_path(self.session_id, SKU_CACHE_SUFFIX))
+        from app.services.excel_parser import read_workbook
+        workbook = read_workbook(self.path, self.info["sku_sheet"], self.info["header_row"])
+        if not os.path.exists(_path(self.session_id, ".json")):
+            # Closed while decoding
+            return workbook
+        try:
+            self._write_cache(*workbook)
+        except Exception as e:
+            # e.g. a column mixing text and numbers, which parquet cannot hold as-is, or the session
+            # was closed meanwhile: the cache is only a shortcut, so decode again when needed
+            logger.info("Not caching decoded upload %s: %s", self.session_id, e)
+        return workbook
+
+    def _write_cache(self, sheets: dict, sku_df: pd.DataFrame):
+        # Each file is written under a temporary name, and the SKU frame last: once it exists the
+        # whole cache does, so another worker never reads a partial one
+        meta = _read_meta(self.session_id)
+        meta["cached_sheets"] = list(sheets)
+        frames = [(f".sheet-{n}.parquet", df) for n, df in enumerate(sheets.values())]
+        frames.append((SKU_CACHE_SUFFIX, sku_df))
+        tmp = f".{os.getpid()}.tmp"
+        written = []
+        try:
+            for suffix, df in frames:
+                path = _path(self.session_id, suffix)
+                written.append(path)
+                df.to_parquet(path + tmp)
+            _write_meta(self.session_id, meta)
+            for path in written:
+                os.replace(path + tmp, path)
+        except BaseException:
+            for path in written:
+                if os.path.exists(path + tmp):
+                    os.remove(path + tmp)
+            raise
+
+    def prefetch(self):
+        """Starts decoding the full workbook in a worker thread, unless it is decoded or decoding."""
+        if self._workbook is None and self._decoding is None:
+            self._decoding = asyncio.ensure_future(asyncio.to_thread(self._decode))
+
+    async def workbook(self) -> tuple:
+        """(config sheets, SKU DataFrame), decoding the staged file at most once."""
+        if self._workbook is None:
+            self.prefetch()
+            try:
+                self._workbook = await self._decoding
+            finally:
+                # A failed decode can be retried by the next import attempt
+                self._decoding = None
+        return self._workbook
+
+    def close(self):
+        _sessions.pop(self.session_id, None)
+        _remove_files(self.session_id)
+
+# Sessions this worker created or resumed; others are found through their metadata file
+_sessions = {}
+
+def _path(session_id: str, suffix: str) -> str:
+    return os.path.join(SPOOL_DIR, session_id + suffix)
+
+def _check_spool_dir(create: bool = False) -> bool:
+    """
+    Whether the spool directory exists (creating it with mode 0700 if `create`). Raises
+    PermissionError if it is a symlink, belongs to another user or is group/world-writable:
+    whoever else can write there could plant the files that imports read back.
+    """
+    if create:
+        os.makedirs(SPOOL_DIR, mode=0o700, exist_ok=True)
+    try:
+        st = os.lstat(SPOOL_DIR)
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(
+            f"Upload spool directory {SPOOL_DIR} must be a directory owned by this user and not writable "
+            "by group or others (set UPLOAD_SPOOL_DIR to a private directory)"
+        )
+    return True
+
+def _read_meta(session_id: str) -> dict:
+    with open(_path(session_id, ".json")) as f:
+        return json.load(f)
+
+def _write_meta(session_id: str, meta: dict):
+    path = _path(session_id, ".json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+def _remove_files(session_id: str):
+    for name in os.listdir(SPOOL_DIR):
+        if name.startswith(session_id + "."):
+            try:
+                os.remove(os.path.join(SPOOL_DIR, name))
+            except FileNotFoundError:
+                pass
+
+def _evict_expired():
+    # Sessions closed by another worker still pin their decoded workbook here
+    for session_id in [s for s in _sessions if not os.path.exists(_path(s, ".json"))]:
+        del _sessions[session_id]
+    if not _check_spool_dir():
+        return
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    for name in os.listdir(SPOOL_DIR):
+        # A session's age is that of its metadata file; stray files (e.g. a cache written after
+        # its session was removed) go once they are old enough themselves
+        session_id = name.split(".", 1)[0]
+        meta = _path(session_id, ".json")
+        try:
+            expired = os.path.getmtime(meta if os.path.exists(meta) else os.path.join(SPOOL_DIR, name)) < cutoff
+        except FileNotFoundError:
+            continue
+        if expired:
+            _sessions.pop(session_id, None)
+            _remove_files(session_id)
+
+def _spool(source, path: str):
+    with open(path, "wb") as out:
+        shutil.copyfileobj(source, out, SPOOL_CHUNK_BYTES)
+
+async def create_session(file) -> UploadSession:
+    """Stages an UploadFile, reads its SKU sheet header and starts decoding the rest in the background."""
+    _check_spool_dir(create=True)
+    _evict_expired()
+    session = UploadSession(secrets.token_urlsafe(24), os.path.basename(file.filename or "upload.xlsx"), {})
+    try:
+        await asyncio.to_thread(_spool, file.file, session.path)
+        from app.services.excel_parser import inspect_workbook
+        session.info = await asyncio.to_thread(inspect_workbook, session.path)
+        _write_meta(session.session_id, {"filename": session.filename, "info": session.info})
+    except Exception:
+        _remove_files(session.session_id)
+        raise
+    _sessions[session.session_id] = session
+    session.prefetch()
+    return session
+
+def get_session(session_id: str) -> UploadSession:
+    """The session with this id, or None if it is unknown or has expired."""
+    _evict_expired()
+    if not session_id or not _SESSION_ID.match(session_id):
+        return None
+    session = _sessions.get(session_id)
+    if session is None:
+        try:
+            meta = _read_meta(session_id)
+        except FileNotFoundError:
+            return None
+        session = _sessions[session_id] = UploadSession(session_id, meta["filename"], meta["info"])
+    return session
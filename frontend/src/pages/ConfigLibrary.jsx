@@ -19,6 +19,9 @@ const ConfigLibrary = () => {
     const [selectedMarket, setSelectedMarket] = useState('');
     const [selectedChannel, setSelectedChannel] = useState('');
 
+    // Launch Now count at the (unsaved) threshold settings, refreshed as they move
+    const [launchCounts, setLaunchCounts] = useState(null);
+
     useEffect(() => {
         fetchData();
     }, []);
@@ -48,6 +51,20 @@ const ConfigLibrary = () => {
         }
     };
 
+    const { launch_now_min_score, launch_now_max_risk, gm_floor_pct } = settings;
+    useEffect(() => {
+        if (loading) return;
+        // Only the latest thresholds matter; drop responses for positions already dragged past
+        const controller = new AbortController();
+        api.get('/skus/launch-thresholds', {
+            params: { launch_now_min_score, launch_now_max_risk, gm_floor_pct },
+            signal: controller.signal,
+        })
+            .then(res => setLaunchCounts(res.data))
+            .catch(() => { if (!controller.signal.aborted) setLaunchCounts(null); });
+        return () => controller.abort();
+    }, [loading, launch_now_min_score, launch_now_max_risk, gm_floor_pct]);
+
     const fetchMarketChannels = async (marketName) => {
         try {
             const res = await api.get(`/markets/${marketName}/channels`);
@@ -154,6 +171,13 @@ const ConfigLibrary = () => {
 
     const formatLabel = (key) => key.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase());
 
+    // Slider ranges for the Launch Now thresholds
+    const thresholdRanges = {
+        launch_now_min_score: { min: 1, max: 5, step: 0.05 },
+        launch_now_max_risk: { min: 1, max: 5, step: 0.05 },
+        gm_floor_pct: { min: 0, max: 1, step: 0.01 },
+    };
+
     if (loading) return <div style={{ padding: '2rem' }}>Loading Configuration...</div>;
 
     return (
@@ -232,6 +256,12 @@ const ConfigLibrary = () => {
                                 groupedSettings[category] && groupedSettings[category].length > 0 && (
                                     <div key={category}>
                                         <h4 style={{ marginBottom: '1rem', paddingBottom: '0.5rem', borderBottom: '1px solid var(--border)', color: 'var(--text)' }}>{category}</h4>
+                                        {category === 'Financials & Pass Thresholds' && launchCounts && (
+                                            <p style={{ marginTop: 0, marginBottom: '1rem', color: 'var(--text-muted)' }}>
+                                                At these thresholds <strong style={{ color: 'var(--primary)' }}>{launchCounts.launch_now}</strong> of {launchCounts.skus} SKUs
+                                                would be Launch Now ({launchCounts.eligible} pass the other gates).
+                                            </p>
+                                        )}
                                         <div style={{ display: 'grid', gridTemplateColumns: 'repeat(auto-fill, minmax(280px, 1fr))', gap: '1.5rem' }}>
                                             {groupedSettings[category].map(({ key, val }) => (
                                                 <div key={key} className="form-group" style={{ marginBottom: 0 }}>
@@ -240,6 +270,12 @@ const ConfigLibrary = () => {
                                                         type="number" step="0.01" className="form-input" value={val}
                                                         onChange={(e) => handleSettingChange(key, e.target.value)}
                                                     />
+                                                    {thresholdRanges[key] && (
+                                                        <input
+                                                            type="range" {...thresholdRanges[key]} value={val} style={{ width: '100%', marginTop: '0.5rem' }}
+                                                            onChange={(e) => handleSettingChange(key, e.target.value)}
+                                                        />
+                                                    )}
                                                 </div>
                                             ))}
                                         </div>
@@ -1,6 +1,6 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { UploadCloud, CheckCircle2, AlertCircle, X, ArrowRight, Save } from 'lucide-react';
-import api from '../services/api';
+import api, { streamEvents } from '../services/api';
 
 const expectedColumns = [
     { key: 'SKU ID', label: 'SKU ID', required: true },
@@ -44,9 +44,12 @@ const ImportHub = () => {
     const [dragging, setDragging] = useState(false);
     const [uploading, setUploading] = useState(false);
     const [status, setStatus] = useState({ type: '', message: '' });
+    const [progress, setProgress] = useState(null);
 
     // Mapping state
     const [excelHeaders, setExcelHeaders] = useState([]);
+    // The server keeps the file staged (and decodes it) under this id while columns are mapped
+    const [sessionId, setSessionId] = useState(null);
     const [mapping, setMapping] = useState({});
 
     // Default Context
@@ -102,6 +105,7 @@ const ImportHub = () => {
             const res = await api.post('/upload/headers', formData);
             const headers = res.data.headers;
             setExcelHeaders(headers);
+            setSessionId(res.data.session_id);
 
             // Auto-map based on exact/fuzzy matching
             const autoMap = {};
@@ -154,21 +158,42 @@ const ImportHub = () => {
         setUploading(true);
         setStatus({ type: 'info', message: 'Importing data and calculating scores...' });
 
-        const formData = new FormData();
-        formData.append('file', file);
-        formData.append('mapping', JSON.stringify(mapping));
-        if (selectedMarket) {
-            formData.append('default_market', selectedMarket);
-        }
+        const jobId = crypto.randomUUID();
+        const buildForm = (useSession) => {
+            const formData = new FormData();
+            if (useSession) {
+                formData.append('session_id', sessionId);
+            } else {
+                formData.append('file', file);
+            }
+            formData.append('mapping', JSON.stringify(mapping));
+            formData.append('job_id', jobId);
+            if (selectedMarket) {
+                formData.append('default_market', selectedMarket);
+            }
+            return formData;
+        };
+
+        // Live progress from the server while the import request is running
+        const progressAbort = new AbortController();
+        streamEvents(`/upload/progress/${jobId}`, setProgress, progressAbort.signal).catch(() => {});
 
         try {
-            const res = await api.post('/upload/', formData);
+            let res;
+            try {
+                res = await api.post('/upload/', buildForm(Boolean(sessionId)));
+            } catch (error) {
+                // The staged upload expired: send the file itself
+                if (!sessionId || error.response?.status !== 404) throw error;
+                res = await api.post('/upload/', buildForm(false));
+            }
             setStatus({
                 type: 'success',
                 message: `File imported successfully! Processed ${res.data.stats.skus} SKUs.`
             });
             setStep(1);
             setFile(null);
+            setSessionId(null);
         } catch (error) {
             console.error("Upload error", error);
             setStatus({
@@ -176,11 +201,25 @@ const ImportHub = () => {
                 message: error.response?.data?.detail || 'An error occurred during file upload.'
             });
         } finally {
+            progressAbort.abort();
+            setProgress(null);
             setUploading(false);
         }
     };
 
+    const progressPercent = () => {
+        if (!progress || !progress.rows_total) return 0;
+        // Upsert and scoring each account for half of the bar
+        const upserted = progress.rows_upserted / progress.rows_total;
+        const scored = progress.rows_to_score ? progress.rows_scored / progress.rows_to_score : 0;
+        return Math.min(100, Math.round(50 * (upserted + scored)));
+    };
+
     const cancelImport = () => {
+        if (sessionId) {
+            api.delete(`/upload/sessions/${sessionId}`).catch(() => {});
+            setSessionId(null);
+        }
         setFile(null);
         setStep(1);
         setStatus({ type: '', message: '' });
@@ -274,6 +313,20 @@ const ImportHub = () => {
                         </div>
                     </div>
 
+                    {uploading && progress && (
+                        <div style={{ marginBottom: '1.5rem' }}>
+                            <div style={{ display: 'flex', justifyContent: 'space-between', fontSize: '0.85rem', color: 'var(--text-muted)', marginBottom: '0.25rem' }}>
+                                <span style={{ textTransform: 'capitalize' }}>{progress.stage}</span>
+                                <span>
+                                    {progress.rows_parsed} parsed · {progress.rows_upserted} upserted · {progress.rows_scored} scored
+                                </span>
+                            </div>
+                            <div style={{ height: '8px', backgroundColor: 'var(--border)', borderRadius: '4px', overflow: 'hidden' }}>
+                                <div style={{ width: `${progressPercent()}%`, height: '100%', backgroundColor: 'var(--primary)', transition: 'width 0.3s ease' }} />
+                            </div>
+                        </div>
+                    )}
+
                     <div style={{ display: 'grid', gridTemplateColumns: 'minmax(0, 1fr) minmax(0, 1fr)', gap: '2rem' }}>
                         <div style={{ borderRight: '1px solid var(--border)', paddingRight: '2rem' }}>
                             <h5 style={{ marginBottom: '1rem', borderBottom: '1px solid var(--border)', paddingBottom: '0.5rem' }}>
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Search, Filter, Eye, Edit2, Save, X, Download, TrendingUp, LayoutList, Trash2 } from 'lucide-react';
-import api from '../services/api';
+import api, { streamEvents } from '../services/api';
 
 const SkuPortfolio = () => {
     const [skus, setSkus] = useState([]);
@@ -40,6 +40,28 @@ const SkuPortfolio = () => {
         fetchMarkets();
     }, []);
 
+    // Patch rows in place from the server's change feed instead of re-fetching the list
+    useEffect(() => {
+        const controller = new AbortController();
+        streamEvents('/skus/changes', (message) => {
+            if (message.resync) {
+                fetchSkus();
+                return;
+            }
+            const deltas = message.deltas || [];
+            const deleted = new Set(deltas.filter(d => d.deleted).map(d => d.sku_id));
+            const changed = new Map(deltas.filter(d => d.fields || d.record).map(d => [d.sku_id, d]));
+            setSkus(prev => prev
+                .filter(s => !deleted.has(s.sku_id))
+                .map(s => {
+                    const delta = changed.get(s.sku_id);
+                    return delta ? { ...s, ...(delta.record || {}), cache: { ...(s.cache || {}), ...(delta.fields || {}) } } : s;
+                })
+            );
+        }, controller.signal).catch(() => {});
+        return () => controller.abort();
+    }, []);
+
     const fetchMarkets = async () => {
         try {
             const res = await api.get('/markets/');
@@ -32,4 +32,30 @@ api.interceptors.response.use(
   }
 );
 
+// Server-Sent Events over fetch (EventSource cannot send the Authorization header).
+// Calls onEvent with each parsed `data:` payload until the stream ends or signal aborts.
+export const streamEvents = async (path, onEvent, signal) => {
+  const token = localStorage.getItem('token');
+  const res = await fetch(`${api.defaults.baseURL}${path}`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+    signal,
+  });
+  if (!res.ok || !res.body) return;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const frames = buffer.split('\n\n');
+    buffer = frames.pop();
+    frames.forEach(frame => {
+      const data = frame.split('\n').filter(l => l.startsWith('data:')).map(l => l.slice(5).trim()).join('\n');
+      if (data) onEvent(JSON.parse(data));
+    });
+  }
+};
+
 export default api;